@@ -0,0 +1,52 @@
+"""
+gunicorn settings read from the working directory. Only hooks: the ones
+Prometheus' multiprocess mode needs (see strings_api.metrics), and starting
+the AI job worker (`manage.py run_jobs`) next to the web workers, so queued
+jobs run wherever the app is deployed. Set RUN_AI_JOBS=0 when the worker runs
+as its own service. Everything else is set on the command line.
+"""
+import glob
+import os
+import signal
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Seconds running AI jobs get to finish when gunicorn shuts down
+JOB_WORKER_SHUTDOWN_TIMEOUT = 30
+
+job_worker = None
+
+
+def on_starting(server):
+    # Metric files left by a previous run would be added to this one's
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def when_ready(server):
+    global job_worker
+    if os.environ.get('RUN_AI_JOBS', '1') == '1':
+        job_worker = subprocess.Popen([sys.executable, 'manage.py', 'run_jobs'], cwd=BACKEND_DIR)
+        server.log.info(f'Started AI job worker (pid {job_worker.pid})')
+
+
+def on_exit(server):
+    if job_worker is None or job_worker.poll() is not None:
+        return
+    # run_jobs lets running jobs finish on SIGINT; jobs cut off later are failed as lost
+    job_worker.send_signal(signal.SIGINT)
+    try:
+        job_worker.wait(JOB_WORKER_SHUTDOWN_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        job_worker.kill()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,303 @@
+"""
+OpenAI-backed tasks. They run in job workers (see strings_api.jobs), not in
+requests: each takes the job's user and input and returns the job's result,
+or raises AIError with a message fit to show the user.
+
+Results are cached in the 'ai_results' cache by a digest of everything the
+prompt is built from (the image bytes, or the analyzed strings' ids and
+updated_at) and the model, so asking again for the same thing returns the
+stored result without calling the model. cached_result() looks a job's
+result up before it is queued.
+"""
+import base64
+import binascii
+import hashlib
+import time
+from datetime import datetime
+from django.core.cache import caches
+from django.utils import timezone
+from .metrics import OPENAI_ERRORS, OPENAI_LATENCY, cache_lookup
+from .models import String, UserProfile
+from .openai_clients import client_for
+
+NOT_CONFIGURED = 'OpenAI not configured. Please add your API key in Settings > AI Features.'
+NO_PUBLISHED_STRINGS = 'No published strings found in your registry. Publish some strings first to generate a style guide.'
+# Strings sent to the model for a style guide, to stay within token limits
+STYLE_GUIDE_STRING_LIMIT = 50
+EXTRACT_TEXT_MODEL = 'gpt-4o-mini'
+STYLE_GUIDE_MODEL = 'gpt-4o-mini'
+RESULT_CACHE = 'ai_results'
+
+EXTRACT_TEXT_PROMPT = "Please extract and transcribe all the text visible in this image. Return only the transcribed text, preserving the original formatting as much as possible. Do not add any commentary or explanation."
+
+STYLE_GUIDE_SYSTEM_PROMPT = """You are an expert UX writer and content strategist. Analyze UI strings and create a concise, actionable style guide.
+
+Focus on:
+1. **Tone & Voice**: Personality (friendly, professional, casual, formal, etc.)
+2. **Vocabulary**: Common words, phrases, terminology patterns
+3. **Brevity**: How concise are the strings? Typical length?
+4. **Language Style**: Sentence structure, punctuation, capitalization
+5. **Patterns**: Action verbs, calls-to-action, error formats
+6. **Key Observations**: Other important patterns or recommendations
+
+Keep the guide succinct and practical for quick reference."""
+
+
+class AIError(Exception):
+    """A failed AI task, with a user-facing message."""
+
+
+def api_key_for(user):
+    """The user's OpenAI API key, or None if they haven't configured one."""
+    return UserProfile.objects.filter(user=user).values_list('openai_api_key', flat=True).first() or None
+
+
+def style_guide_strings(user):
+    """Published strings (not conditionals) a style guide is generated from."""
+    return String.objects.filter(
+        project__user=user,
+        is_published=True,
+        is_conditional_container=False
+    ).select_related('project')
+
+
+def friendly_error(exc):
+    """Map an OpenAI error to a message the user can act on."""
+    error_message = str(exc)
+    lowered = error_message.lower()
+    if 'invalid_api_key' in lowered or 'incorrect api key' in lowered:
+        return 'Invalid API key. Please check your key in Settings.'
+    if 'rate_limit' in lowered:
+        return 'Rate limit exceeded. Please wait a moment and try again.'
+    if 'insufficient_quota' in lowered:
+        return 'Insufficient OpenAI quota. Please check your billing settings.'
+    return error_message
+
+
+def complete(user, **params):
+    """Run a chat completion with the user's key (on its pooled client) and return the reply text."""
+    api_key = api_key_for(user)
+    if not api_key:
+        raise AIError(NOT_CONFIGURED)
+    started = time.perf_counter()
+    try:
+        response = client_for(api_key).chat.completions.create(**params)
+    except Exception as exc:
+        OPENAI_ERRORS.labels(params['model'], type(exc).__name__).inc()
+        raise AIError(friendly_error(exc)) from exc
+    finally:
+        OPENAI_LATENCY.labels(params['model']).observe(time.perf_counter() - started)
+    return response.choices[0].message.content.strip()
+
+
+def result_key(kind, model, *inputs):
+    """Cache key of a result: a digest of the task, the model and everything its prompt is built from."""
+    digest = hashlib.sha256(f'{kind}\0{model}'.encode())
+    for value in inputs:
+        digest.update(b'\0')
+        digest.update(str(value).encode())
+    return f'ai:{kind}:{digest.hexdigest()}'
+
+
+def image_digest(image):
+    """sha256 of an image's bytes, given as a data URL (or of the value itself if it isn't base64)."""
+    try:
+        data = base64.b64decode(image.partition(',')[2] or image, validate=True)
+    except (binascii.Error, ValueError):
+        data = image.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def cached_result(kind, user, input):
+    """
+    A job's result if it is already cached, so it needn't be queued; otherwise
+    None. Counted as a cache hit or miss here, once per request.
+    """
+    if kind == 'extract_text':
+        return cache_lookup(RESULT_CACHE, _cached(_extract_text_key(input)))
+    if kind == 'style_guide':
+        if input.get('incremental'):
+            previous = _latest_style_guide(user)
+            unchanged = previous and not _changed_strings(user, previous).exists()
+            return cache_lookup(RESULT_CACHE, previous['result'] if unchanged else None)
+        strings = _newest_in_id_order(style_guide_strings(user).select_related(None).only('id', 'updated_at'))
+        key = _style_guide_key(_versions(strings))
+        return cache_lookup(RESULT_CACHE, _cached(key))
+    return None
+
+
+def extract_text(user, input):
+    """Extract the text in an image (a data:image/...;base64,... URL) with the Vision API."""
+    key = _extract_text_key(input)
+    result = _cached(key)
+    if result is not None:
+        return result
+    text = complete(
+        user,
+        model=EXTRACT_TEXT_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": EXTRACT_TEXT_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": input['image']
+                        }
+                    }
+                ]
+            }
+        ],
+        max_tokens=2000
+    )
+    result = {'success': True, 'text': text}
+    caches[RESULT_CACHE].set(key, result)
+    return result
+
+
+def test_connection(user, input):
+    """Check the user's key works by asking for a one-line joke."""
+    joke = complete(
+        user,
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that tells jokes."},
+            {"role": "user", "content": "Tell me a short, clean, one-line joke."}
+        ],
+        max_tokens=100,
+        temperature=0.7
+    )
+    return {
+        'success': True,
+        'joke': joke,
+        'message': 'Connection successful! Your OpenAI integration is working.'
+    }
+
+
+def generate_style_guide(user, input):
+    """
+    Generate a style guide from the user's published registry strings.
+
+    With input {'incremental': true} and a previous guide still cached, only
+    the strings changed since that guide are sent, along with the guide to
+    revise; strings unpublished since are only dropped by a full guide. When
+    more strings changed than one request can carry, a full guide is written
+    instead, so no change is skipped.
+    """
+    # Taken before reading the strings, so edits made meanwhile count as changes next time
+    as_of = timezone.now()
+    previous = _latest_style_guide(user) if input.get('incremental') else None
+    if previous:
+        strings = list(_changed_strings(user, previous).order_by('id')[:STYLE_GUIDE_STRING_LIMIT + 1])
+        if not strings:
+            return previous['result']
+        if len(strings) > STYLE_GUIDE_STRING_LIMIT:
+            previous = None
+    if previous:
+        key = result_key('style_guide', STYLE_GUIDE_MODEL, STYLE_GUIDE_SYSTEM_PROMPT, previous['key'], *_versions(strings))
+    else:
+        strings = _newest_in_id_order(style_guide_strings(user))
+        if not strings:
+            raise AIError(NO_PUBLISHED_STRINGS)
+        key = _style_guide_key(_versions(strings))
+
+    result = _cached(key)
+    if result is None:
+        result = _write_style_guide(user, strings, previous['result']['style_guide'] if previous else None)
+        caches[RESULT_CACHE].set(key, result)
+    caches[RESULT_CACHE].set(_latest_style_guide_key(user), {'key': key, 'as_of': as_of})
+    return result
+
+
+def _write_style_guide(user, strings, previous_guide):
+    strings_text = "\n\n".join([
+        f"**{s.display_name or s.effective_variable_name or s.variable_hash}** "
+        f"(from {s.project.name if s.project else 'Unknown'}):\n\"{s.content or ''}\""
+        for s in strings
+    ])
+    if previous_guide:
+        request = f"""Here is the current style guide:
+
+{previous_guide}
+
+These {len(strings)} UI strings were added or changed since it was written:
+
+{strings_text}
+
+Revise the style guide to account for them, keeping what still holds. Return the complete, concise style guide."""
+    else:
+        request = f"""Analyze these {len(strings)} UI strings and create a style guide:
+
+{strings_text}
+
+Create a concise style guide to help writers match this established voice and style."""
+
+    style_guide = complete(
+        user,
+        model=STYLE_GUIDE_MODEL,
+        messages=[
+            {"role": "system", "content": STYLE_GUIDE_SYSTEM_PROMPT},
+            {"role": "user", "content": request}
+        ],
+        max_tokens=2000,
+        temperature=0.7
+    )
+    return {
+        'success': True,
+        'style_guide': style_guide,
+        'generated_date': datetime.now().strftime("%B %d, %Y"),
+        'strings_analyzed': len(strings),
+        'incremental': bool(previous_guide),
+    }
+
+
+def _cached(key):
+    return caches[RESULT_CACHE].get(key)
+
+
+def _extract_text_key(input):
+    return result_key('extract_text', EXTRACT_TEXT_MODEL, EXTRACT_TEXT_PROMPT, image_digest(input['image']))
+
+
+def _style_guide_key(versions):
+    return result_key('style_guide', STYLE_GUIDE_MODEL, STYLE_GUIDE_SYSTEM_PROMPT, *versions)
+
+
+def _newest_in_id_order(strings):
+    """The newest STYLE_GUIDE_STRING_LIMIT strings, sorted by id so the same set gives the same key and prompt."""
+    return sorted(strings.order_by('-created_at', '-id')[:STYLE_GUIDE_STRING_LIMIT], key=lambda string: string.id)
+
+
+def _versions(strings):
+    # What identifies a string's content for caching: its id and when it last changed
+    return [f'{string.id}@{string.updated_at.isoformat()}' for string in strings]
+
+
+def _latest_style_guide_key(user):
+    return f'ai:style_guide:latest:{user.id}'
+
+
+def _latest_style_guide(user):
+    """The user's last generated guide: {'key', 'as_of', 'result'}, or None if it was evicted."""
+    cache = caches[RESULT_CACHE]
+    latest = cache.get(_latest_style_guide_key(user))
+    result = latest and cache.get(latest['key'])
+    if result is None:
+        return None
+    return {**latest, 'result': result}
+
+
+def _changed_strings(user, previous):
+    return style_guide_strings(user).filter(updated_at__gte=previous['as_of'])
+
+
+# Job kind -> task
+TASKS = {
+    'extract_text': extract_text,
+    'test_connection': test_connection,
+    'style_guide': generate_style_guide,
+}
@@ -0,0 +1,402 @@
+"""
+Transactional batch create/update/delete of strings.
+
+A batch is validated as a whole against one in-memory snapshot of the project
+(its strings and dimensions are loaded up front), so checking names, spawn
+controllers, assignments and embed cycles costs a fixed number of queries no
+matter how many items the batch holds. It is then written with bulk operations
+inside a single transaction, so a conditional and all of its spawns can be
+created in one request.
+
+Created items may carry a client-side ``ref`` which other items in the same
+batch can use wherever a string id is expected. A dimension-value assignment is
+either an existing DimensionValue id or an object naming the dimension by
+``dimension`` (id), ``dimension_name`` or ``conditional`` (id or ref of the
+conditional whose dimension shares its name) plus an optional ``value``, which
+defaults to the assigned string's own name as spawns do. Missing dimensions and
+values are created.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from .models import String, Dimension, DimensionValue, StringDimensionValue, bump_project_version
+from .graph import DependencyGraph, link_dangling_references, propagate_rename, sync_references
+from .hashing import HashAllocator
+from .materialize import refresh_resolved_content
+from .resolution import tokenize, embed
+
+# Writable String fields a batch item may set directly
+STRING_FIELDS = ('content', 'display_name', 'is_conditional', 'is_conditional_container', 'is_published')
+
+NOT_IN_PROJECT = 'String does not exist in this project.'
+
+
+class StringBatch:
+    """
+    Validate and apply one batch of string changes for a project.
+
+    `create` and `update` are lists of item dicts (already shape-checked by
+    StringBatchSerializer), `delete` a list of string ids. Call validate()
+    and, if it returns no errors, save().
+    """
+
+    def __init__(self, project, create=(), update=(), delete=()):
+        self.project = project
+        self.creates = list(create)
+        self.updates = list(update)
+        self.deletes = list(dict.fromkeys(delete))
+        self.deleted = set(self.deletes)
+
+        self.strings = {string.id: string for string in project.strings.all()}
+        self.dimensions = {dimension.id: dimension for dimension in project.dimensions.prefetch_related('values')}
+        self.values = {
+            value.id: value
+            for dimension in self.dimensions.values()
+            for value in dimension.values.all()
+        }
+        # Created items are keyed by negative ids so they share one namespace with existing strings
+        self.refs = {}
+
+    # Validation
+
+    def validate(self):
+        """Return a dict of errors shaped like the request, empty when the batch is valid."""
+        delete_errors = self._validate_deletes()
+        update_errors = self._validate_updates()
+        create_errors = self._validate_refs()
+        # Cross-item checks need every id and ref to be sound first
+        if not any(delete_errors) and not any(update_errors) and not any(create_errors):
+            self._validate_names(create_errors, update_errors)
+            self._validate_links(create_errors, update_errors)
+            if not any(create_errors) and not any(update_errors):
+                self._validate_cycles(create_errors, update_errors)
+
+        errors = {}
+        for key, section in (('create', create_errors), ('update', update_errors), ('delete', delete_errors)):
+            if any(section):
+                errors[key] = section
+        return errors
+
+    def _validate_deletes(self):
+        return [{} if string_id in self.strings else {'id': NOT_IN_PROJECT} for string_id in self.deletes]
+
+    def _validate_updates(self):
+        errors = [{} for _ in self.updates]
+        seen = set()
+        for item, item_errors in zip(self.updates, errors):
+            string_id = item.get('id')
+            if string_id is None:
+                item_errors['id'] = 'This field is required.'
+            elif string_id not in self.strings:
+                item_errors['id'] = NOT_IN_PROJECT
+            elif string_id in self.deleted:
+                item_errors['id'] = 'String is also deleted in this batch.'
+            elif string_id in seen:
+                item_errors['id'] = 'String is updated more than once in this batch.'
+            seen.add(string_id)
+        return errors
+
+    def _validate_refs(self):
+        errors = [{} for _ in self.creates]
+        for index, item in enumerate(self.creates):
+            ref = item.get('ref')
+            if ref is None:
+                continue
+            if ref in self.refs:
+                errors[index]['ref'] = f'Ref "{ref}" is used more than once in this batch.'
+            self.refs[ref] = self._create_key(index)
+        return errors
+
+    def _validate_names(self, create_errors, update_errors):
+        """Hashes must stay unique in the project once the whole batch is applied."""
+        # Final name of every string that survives the batch; None means one will be allocated
+        self.final_names = {
+            string_id: string.variable_hash
+            for string_id, string in self.strings.items()
+            if string_id not in self.deleted
+        }
+        self.renames = {}
+        for item in self.updates:
+            if 'variable_hash' in item:
+                string = self.strings[item['id']]
+                new_name = item['variable_hash'] or None
+                if new_name != string.variable_hash:
+                    self.final_names[string.id] = new_name
+                    self.renames[string.id] = string.variable_hash
+        for index, item in enumerate(self.creates):
+            self.final_names[self._create_key(index)] = item.get('variable_hash') or None
+
+        owners = defaultdict(list)
+        for key, name in self.final_names.items():
+            if name:
+                owners[name].append(key)
+        released = {old_name for old_name in self.renames.values() if old_name}
+
+        claims = [(update_errors[i], item['id'], item) for i, item in enumerate(self.updates) if item['id'] in self.renames]
+        claims += [(create_errors[i], self._create_key(i), item) for i, item in enumerate(self.creates)]
+        for item_errors, key, item in claims:
+            name = self.final_names[key]
+            if not name:
+                continue
+            if len(owners[name]) > 1:
+                item_errors['variable_hash'] = f'A variable with hash "{name}" already exists in this project.'
+            elif name in released:
+                # Renames are applied independently, so a name can't change hands within one batch
+                item_errors['variable_hash'] = f'Hash "{name}" is released by a rename in this batch; reuse it in a separate request.'
+
+    def _validate_links(self, create_errors, update_errors):
+        """Spawn controllers and dimension-value assignments must point at something that will exist."""
+        items = [(create_errors[i], item) for i, item in enumerate(self.creates)]
+        items += [(update_errors[i], item) for i, item in enumerate(self.updates)]
+        for item_errors, item in items:
+            if item.get('controlled_by_spawn') is not None and self._string_key(item['controlled_by_spawn']) is None:
+                item_errors['controlled_by_spawn'] = NOT_IN_PROJECT
+            assignment_errors = [self._assignment_error(assignment) for assignment in item.get('dimension_values', ())]
+            if any(assignment_errors):
+                item_errors['dimension_values'] = assignment_errors
+
+    def _assignment_error(self, assignment):
+        if isinstance(assignment, bool) or not isinstance(assignment, (int, dict)):
+            return 'Expected a dimension value id or an object.'
+        if isinstance(assignment, int):
+            return None if assignment in self.values else 'Dimension value does not exist in this project.'
+
+        targets = [key for key in ('dimension', 'dimension_name', 'conditional') if key in assignment]
+        if len(targets) != 1:
+            return 'Give exactly one of "dimension", "dimension_name" or "conditional".'
+        value = assignment.get('value')
+        if value is not None and (not isinstance(value, str) or not value or len(value) > 200):
+            return 'Value must be a non-empty string of at most 200 characters.'
+        if 'dimension' in assignment:
+            dimension = assignment['dimension']
+            if isinstance(dimension, bool) or not isinstance(dimension, int):
+                return 'Dimension must be a dimension id.'
+            if dimension not in self.dimensions:
+                return 'Dimension does not exist in this project.'
+        if 'dimension_name' in assignment:
+            name = assignment['dimension_name']
+            if not isinstance(name, str) or not name or len(name) > 100:
+                return 'Dimension name must be a non-empty string of at most 100 characters.'
+        if 'conditional' in assignment and self._string_key(assignment['conditional']) is None:
+            return NOT_IN_PROJECT
+        return None
+
+    def _validate_cycles(self, create_errors, update_errors):
+        """
+        Build the post-batch embed graph in memory and reject changed strings
+        that would end up in, or embedding, a reference cycle.
+        """
+        contents = {key: self.strings[key].content for key in self.final_names if key > 0}
+        changed = {}
+        for index, item in enumerate(self.updates):
+            if 'content' in item or item['id'] in self.renames:
+                contents[item['id']] = item.get('content', contents[item['id']])
+                changed[item['id']] = update_errors[index]
+        for index, item in enumerate(self.creates):
+            key = self._create_key(index)
+            contents[key] = item.get('content', '')
+            changed[key] = create_errors[index]
+        if not changed:
+            return
+
+        # Renamed strings keep answering to their old name: embeds of it are rewritten on save
+        by_name = {}
+        for key, old_name in self.renames.items():
+            if old_name:
+                by_name[old_name] = key
+        for key, name in self.final_names.items():
+            if name:
+                by_name[name] = key
+
+        embeds = {key: [name for name in dict.fromkeys(tokenize(content)[1::2]) if name in by_name] for key, content in contents.items()}
+        graph = DependencyGraph(
+            (key, by_name[name], name)
+            for key, names in embeds.items()
+            for name in names
+        )
+        cyclic = graph.cyclic(contents)
+        for key, item_errors in changed.items():
+            if key not in cyclic:
+                continue
+            for name in embeds[key]:
+                target = by_name[name]
+                if target == key:
+                    item_errors['content'] = f'String cannot reference itself through variable "{{{{ {name} }}}}"'
+                    break
+                if target in cyclic:
+                    item_errors['content'] = f'Circular reference detected involving variable "{{{{ {name} }}}}"'
+                    break
+
+    # Writing
+
+    def save(self):
+        """
+        Apply the validated batch in one transaction.
+        Returns (created strings in request order, updated strings, deleted ids).
+        """
+        with transaction.atomic():
+            if self.deletes:
+                String.objects.filter(project=self.project, id__in=self.deletes).delete()
+
+            self._allocate_names()
+            rename_map = {old_name: self.final_names[key] for key, old_name in self.renames.items() if old_name}
+            created = self._create_strings(rename_map)
+            updated = self._update_strings(rename_map)
+
+            renamed = []
+            for string_id, old_name in self.renames.items():
+                string = self.strings[string_id]
+                if old_name:
+                    propagate_rename(string, old_name, string.variable_hash)
+                renamed.append(string)
+
+            sync_references(created + updated)
+            link_dangling_references(created + renamed)
+            self._assign_dimension_values()
+            # Bulk writes skip the save signals that version the project and materialize resolutions
+            refresh_resolved_content(self.project.id, [string.id for string in created + updated])
+            bump_project_version(pk=self.project.id)
+        return created, updated, list(self.deletes)
+
+    def _allocate_names(self):
+        missing = [key for key, name in self.final_names.items() if not name]
+        if not missing:
+            return
+        allocator = HashAllocator(project_id=self.project.id)
+        allocator.reserve(name for name in self.final_names.values() if name)
+        allocator.reserve(name for name in self.renames.values() if name)
+        for key, name in zip(missing, allocator.allocate(len(missing))):
+            self.final_names[key] = name
+
+    def _create_strings(self, rename_map):
+        self.created = {}
+        for index, item in enumerate(self.creates):
+            key = self._create_key(index)
+            name = self.final_names[key]
+            string = String(project=self.project, variable_hash=name, variable_name=name)
+            for field in STRING_FIELDS:
+                if field in item:
+                    setattr(string, field, item[field])
+            string.content = self._rewrite(string.content, rename_map)
+            controller = self._string_key(item.get('controlled_by_spawn'))
+            if controller is not None and controller > 0:
+                string.controlled_by_spawn_id = controller
+            self.created[key] = string
+        created = list(self.created.values())
+        String.objects.bulk_create(created)
+
+        # Controllers created in this same batch only have ids now
+        controlled = []
+        for index, item in enumerate(self.creates):
+            controller = self._string_key(item.get('controlled_by_spawn'))
+            if controller is not None and controller < 0:
+                string = self.created[self._create_key(index)]
+                string.controlled_by_spawn_id = self.created[controller].id
+                controlled.append(string)
+        if controlled:
+            String.objects.bulk_update(controlled, ['controlled_by_spawn'])
+        return created
+
+    def _update_strings(self, rename_map):
+        now = timezone.now()
+        updated = []
+        for item in self.updates:
+            string = self.strings[item['id']]
+            for field in STRING_FIELDS:
+                if field in item:
+                    setattr(string, field, item[field])
+            string.content = self._rewrite(string.content, rename_map)
+            string.variable_hash = string.variable_name = self.final_names[string.id]
+            if 'controlled_by_spawn' in item:
+                string.controlled_by_spawn_id = self._resolve_id(item['controlled_by_spawn'])
+            # bulk_update skips auto_now, so stamp it here
+            string.updated_at = now
+            updated.append(string)
+        if updated:
+            String.objects.bulk_update(
+                updated,
+                ['variable_hash', 'variable_name', 'controlled_by_spawn', 'updated_at', *STRING_FIELDS],
+            )
+        return updated
+
+    def _assign_dimension_values(self):
+        assignments = []  # (string, dimension id or name, value)
+        for index, item in enumerate(self.creates):
+            string = self.created[self._create_key(index)]
+            assignments.extend((string, assignment) for assignment in item.get('dimension_values', ()))
+        for item in self.updates:
+            string = self.strings[item['id']]
+            assignments.extend((string, assignment) for assignment in item.get('dimension_values', ()))
+        if not assignments:
+            return
+
+        dimensions_by_name = {dimension.name: dimension for dimension in self.dimensions.values()}
+        resolved = []  # (string, dimension name, value) or (string, dimension value id)
+        for string, assignment in assignments:
+            if isinstance(assignment, int):
+                resolved.append((string, assignment))
+                continue
+            if 'dimension' in assignment:
+                dimension_name = self.dimensions[assignment['dimension']].name
+            elif 'dimension_name' in assignment:
+                dimension_name = assignment['dimension_name']
+            else:
+                dimension_name = self.final_names[self._string_key(assignment['conditional'])]
+            resolved.append((string, dimension_name, assignment.get('value') or string.variable_hash))
+
+        new_dimensions = {}
+        for entry in resolved:
+            if len(entry) == 3 and entry[1] not in dimensions_by_name:
+                new_dimensions.setdefault(entry[1], Dimension(project=self.project, name=entry[1]))
+        if new_dimensions:
+            Dimension.objects.bulk_create(new_dimensions.values())
+            dimensions_by_name.update(new_dimensions)
+
+        values = {(value.dimension_id, value.value): value for value in self.values.values()}
+        new_values = {}
+        for entry in resolved:
+            if len(entry) == 3:
+                key = (dimensions_by_name[entry[1]].id, entry[2])
+                if key not in values and key not in new_values:
+                    new_values[key] = DimensionValue(dimension_id=key[0], value=key[1])
+        if new_values:
+            DimensionValue.objects.bulk_create(new_values.values())
+            values.update(new_values)
+
+        links = {}
+        for entry in resolved:
+            string = entry[0]
+            value_id = entry[1] if len(entry) == 2 else values[(dimensions_by_name[entry[1]].id, entry[2])].id
+            links[(string.id, value_id)] = StringDimensionValue(string=string, dimension_value_id=value_id)
+        StringDimensionValue.objects.bulk_create(links.values(), ignore_conflicts=True)
+
+    # Helpers
+
+    @staticmethod
+    def _create_key(index):
+        return -(index + 1)
+
+    def _string_key(self, reference):
+        """Map a string id or batch ref to its key, or None if it won't exist after the batch."""
+        if isinstance(reference, str):
+            return self.refs.get(reference)
+        if isinstance(reference, int) and not isinstance(reference, bool):
+            if reference in self.strings and reference not in self.deleted:
+                return reference
+        return None
+
+    def _resolve_id(self, reference):
+        key = self._string_key(reference)
+        if key is None:
+            return None
+        return self.created[key].id if key < 0 else key
+
+    @staticmethod
+    def _rewrite(content, rename_map):
+        """Point embeds of renamed strings at their new names, all renames at once."""
+        if not rename_map or not content:
+            return content
+        tokens = tokenize(content)
+        for index in range(1, len(tokens), 2):
+            tokens[index] = embed(rename_map.get(tokens[index], tokens[index]))
+        return ''.join(tokens)
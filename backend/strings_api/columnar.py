@@ -0,0 +1,103 @@
+"""
+Columnar project payload, served by GET /api/projects/<id>/ as
+?format=columnar (JSON) or ?format=msgpack, or by Accept header.
+
+ProjectSerializer repeats every field name for every string and embeds a
+dimension_value_detail dict in every assignment. Here each table is a dict
+of parallel columns, one list per field, and rows refer to each other by
+position:
+
+    {
+        "schema": "columnar/1",
+        "project": {"id", "name", "description", "created_at", "updated_at"},
+        "strings": {"id": [...], "content": [...], "variable_hash": [...], ...},
+        "dimensions": {"id": [...], "name": [...], ...},
+        "dimension_values": {"id": [...], "dimension": [<dimension row>], "value": [...], ...},
+        "assignments": {"pairs": [[<string row>, <dimension value row>], ...], "id": [...], "created_at": [...]},
+    }
+
+effective_variable_name is left out: it is variable_name, or variable_hash
+when there is none. The editor's decoder (frontend/src/lib/projectPayload.ts)
+rebuilds the nested ProjectSerializer shape from this.
+
+Columns are read with values_list, so no model instances or serializers
+are built.
+"""
+from rest_framework import serializers
+from .models import String, Dimension, DimensionValue, StringDimensionValue
+
+SCHEMA = 'columnar/1'
+FORMATS = ('columnar', 'msgpack')
+
+STRING_COLUMNS = (
+    'id', 'content', 'variable_name', 'variable_hash', 'display_name', 'is_conditional',
+    'is_conditional_container', 'controlled_by_spawn_id', 'is_published', 'created_at', 'updated_at',
+)
+DIMENSION_COLUMNS = ('id', 'name', 'created_at', 'updated_at')
+DIMENSION_VALUE_COLUMNS = ('id', 'dimension', 'value', 'created_at', 'updated_at')
+TIMESTAMP_COLUMNS = {'created_at', 'updated_at'}
+
+# Timestamps rendered exactly as the JSON serializers render them
+timestamp = serializers.DateTimeField().to_representation
+
+
+def project_columns(project):
+    """The columnar payload for a project, in four queries."""
+    strings = _columns(
+        String.objects.filter(project=project).order_by('-created_at').values_list(*STRING_COLUMNS),
+        STRING_COLUMNS,
+    )
+    dimensions = _columns(
+        Dimension.objects.filter(project=project).order_by('id').values_list(*DIMENSION_COLUMNS),
+        DIMENSION_COLUMNS,
+    )
+    # Rows whose parent was created after its table was read are left out;
+    # that write also bumped the project version, so this payload is not reused
+    dimension_rows = _positions(dimensions['id'])
+    dimension_values = _columns(
+        [
+            (value_id, dimension_rows[dimension_id], value, created_at, updated_at)
+            for value_id, dimension_id, value, created_at, updated_at in DimensionValue.objects.filter(
+                dimension__project=project,
+            ).order_by('id').values_list('id', 'dimension_id', 'value', 'created_at', 'updated_at')
+            if dimension_id in dimension_rows
+        ],
+        DIMENSION_VALUE_COLUMNS,
+    )
+
+    string_rows = _positions(strings['id'])
+    value_rows = _positions(dimension_values['id'])
+    assignments = {'pairs': [], 'id': [], 'created_at': []}
+    for assignment_id, string_id, value_id, created_at in StringDimensionValue.objects.filter(
+        string__project=project,
+    ).order_by('id').values_list('id', 'string_id', 'dimension_value_id', 'created_at'):
+        if string_id in string_rows and value_id in value_rows:
+            assignments['pairs'].append([string_rows[string_id], value_rows[value_id]])
+            assignments['id'].append(assignment_id)
+            assignments['created_at'].append(timestamp(created_at))
+
+    return {
+        'schema': SCHEMA,
+        'project': {
+            'id': project.id,
+            'name': project.name,
+            'description': project.description,
+            'created_at': timestamp(project.created_at),
+            'updated_at': timestamp(project.updated_at),
+        },
+        'strings': strings,
+        'dimensions': dimensions,
+        'dimension_values': dimension_values,
+        'assignments': assignments,
+    }
+
+
+def _columns(rows, names):
+    columns = {name: list(column) for name, column in zip(names, zip(*rows))} or {name: [] for name in names}
+    for name in TIMESTAMP_COLUMNS.intersection(columns):
+        columns[name] = [timestamp(value) for value in columns[name]]
+    return columns
+
+
+def _positions(ids):
+    return {row_id: row for row, row_id in enumerate(ids)}
@@ -0,0 +1,229 @@
+"""
+Per-project dependency graph of {{variable}} embeds.
+
+Edges live in the StringReference table and are maintained by the String save
+signals in models.py, so "who references whom" is an indexed lookup instead of
+a regex scan over every string in the project.
+"""
+from collections import defaultdict, deque
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Replace
+from django.utils import timezone
+from .models import String, StringReference
+from .resolution import embed, extract_variable_names
+
+MAX_NAME_LENGTH = StringReference._meta.get_field('name').max_length
+
+
+def referenced_names(content):
+    """Return the set of variable names a template embeds."""
+    return {name for name in extract_variable_names(content) if len(name) <= MAX_NAME_LENGTH}
+
+
+def resolve_names(project_id, names):
+    """
+    Map variable names to string ids within a project.
+    Newest string wins on a clash, matching the resolver's lookup.
+    """
+    targets = {}
+    if not names:
+        return targets
+    matches = String.objects.filter(project_id=project_id).filter(
+        Q(variable_name__in=names) | Q(variable_hash__in=names)
+    ).values_list('id', 'variable_name', 'variable_hash')
+    for string_id, variable_name, variable_hash in matches:
+        for key in (variable_name, variable_hash):
+            if key in names:
+                targets.setdefault(key, string_id)
+    return targets
+
+
+def sync_references(strings):
+    """
+    Rebuild the outgoing edges of the given strings from their current content.
+    Only edges whose names were added or removed are touched.
+    """
+    strings = [string for string in strings if string.pk]
+    if not strings:
+        return
+
+    wanted = {string.id: referenced_names(string.content) for string in strings}
+    existing = defaultdict(dict)
+    for edge_id, source_id, name in StringReference.objects.filter(
+        source_id__in=wanted
+    ).values_list('id', 'source_id', 'name'):
+        existing[source_id][name] = edge_id
+
+    stale_ids = [
+        edge_id
+        for source_id, edges in existing.items()
+        for name, edge_id in edges.items()
+        if name not in wanted[source_id]
+    ]
+    if stale_ids:
+        StringReference.objects.filter(id__in=stale_ids).delete()
+
+    additions = defaultdict(list)
+    for string in strings:
+        for name in wanted[string.id] - existing[string.id].keys():
+            additions[string.project_id].append((string.id, name))
+
+    new_edges = []
+    for project_id, pairs in additions.items():
+        targets = resolve_names(project_id, {name for _, name in pairs})
+        new_edges.extend(
+            StringReference(project_id=project_id, source_id=source_id, name=name, target_id=targets.get(name))
+            for source_id, name in pairs
+        )
+    if new_edges:
+        StringReference.objects.bulk_create(new_edges)
+
+
+def link_dangling_references(strings):
+    """
+    Point embeds of a not-yet-existing variable at the strings that now carry
+    those names. Only names that actually have dangling edges are updated.
+    """
+    owners = defaultdict(dict)  # project id -> name -> string id
+    for string in strings:
+        for name in (string.variable_name, string.variable_hash):
+            if name:
+                owners[string.project_id][name] = string.id
+
+    for project_id, names in owners.items():
+        edges = defaultdict(list)
+        for edge_id, name in StringReference.objects.filter(
+            project_id=project_id,
+            target__isnull=True,
+            name__in=names,
+        ).values_list('id', 'name'):
+            edges[names[name]].append(edge_id)
+        for target_id, edge_ids in edges.items():
+            StringReference.objects.filter(id__in=edge_ids).update(target_id=target_id)
+
+
+def propagate_rename(string, old_name, new_name):
+    """
+    Rewrite {{old_name}} embeds to {{new_name}} in every string that references
+    `string`. Sources come from the edge table and are rewritten with a single
+    UPDATE ... REPLACE inside one transaction. Returns the rewritten string ids.
+    """
+    with transaction.atomic():
+        source_ids = list(
+            StringReference.objects.filter(project_id=string.project_id, name=old_name)
+            .exclude(source_id=string.id)
+            .values_list('source_id', flat=True)
+        )
+        if not source_ids:
+            return source_ids
+        
+        String.objects.filter(id__in=source_ids).update(
+            content=Replace('content', Value(embed(old_name)), Value(embed(new_name))),
+            updated_at=timezone.now(),
+        )
+        
+        # Carry the edges over to the new name; a source that also embedded the
+        # new name while it was dangling now has both embeds under one edge
+        edges = StringReference.objects.filter(source_id__in=source_ids)
+        edges.filter(name=new_name).delete()
+        edges.filter(name=old_name).update(name=new_name)
+        return source_ids
+
+
+def dependencies(string):
+    """Strings that `string` embeds directly."""
+    return String.objects.filter(referenced_by__source=string).distinct()
+
+
+def dependents(string):
+    """Strings that embed `string` directly."""
+    return String.objects.filter(references__target=string).distinct()
+
+
+def transitive_dependencies(string):
+    """Ids of every string `string` embeds, directly or through other embeds."""
+    return DependencyGraph.for_project(string.project_id).transitive_dependencies([string.id])
+
+
+def transitive_dependents(string):
+    """Ids of every string that embeds `string`, directly or through other embeds."""
+    return DependencyGraph.for_project(string.project_id).transitive_dependents([string.id])
+
+
+def topological_order(project):
+    """Ids of the project's strings ordered so embeds come before the strings using them."""
+    graph = DependencyGraph.for_project(project)
+    return graph.topological_order(project.strings.values_list('id', flat=True))
+
+
+class DependencyGraph:
+    """
+    In-memory adjacency map of a project's embed graph, loaded in one query.
+    """
+
+    def __init__(self, edges):
+        self.dependencies = defaultdict(set)  # source id -> embedded string ids
+        self.dependents = defaultdict(set)  # string id -> ids of strings embedding it
+        self.dangling = defaultdict(set)  # unknown variable name -> ids of strings embedding it
+        self.targets = defaultdict(dict)  # source id -> embedded name -> string id (None if unknown)
+        for source_id, target_id, name in edges:
+            self.targets[source_id][name] = target_id
+            if target_id is None:
+                self.dangling[name].add(source_id)
+            else:
+                self.dependencies[source_id].add(target_id)
+                self.dependents[target_id].add(source_id)
+
+    @classmethod
+    def for_project(cls, project):
+        return cls(StringReference.objects.filter(project=project).values_list('source_id', 'target_id', 'name'))
+
+    def transitive_dependencies(self, string_ids):
+        return self._reachable(string_ids, self.dependencies)
+
+    def transitive_dependents(self, string_ids):
+        return self._reachable(string_ids, self.dependents)
+
+    def topological_order(self, string_ids):
+        """
+        Order string ids so every string comes after the strings it embeds.
+        Only edges between the given ids are considered; strings caught in a
+        cycle can't be ordered and are appended at the end.
+        """
+        nodes = set(string_ids)
+        order = self._peel(nodes)
+        if len(order) < len(nodes):
+            ordered = set(order)
+            order.extend(sorted(node for node in nodes if node not in ordered))
+        return order
+
+    def cyclic(self, string_ids):
+        """Ids among string_ids that are part of a cycle or embed one, directly or transitively."""
+        nodes = set(string_ids)
+        return nodes.difference(self._peel(nodes))
+
+    def _peel(self, nodes):
+        # Kahn's algorithm: repeatedly take strings whose embeds are all taken
+        pending = {node: len(self.dependencies[node] & nodes) for node in nodes}
+        queue = deque(sorted(node for node, count in pending.items() if count == 0))
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for dependent in sorted(self.dependents[node] & nodes):
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    queue.append(dependent)
+        return order
+
+    @staticmethod
+    def _reachable(string_ids, adjacency):
+        seen = set()
+        queue = deque(string_ids)
+        while queue:
+            for neighbour in adjacency[queue.popleft()]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return seen
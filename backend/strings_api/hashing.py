@@ -0,0 +1,80 @@
+"""
+Allocation of random 6-character variable hashes.
+
+Candidates are generated in batches and checked with one IN query per batch,
+so bulk creates and imports pay one round trip per batch instead of two per
+string.
+"""
+import secrets
+import string
+from django.db.models import Q
+
+HASH_CHARS = string.ascii_uppercase + string.digits
+HASH_LENGTH = 6
+# Batch for callers that need a single hash (one String.save()): a handful of
+# candidates in the IN query, not hundreds
+SINGLE_BATCH_SIZE = 4
+
+
+def random_hash():
+    """Generate a 6-character hash using uppercase letters and numbers."""
+    return ''.join(secrets.choice(HASH_CHARS) for _ in range(HASH_LENGTH))
+
+
+class HashAllocator:
+    """
+    Hands out hashes that are unique both as a variable_hash (globally) and as
+    a variable_name within the project, since the hash is also used as the
+    variable name. Hashes handed out by one allocator never repeat, so a bulk
+    create can allocate for all its rows before inserting any of them.
+
+    The default batch suits bulk callers; pass batch_size=SINGLE_BATCH_SIZE
+    when only one hash is needed.
+    """
+
+    def __init__(self, project_id=None, batch_size=500):
+        self.project_id = project_id
+        self.batch_size = batch_size
+        self._reserved = set()
+        self._pool = []
+
+    def reserve(self, hashes):
+        """Exclude hashes that are spoken for but not yet saved (e.g. chosen by the user in the same batch)."""
+        # Pooled candidates are in _reserved too, so only the new hashes are filtered out
+        hashes = set(hashes)
+        self._reserved.update(hashes)
+        self._pool = [candidate for candidate in self._pool if candidate not in hashes]
+
+    def allocate(self, count):
+        """Return `count` unused hashes."""
+        while len(self._pool) < count:
+            self._refill(count - len(self._pool))
+        allocated, self._pool = self._pool[:count], self._pool[count:]
+        return allocated
+
+    def next(self):
+        """Return a single unused hash, refilling a whole batch when the pool runs dry."""
+        if not self._pool:
+            self._refill(self.batch_size)
+        return self._pool.pop()
+
+    def _refill(self, needed):
+        from .models import String
+
+        needed = min(needed, self.batch_size)
+        # Over-generate slightly so a collision rarely costs another round trip
+        candidates = set()
+        while len(candidates) < needed + max(2, needed // 10):
+            candidate = random_hash()
+            if candidate not in self._reserved:
+                candidates.add(candidate)
+
+        clash = Q(variable_hash__in=candidates)
+        if self.project_id is not None:
+            clash |= Q(project_id=self.project_id, variable_name__in=candidates)
+        taken = set()
+        for variable_hash, variable_name in String.objects.filter(clash).values_list('variable_hash', 'variable_name'):
+            taken.update((variable_hash, variable_name))
+
+        self._reserved.update(candidates)
+        self._pool.extend(candidate for candidate in candidates if candidate not in taken)
@@ -0,0 +1,138 @@
+"""
+DB-backed job queue for slow AI calls, with no broker.
+
+submit() records a queued Job and returns at once, so requests never wait
+on the model (a job whose result strings_api.ai has cached is recorded as
+already succeeded). Workers (`manage.py run_jobs`) claim jobs with a conditional
+UPDATE ... WHERE status = 'queued', so a job runs once however many workers
+race for it, then run the task from strings_api.ai and store its result.
+
+Each user has at most AI_JOBS_PER_USER_CONCURRENCY jobs running and
+AI_JOBS_PER_USER_QUEUED active (queued or running); other users' jobs are
+claimed first while someone is at their limit. cancel() stops a queued job
+outright and makes a running one's result be discarded. Jobs left running by
+a worker that died are failed after AI_JOB_TIMEOUT seconds.
+
+A finished job keeps only a digest of large input values (uploaded images),
+and prune_finished_jobs() deletes finished jobs after AI_JOB_RETENTION
+seconds; the run_jobs workers call it periodically.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Queued jobs looked at per claim attempt
+CLAIM_BATCH_SIZE = 20
+# Input strings longer than this are replaced by their digest once a job finishes
+MAX_KEPT_INPUT_LENGTH = 1024
+
+
+class QueueFull(Exception):
+    """The user already has as many active jobs as they are allowed."""
+
+
+def finished_input(input):
+    """A job's input as kept after it finishes: large values become 'sha256:<digest> (<n> chars)'."""
+    return {
+        key: f'sha256:{hashlib.sha256(value.encode()).hexdigest()} ({len(value)} chars)'
+        if isinstance(value, str) and len(value) > MAX_KEPT_INPUT_LENGTH else value
+        for key, value in input.items()
+    }
+
+
+def submit(user, kind, input=None):
+    """
+    Queue a job for one of the tasks in strings_api.ai.TASKS, or record it as
+    succeeded straight away if its result is cached.
+    """
+    from .ai import cached_result
+
+    input = input or {}
+    result = cached_result(kind, user, input)
+    if result is not None:
+        now = timezone.now()
+        return Job.objects.create(
+            user=user, kind=kind, input=finished_input(input), status=Job.SUCCEEDED, result=result, started_at=now, finished_at=now
+        )
+    active = Job.objects.filter(user=user, status__in=Job.ACTIVE).count()
+    if active >= settings.AI_JOBS_PER_USER_QUEUED:
+        raise QueueFull(f'You already have {active} AI requests in progress. Wait for one to finish and try again.')
+    return Job.objects.create(user=user, kind=kind, input=input)
+
+
+def cancel(job):
+    """Cancel a queued or running job; returns False if it had already finished."""
+    return Job.objects.filter(id=job.id, status__in=Job.ACTIVE).update(
+        status=Job.CANCELLED, input=finished_input(job.input), finished_at=timezone.now()
+    ) > 0
+
+
+def fail_lost_jobs():
+    """Fail running jobs whose worker stopped before finishing them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_JOB_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff).update(
+        status=Job.FAILED, error='The request took too long. Please try again.', finished_at=timezone.now()
+    )
+
+
+def prune_finished_jobs():
+    """Delete jobs that finished more than AI_JOB_RETENTION seconds ago; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_JOB_RETENTION)
+    deleted, _ = Job.objects.exclude(status__in=Job.ACTIVE).filter(finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def claim(worker):
+    """Claim the oldest queued job whose user has a free slot, or return None."""
+    busy_users = Job.objects.filter(status=Job.RUNNING).values('user').annotate(
+        running=models.Count('id')
+    ).filter(running__gte=settings.AI_JOBS_PER_USER_CONCURRENCY).values('user')
+    candidates = Job.objects.filter(status=Job.QUEUED).exclude(user__in=busy_users).order_by('created_at', 'id')
+
+    for job_id, user_id in candidates.values_list('id', 'user_id')[:CLAIM_BATCH_SIZE]:
+        if not Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=timezone.now()
+        ):
+            continue  # Another worker got it first
+        # Two workers can claim jobs of one user at the same moment; the one over the limit hands its job back
+        if Job.objects.filter(user_id=user_id, status=Job.RUNNING).count() > settings.AI_JOBS_PER_USER_CONCURRENCY:
+            Job.objects.filter(id=job_id, status=Job.RUNNING, worker=worker).update(
+                status=Job.QUEUED, worker='', started_at=None
+            )
+            continue
+        return Job.objects.select_related('user').get(id=job_id)
+    return None
+
+
+def run(job):
+    """Run a claimed job and store its outcome, unless it was cancelled meanwhile."""
+    from .ai import AIError, TASKS
+
+    result, error = None, ''
+    try:
+        result = TASKS[job.kind](job.user, job.input)
+    except AIError as exc:
+        error = str(exc)
+    except Exception:
+        logger.exception(f'{job.kind} job {job.id} failed')
+        error = 'Something went wrong. Please try again.'
+    # A job cancelled while running keeps its status; the result is dropped
+    Job.objects.filter(id=job.id, status=Job.RUNNING).update(
+        status=Job.FAILED if error else Job.SUCCEEDED, result=result, error=error,
+        input=finished_input(job.input), finished_at=timezone.now(),
+    )
+
+
+def run_next(worker):
+    """Claim and run one job; returns False if there was nothing to run."""
+    job = claim(worker)
+    if job is None:
+        return False
+    run(job)
+    return True
@@ -0,0 +1,58 @@
+import os
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from strings_api.jobs import fail_lost_jobs, prune_finished_jobs, run_next
+from strings_api.models import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Run queued AI jobs with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.AI_JOB_WORKERS,
+                            help='Worker threads; AI calls wait on the network, so threads are enough')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before checking the queue again')
+        parser.add_argument('--once', action='store_true',
+                            help='Run until the queue is empty, then exit')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        def work(name):
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    if not run_next(name):
+                        if options['once']:
+                            return
+                        stop.wait(options['poll_interval'])
+            finally:
+                connection.close()
+
+        fail_lost_jobs()
+        prune_finished_jobs()
+        prune_tombstones()
+        threads = [
+            threading.Thread(target=work, args=(f'{prefix}:{index}',), daemon=True)
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'Running AI jobs with {len(threads)} workers')
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=60)
+                fail_lost_jobs()
+                prune_finished_jobs()
+                prune_tombstones()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping; running jobs finish first')
+            stop.set()
+            for thread in threads:
+                thread.join()
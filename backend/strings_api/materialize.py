@@ -0,0 +1,103 @@
+"""
+Materialized resolution.
+
+Every String stores its fully resolved content in `resolved_content`, together
+with `resolution_digest`, a digest of the resolution's inputs: the string's own
+content and the digest of every string it embeds. When a string changes, it and
+its transitive dependents are recomputed in topological order, each from the
+already-materialized text of its direct embeds, so reading resolved text is a
+plain column read and no reader pays for embed depth.
+
+A string whose digest comes out unchanged is skipped (and not written). The
+few strings caught in, or embedding, a reference cycle are resolved with a
+VariableResolver instead, which leaves the cyclic embed in place as usual.
+"""
+import hashlib
+from .graph import DependencyGraph
+from .metrics import RESOLUTIONS
+from .resolution import RESOLUTION_FIELDS, VariableResolver, embed, tokenize
+
+MATERIALIZED_FIELDS = ('resolved_content', 'resolution_digest')
+MATERIALIZE_BATCH_SIZE = 1000
+
+
+def resolution_digest(content, embeds):
+    """Digest of a template and the (name, digest) of each string it embeds; None for unknown names."""
+    digest = hashlib.sha256((content or '').encode())
+    for name, target_digest in embeds:
+        digest.update(f'\0{name}\0{target_digest or "-"}'.encode())
+    return digest.hexdigest()
+
+
+def materialize(strings, graph, string_ids):
+    """
+    Recompute resolved content for `string_ids`, in topological order.
+
+    `strings` maps id -> String and must hold those strings, their direct
+    embeds, and everything reachable from strings in or embedding a cycle.
+    Changed strings are updated in place and returned; nothing is saved.
+    """
+    cyclic = graph.cyclic(set(graph.dependencies) | set(string_ids))
+    changed = []
+    resolved_count = 0
+    for string_id in graph.topological_order(string_ids):
+        string = strings.get(string_id)
+        if string is None:
+            continue
+
+        if string_id in cyclic:
+            # Resolution inside a cycle depends on where it starts, so resolve from this string alone
+            resolved = VariableResolver(strings.values()).resolve(string)
+            digest = resolution_digest(string.content, [('\0cycle', hashlib.sha256(resolved.encode()).hexdigest())])
+        else:
+            targets = graph.targets[string_id]
+            tokens = tokenize(string.content)
+            embeds = []
+            for name in dict.fromkeys(tokens[1::2]):
+                target = strings.get(targets.get(name))
+                embeds.append((name, target.resolution_digest if target is not None else None))
+            digest = resolution_digest(string.content, embeds)
+            if digest == string.resolution_digest:
+                continue
+            for index in range(1, len(tokens), 2):
+                target = strings.get(targets.get(tokens[index]))
+                tokens[index] = target.resolved_content if target is not None else embed(tokens[index])
+            resolved = ''.join(tokens)
+        resolved_count += 1
+
+        if digest != string.resolution_digest or resolved != string.resolved_content:
+            string.resolved_content = resolved
+            string.resolution_digest = digest
+            changed.append(string)
+    RESOLUTIONS.inc(resolved_count)
+    return changed
+
+
+def refresh_resolved_content(project_id, string_ids):
+    """
+    Re-materialize the given strings and every string that embeds them,
+    directly or transitively. Returns the strings whose resolution changed.
+    """
+    from .models import String
+
+    string_ids = set(string_ids)
+    if not string_ids:
+        return []
+    graph = DependencyGraph.for_project(project_id)
+    affected = string_ids | graph.transitive_dependents(string_ids)
+
+    needed = set(affected)
+    for string_id in affected:
+        needed |= graph.dependencies[string_id]
+    cyclic = graph.cyclic(set(graph.dependencies) | affected) & affected
+    if cyclic:
+        needed |= graph.transitive_dependencies(cyclic)
+
+    strings = {
+        string.id: string
+        for string in String.objects.filter(id__in=needed).only(*RESOLUTION_FIELDS, *MATERIALIZED_FIELDS)
+    }
+    changed = materialize(strings, graph, affected)
+    if changed:
+        String.objects.bulk_update(changed, MATERIALIZED_FIELDS, batch_size=MATERIALIZE_BATCH_SIZE)
+    return changed
@@ -0,0 +1,63 @@
+"""
+Prometheus metrics, served at /metrics.
+
+Request latency is a histogram per route (the URL name: project-detail,
+string-variants, registry, generate-style-guide, ...), recorded by
+strings_api.middleware.MetricsMiddleware. Counters cover variable
+resolutions, cache hits and misses, and OpenAI calls (with a latency
+histogram).
+
+Under gunicorn each worker is its own process with its own counters. Set
+PROMETHEUS_MULTIPROC_DIR to an empty, writable directory and metrics are
+kept in memory-mapped files there, which /metrics aggregates across the
+workers; gunicorn.conf.py clears the directory at startup and drops dead
+workers' gauges. Without it, /metrics shows the serving process only.
+"""
+import hmac
+import os
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# Request latencies span cached 304s to AI submissions and large CSV exports
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+OPENAI_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+REQUEST_LATENCY = Histogram(
+    'strings_http_request_duration_seconds', 'Time to respond to an HTTP request (to the first byte when streamed)',
+    ['route', 'method'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter('strings_http_requests', 'HTTP requests by response status', ['route', 'method', 'status'])
+RESOLUTIONS = Counter('strings_variable_resolutions', 'Strings whose variables were resolved')
+CACHE_REQUESTS = Counter('strings_cache_requests', 'Cache lookups', ['cache', 'result'])
+OPENAI_LATENCY = Histogram(
+    'strings_openai_request_duration_seconds', 'OpenAI API call latency, retries included',
+    ['model'], buckets=OPENAI_BUCKETS,
+)
+OPENAI_ERRORS = Counter('strings_openai_errors', 'Failed OpenAI API calls', ['model', 'error'])
+
+
+def cache_lookup(cache_name, value):
+    """Count a cache lookup as a hit or a miss (None is a miss) and return the value."""
+    CACHE_REQUESTS.labels(cache_name, 'miss' if value is None else 'hit').inc()
+    return value
+
+
+def metrics_view(request):
+    """
+    Metrics in Prometheus text format. Scrapers must send METRICS_TOKEN as a
+    bearer token; with no token configured the endpoint is off (404).
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse('Not Found', status=404, content_type='text/plain')
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
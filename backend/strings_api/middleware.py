@@ -1,28 +1,172 @@
-from django.middleware.csrf import get_token
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.csrf import get_token, rotate_token
+from .metrics import REQUEST_LATENCY, REQUESTS
+from .profiling import RequestProfile, SlowestProfiles, instrument_serializers
+import json
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
+profile_logger = logging.getLogger('strings_api.profiling')
 
 class CSRFRefreshMiddleware:
+    """
+    Keeps API writers' CSRF cookie current without resending it on every
+    write. After a POST/PUT/PATCH under /api/ the token is:
+
+    - rotated if the session changed during the request (and the view didn't
+      already handle the token, as login does);
+    - resent if the request came without the cookie, or if the session's
+      cookie, last sent at the time stamped in the session, is within
+      CSRF_REFRESH_BEFORE_EXPIRY of CSRF_COOKIE_AGE (or was never stamped).
+
+    Otherwise nothing happens, so steady writes cost a lookup in the already
+    loaded session at most. Sending is left to CsrfViewMiddleware (above this
+    one), which sets the cookie with the CSRF_COOKIE_* settings whenever the
+    token was used or rotated. A CSRF_REFRESH_LOG_SAMPLE_RATE share of
+    refreshes is logged.
+    """
+    WRITE_METHODS = ('POST', 'PUT', 'PATCH')
+    SENT_AT = '_csrf_cookie_sent_at'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        response = self.get_response(request)
+
+        if request.method not in self.WRITE_METHODS or not request.path.startswith('/api/'):
+            return response
+        cookie = response.cookies.get(settings.CSRF_COOKIE_NAME)
+        if cookie is not None:
+            # The view sent the cookie (login) or deleted it (logout) itself
+            if cookie.value:
+                self._stamp(session)
+            return response
+
+        if session is not None and session.session_key != session_key:
+            reason = 'session changed'
+        elif settings.CSRF_COOKIE_NAME not in request.COOKIES:
+            reason = 'missing'
+        elif session is not None and session.session_key and self._near_expiry(session):
+            reason = 'near expiry'
+        else:
+            return response
+
+        # The view may have done this already (login rotates the token)
+        if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            if reason == 'session changed':
+                rotate_token(request)
+            else:
+                get_token(request)
+        self._stamp(session)
+        if random.random() < settings.CSRF_REFRESH_LOG_SAMPLE_RATE:
+            logger.info(f'Refreshed CSRF cookie ({reason}) for {request.method} {request.path}')
+        return response
+
+    def _stamp(self, session):
+        # Only existing sessions are stamped; stamping would create one for token-authenticated clients
+        if session is not None and session.session_key:
+            session[self.SENT_AT] = int(time.time())
+
+    def _near_expiry(self, session):
+        if settings.CSRF_COOKIE_AGE is None:
+            # A browser-session cookie: send it once per Django session
+            return self.SENT_AT not in session
+        sent_at = session.get(self.SENT_AT)
+        if sent_at is None:
+            return True
+        return time.time() >= sent_at + settings.CSRF_COOKIE_AGE - settings.CSRF_REFRESH_BEFORE_EXPIRY
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in (PROFILING_ENABLED) per-request profiling: wall time, DB time and
+    query count, repeated query fingerprints, serializer time and response
+    bytes, sent as a Server-Timing header and logged as one JSON line to the
+    'strings_api.profiling' logger. With PROFILING_CPROFILE_DIR set, a
+    PROFILING_CPROFILE_SAMPLE_RATE share of requests also run under cProfile
+    and the PROFILING_CPROFILE_KEEP slowest keep their dumps.
+
+    Sits right after MetricsMiddleware in MIDDLEWARE, so every other
+    middleware is timed too. Only the view's work is measured: queries run
+    while a StreamingHttpResponse body is consumed (CSV export, variants)
+    are not counted, only the streamed bytes are.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_CPROFILE_SAMPLE_RATE
+        self.slowest = None
+        if settings.PROFILING_CPROFILE_DIR:
+            self.slowest = SlowestProfiles(settings.PROFILING_CPROFILE_DIR, settings.PROFILING_CPROFILE_KEEP)
+        instrument_serializers()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        dump = None
+        if self.slowest is not None and random.random() < self.sample_rate:
+            with self.slowest.profile() as profiler, profile.active():
+                response = self.get_response(request)
+            if profiler is not None:
+                dump = self.slowest.offer(profiler, profile.wall_ms, request)
+        else:
+            with profile.active():
+                response = self.get_response(request)
+
+        response['Server-Timing'] = profile.server_timing()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'wall_ms': round(profile.wall_ms, 1),
+            'db_ms': round(profile.db_ms, 1),
+            'queries': profile.queries,
+            'duplicate_queries': profile.duplicates(),
+            'serializer_ms': round(profile.serializer_ms, 1),
+            'response_bytes': None if response.streaming else len(response.content),
+            'profile': dump,
+        }
+        if response.streaming:
+            # Headers go out before the body, so streamed sizes are only known (and logged) at the end
+            response.streaming_content = self._count_streamed(response.streaming_content, record)
+        else:
+            profile_logger.info(json.dumps(record))
+        return response
+
+    def _count_streamed(self, content, record):
+        record['response_bytes'] = 0
+        try:
+            for chunk in content:
+                record['response_bytes'] += len(chunk)
+                yield chunk
+        finally:
+            profile_logger.info(json.dumps(record))
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and status per route in strings_api.metrics,
+    unless METRICS_ENABLED is off. Routes are URL names, so ids in paths
+    don't multiply the series; unmatched paths share one label.
+    """
+
     def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
         self.get_response = get_response
 
     def __call__(self, request):
+        started = time.perf_counter()
         response = self.get_response(request)
-        
-        # For POST, PUT, PATCH requests, refresh the CSRF token
-        if request.method in ('POST', 'PUT', 'PATCH') and request.path.startswith('/api/'):
-            csrf_token = get_token(request)
-            logger.info(f'Refreshing CSRF token. New token length: {len(csrf_token)}')
-            
-            # Set the CSRF token in the cookie
-            response.set_cookie(
-                'csrftoken',
-                csrf_token,
-                domain='localhost',
-                samesite='Lax',
-                secure=False,  # Set to True in production with HTTPS
-                httponly=False  # CSRF token must be accessible to JavaScript
-            )
-            
-        return response 
\ No newline at end of file
+        route = getattr(request.resolver_match, 'view_name', None) or 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        return response
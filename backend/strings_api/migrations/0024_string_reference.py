@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-18 09:38
+
+import re
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_string_references(apps, schema_editor):
+    """Build dependency graph edges for every existing string"""
+    String = apps.get_model('strings_api', 'String')
+    StringReference = apps.get_model('strings_api', 'StringReference')
+    variable_pattern = re.compile(r'{{([^}]+)}}')
+    
+    strings_by_project = {}
+    for string_obj in String.objects.order_by('-created_at'):
+        strings_by_project.setdefault(string_obj.project_id, []).append(string_obj)
+    
+    for project_id, strings in strings_by_project.items():
+        # Newest string wins on a name clash, matching the resolver's lookup
+        lookup = {}
+        for string_obj in strings:
+            for key in (string_obj.variable_name, string_obj.variable_hash):
+                if key:
+                    lookup.setdefault(key, string_obj.id)
+        
+        edges = []
+        for string_obj in strings:
+            names = {name for name in variable_pattern.findall(string_obj.content or '') if len(name) <= 255}
+            for name in names:
+                edges.append(StringReference(
+                    project_id=project_id,
+                    source_id=string_obj.id,
+                    target_id=lookup.get(name),
+                    name=name,
+                ))
+        StringReference.objects.bulk_create(edges, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0023_add_user_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='string',
+            name='variable_hash',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.CreateModel(
+            name='StringReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='string_references', to='strings_api.project')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='references', to='strings_api.string')),
+                ('target', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='referenced_by', to='strings_api.string')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'name'], name='strings_api_project_d75748_idx')],
+                'unique_together': {('source', 'name')},
+            },
+        ),
+        migrations.RunPython(build_string_references, migrations.RunPython.noop),
+    ]
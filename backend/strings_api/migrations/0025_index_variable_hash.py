@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0024_string_reference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='string',
+            name='variable_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+    ]
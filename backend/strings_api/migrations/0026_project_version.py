@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0025_index_variable_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+    ]
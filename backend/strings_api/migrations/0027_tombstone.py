@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0026_project_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='strings_api.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'deleted_at'], name='strings_api_project_2bc2ff_idx')],
+            },
+        ),
+    ]
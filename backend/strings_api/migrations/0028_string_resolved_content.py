@@ -0,0 +1,135 @@
+# Generated by Django 5.2 on 2026-10-18 09:59
+
+import hashlib
+import re
+from collections import defaultdict, deque
+from django.db import migrations, models
+
+
+# The backfill is a frozen copy of strings_api.materialize (and the parts of
+# graph and resolution it uses) as of this migration, so later changes to those
+# modules can't break it. Digests must match what materialize() computes.
+VARIABLE_PATTERN = re.compile(r'{{([^}]+)}}')
+BATCH_SIZE = 1000
+
+
+def resolution_digest(content, embeds):
+    digest = hashlib.sha256((content or '').encode())
+    for name, target_digest in embeds:
+        digest.update(f'\0{name}\0{target_digest or "-"}'.encode())
+    return digest.hexdigest()
+
+
+def topological_order(nodes, dependencies, dependents):
+    """Kahn's algorithm; returns the ordered ids and the ids caught in or embedding a cycle."""
+    pending = {node: len(dependencies[node] & nodes) for node in nodes}
+    queue = deque(sorted(node for node, count in pending.items() if count == 0))
+    order = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for dependent in sorted(dependents[node] & nodes):
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                queue.append(dependent)
+    cyclic = nodes.difference(order)
+    return order + sorted(cyclic), cyclic
+
+
+def resolve_alone(root, strings, by_name):
+    """Resolve one string from scratch, leaving embeds that recurse as {{name}}."""
+    resolved = {}
+    active = set()
+    stack = [(root.id, False)]
+    while stack:
+        string_id, expanded = stack.pop()
+        if string_id in resolved:
+            continue
+        tokens = VARIABLE_PATTERN.split(strings[string_id].content or '')
+        if expanded:
+            parts = []
+            for index, token in enumerate(tokens):
+                target = by_name.get(token) if index % 2 else None
+                if index % 2 == 0:
+                    parts.append(token)
+                elif target is not None and target.id in resolved:
+                    parts.append(resolved[target.id])
+                else:
+                    parts.append(f'{{{{{token}}}}}')
+            resolved[string_id] = ''.join(parts)
+            active.discard(string_id)
+            continue
+        active.add(string_id)
+        stack.append((string_id, True))
+        for name in tokens[1::2]:
+            target = by_name.get(name)
+            if target is not None and target.id not in resolved and target.id not in active:
+                stack.append((target.id, False))
+    return resolved[root.id]
+
+
+def materialize_resolved_content(apps, schema_editor):
+    """Fill resolved_content and resolution_digest for every existing string, one project at a time"""
+    String = apps.get_model('strings_api', 'String')
+    StringReference = apps.get_model('strings_api', 'StringReference')
+    
+    for project_id in String.objects.order_by().values_list('project_id', flat=True).distinct():
+        strings = {string_obj.id: string_obj for string_obj in String.objects.filter(project_id=project_id).order_by('-created_at')}
+        by_name = {}
+        for string_obj in strings.values():
+            for key in (string_obj.variable_name, string_obj.variable_hash):
+                if key:
+                    by_name.setdefault(key, string_obj)
+        
+        dependencies, dependents, targets = defaultdict(set), defaultdict(set), defaultdict(dict)
+        for source_id, target_id, name in StringReference.objects.filter(project_id=project_id).values_list('source_id', 'target_id', 'name'):
+            targets[source_id][name] = target_id
+            if target_id is not None:
+                dependencies[source_id].add(target_id)
+                dependents[target_id].add(source_id)
+        order, cyclic = topological_order(set(dependencies) | set(strings), dependencies, dependents)
+        
+        changed = []
+        for string_id in order:
+            string_obj = strings.get(string_id)
+            if string_obj is None:
+                continue
+            if string_id in cyclic:
+                resolved = resolve_alone(string_obj, strings, by_name)
+                digest = resolution_digest(string_obj.content, [('\0cycle', hashlib.sha256(resolved.encode()).hexdigest())])
+            else:
+                tokens = VARIABLE_PATTERN.split(string_obj.content or '')
+                embeds = []
+                for name in dict.fromkeys(tokens[1::2]):
+                    target = strings.get(targets[string_id].get(name))
+                    embeds.append((name, target.resolution_digest if target is not None else None))
+                digest = resolution_digest(string_obj.content, embeds)
+                for index in range(1, len(tokens), 2):
+                    target = strings.get(targets[string_id].get(tokens[index]))
+                    tokens[index] = target.resolved_content if target is not None else f'{{{{{tokens[index]}}}}}'
+                resolved = ''.join(tokens)
+            string_obj.resolved_content = resolved
+            string_obj.resolution_digest = digest
+            changed.append(string_obj)
+        String.objects.bulk_update(changed, ['resolved_content', 'resolution_digest'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0027_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='string',
+            name='resolution_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='string',
+            name='resolved_content',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(materialize_resolved_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2 on 2026-10-18 11:02
+
+from django.db import migrations
+
+
+# The index SQL lives here rather than in strings_api.search, so later changes
+# to that module can't alter what this migration does.
+POSTGRES_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    "CREATE INDEX IF NOT EXISTS strings_api_string_search_idx ON strings_api_string USING gin "
+    "(to_tsvector('simple', coalesce(display_name, '') || ' ' || variable_hash || ' ' || content))",
+    'CREATE INDEX IF NOT EXISTS strings_api_string_hash_trgm_idx ON strings_api_string USING gin '
+    '(UPPER(variable_hash) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS strings_api_string_display_name_trgm_idx ON strings_api_string USING gin '
+    '(UPPER(display_name) gin_trgm_ops)',
+]
+
+POSTGRES_REMOVE = [
+    'DROP INDEX IF EXISTS strings_api_string_search_idx',
+    'DROP INDEX IF EXISTS strings_api_string_hash_trgm_idx',
+    'DROP INDEX IF EXISTS strings_api_string_display_name_trgm_idx',
+]
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS strings_api_string_fts USING fts5("
+    "display_name, variable_hash, content, content='strings_api_string', content_rowid='id', tokenize='unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS strings_api_string_trigram USING fts5("
+    "display_name, variable_hash, content='strings_api_string', content_rowid='id', tokenize='trigram')",
+    """
+    CREATE TRIGGER IF NOT EXISTS strings_api_string_search_insert AFTER INSERT ON strings_api_string BEGIN
+        INSERT INTO strings_api_string_fts(rowid, display_name, variable_hash, content)
+            VALUES (new.id, new.display_name, new.variable_hash, new.content);
+        INSERT INTO strings_api_string_trigram(rowid, display_name, variable_hash)
+            VALUES (new.id, new.display_name, new.variable_hash);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS strings_api_string_search_delete AFTER DELETE ON strings_api_string BEGIN
+        INSERT INTO strings_api_string_fts(strings_api_string_fts, rowid, display_name, variable_hash, content)
+            VALUES ('delete', old.id, old.display_name, old.variable_hash, old.content);
+        INSERT INTO strings_api_string_trigram(strings_api_string_trigram, rowid, display_name, variable_hash)
+            VALUES ('delete', old.id, old.display_name, old.variable_hash);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS strings_api_string_search_update
+    AFTER UPDATE OF display_name, variable_hash, content ON strings_api_string BEGIN
+        INSERT INTO strings_api_string_fts(strings_api_string_fts, rowid, display_name, variable_hash, content)
+            VALUES ('delete', old.id, old.display_name, old.variable_hash, old.content);
+        INSERT INTO strings_api_string_trigram(strings_api_string_trigram, rowid, display_name, variable_hash)
+            VALUES ('delete', old.id, old.display_name, old.variable_hash);
+        INSERT INTO strings_api_string_fts(rowid, display_name, variable_hash, content)
+            VALUES (new.id, new.display_name, new.variable_hash, new.content);
+        INSERT INTO strings_api_string_trigram(rowid, display_name, variable_hash)
+            VALUES (new.id, new.display_name, new.variable_hash);
+    END
+    """,
+    # Index whatever is already in the table
+    "INSERT INTO strings_api_string_fts(strings_api_string_fts) VALUES ('rebuild')",
+    "INSERT INTO strings_api_string_trigram(strings_api_string_trigram) VALUES ('rebuild')",
+]
+
+SQLITE_REMOVE = [
+    'DROP TRIGGER IF EXISTS strings_api_string_search_insert',
+    'DROP TRIGGER IF EXISTS strings_api_string_search_delete',
+    'DROP TRIGGER IF EXISTS strings_api_string_search_update',
+    'DROP TABLE IF EXISTS strings_api_string_fts',
+    'DROP TABLE IF EXISTS strings_api_string_trigram',
+]
+
+
+def install_search_index(apps, schema_editor):
+    """FTS5 tables and triggers on SQLite, tsvector and trigram GIN indexes on PostgreSQL"""
+    statements = {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def remove_search_index(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_REMOVE, 'sqlite': SQLITE_REMOVE}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0028_string_resolved_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
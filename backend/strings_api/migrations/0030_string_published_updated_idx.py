@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strings_api', '0029_string_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='string',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['updated_at', 'id'], name='string_published_updated_idx'),
+        ),
+    ]
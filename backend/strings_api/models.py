@@ -1,11 +1,17 @@
+import logging
 import re
-import secrets
-import string
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import pre_save, post_save
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from slugify import slugify
+from .hashing import SINGLE_BATCH_SIZE, HashAllocator
+
+logger = logging.getLogger(__name__)
 
 class UserProfile(models.Model):
     """Extended user profile for storing user settings like API keys"""
@@ -24,16 +30,37 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects')
+    # Advanced on every change to the project or anything in it; drives ETags
+    version = models.PositiveBigIntegerField(default=1)
+
+    def save(self, *args, **kwargs):
+        # version only moves through bump_project_version(), so never write back a stale copy of it
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version'
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+
+def bump_project_version(**lookup):
+    """
+    Advance the version of the project(s) matching `lookup` with a single
+    UPDATE, e.g. bump_project_version(pk=project_id) or
+    bump_project_version(dimensions=dimension_id).
+    """
+    Project.objects.filter(**lookup).update(version=F('version') + 1)
+
+
 class String(models.Model):
     content = models.TextField(blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='strings')
     # Every string is now automatically a variable with either a hash or custom name
     variable_name = models.CharField(max_length=100, blank=True, null=True)
-    variable_hash = models.CharField(max_length=50, blank=True)  # User-editable identifier
+    variable_hash = models.CharField(max_length=50, blank=True, db_index=True)  # User-editable identifier
     # Human-readable display name (optional, separate from identifier)
     display_name = models.CharField(max_length=200, blank=True, null=True)
     is_conditional = models.BooleanField(default=False)
@@ -43,12 +70,29 @@ class String(models.Model):
     controlled_by_spawn = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='controls_spawns')
     # Publishing: whether this string appears in the organization registry
     is_published = models.BooleanField(default=False)
+    # Content with every {{variable}} embed resolved, kept current by strings_api.materialize
+    resolved_content = models.TextField(blank=True, default='')
+    resolution_digest = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['variable_name', 'project']
         ordering = ['-created_at']  # Newest first by default
+        indexes = [
+            # Keyset for the registry's (updated_at, id) cursor pagination
+            models.Index(fields=['updated_at', 'id'], name='string_published_updated_idx', condition=models.Q(is_published=True)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored names and content so renames and edits can be detected without re-fetching
+        if 'variable_name' in field_names and 'variable_hash' in field_names:
+            instance._loaded_variable_names = (instance.variable_name, instance.variable_hash)
+        if 'content' in field_names:
+            instance._loaded_content = instance.content
+        return instance
 
     def save(self, *args, **kwargs):
         # Generate variable_hash if not provided (primary identifier)
@@ -58,8 +102,11 @@ class String(models.Model):
         # Keep variable_name in sync with variable_hash for backward compatibility
         # (variable_name is deprecated, but we keep it for existing references)
         self.variable_name = self.variable_hash
-            
-        super().save(*args, **kwargs)
+        
+        # The post_save receivers rewrite renamed embeds, sync the dependency graph, re-materialize
+        # resolved_content and bump the project version: all of it commits with the row or not at all
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def generate_unique_slug(self, base_slug):
         """Generate a unique slug from the base slug, adding numbers if needed"""
@@ -79,18 +126,7 @@ class String(models.Model):
 
     def generate_unique_hash(self):
         """Generate a unique 6-character random hash for this string"""
-        while True:
-            # Generate 6-character hash using uppercase letters and numbers
-            hash_chars = string.ascii_uppercase + string.digits
-            new_hash = ''.join(secrets.choice(hash_chars) for _ in range(6))
-            
-            # Check if hash is unique for both variable_hash (globally) 
-            # AND variable_name within this project (since the hash may be used as variable_name)
-            hash_unique = not String.objects.filter(variable_hash=new_hash).exists()
-            name_unique = not String.objects.filter(project=self.project, variable_name=new_hash).exists()
-            
-            if hash_unique and name_unique:
-                return new_hash
+        return HashAllocator(project_id=self.project_id, batch_size=SINGLE_BATCH_SIZE).next()
 
     @property
     def effective_variable_name(self):
@@ -126,6 +162,24 @@ class DimensionValue(models.Model):
     def __str__(self):
         return f"{self.dimension.name}: {self.value}"
 
+class StringReference(models.Model):
+    """
+    Dependency graph edge: `source` embeds `{{name}}`, which resolves to `target`.
+    Embeds of variables that don't exist keep an empty target until a string
+    with that name is created.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='string_references')
+    source = models.ForeignKey(String, on_delete=models.CASCADE, related_name='references')
+    target = models.ForeignKey(String, on_delete=models.SET_NULL, null=True, blank=True, related_name='referenced_by')
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ['source', 'name']
+        indexes = [models.Index(fields=['project', 'name'])]
+
+    def __str__(self):
+        return f"{self.source_id} -> {{{{{self.name}}}}}"
+
 class StringDimensionValue(models.Model):
     string = models.ForeignKey(String, on_delete=models.CASCADE, related_name='dimension_values')
     dimension_value = models.ForeignKey(DimensionValue, on_delete=models.CASCADE, related_name='string_assignments')
@@ -138,20 +192,102 @@ class StringDimensionValue(models.Model):
         return f"{self.string.content[:30]}... -> {self.dimension_value}"
 
 
+class Tombstone(models.Model):
+    """
+    Record of a deleted string, dimension, dimension value or assignment, so
+    clients syncing through /api/projects/<id>/changes/ learn about deletes.
+    Rows removed by a cascade are implied by their parent's tombstone and not
+    recorded: a deleted string takes its assignments with it, a deleted
+    dimension its values and their assignments.
+    """
+    STRING = 'string'
+    DIMENSION = 'dimension'
+    DIMENSION_VALUE = 'dimension_value'
+    STRING_DIMENSION_VALUE = 'string_dimension_value'
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tombstones')
+    model = models.CharField(max_length=32)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['project', 'deleted_at'])]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at {self.deleted_at}"
+
+
+def tombstone_cutoff():
+    """Tombstones older than this are pruned, so sync tokens from before it can't be answered with a delta."""
+    return timezone.now() - timedelta(seconds=settings.PROJECT_CHANGES_RETENTION)
+
+
+def prune_tombstones():
+    """Delete tombstones older than PROJECT_CHANGES_RETENTION seconds; returns how many."""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=tombstone_cutoff()).delete()
+    return deleted
+
+
+class Job(models.Model):
+    """
+    A slow task (an OpenAI call) submitted by a request and run later by a
+    `manage.py run_jobs` worker; see strings_api.jobs. Clients poll
+    /api/jobs/<id>/ for the status and result.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [(status, status) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED)]
+    ACTIVE = (QUEUED, RUNNING)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=32)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    input = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at']), models.Index(fields=['user', 'status'])]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+
 # Signal to track old variable name for rename handling
 @receiver(pre_save, sender=String)
 def track_old_variable_name(sender, instance, **kwargs):
     """
-    Track the old variable name before save to handle renames.
+    Track the old variable name before save to handle renames, and whether
+    anything resolution depends on (content or names) changed.
+    Uses the names and content recorded when the instance was loaded, so the
+    database is only consulted for instances that weren't loaded with them.
     """
-    if instance.pk:  # Only for existing instances (updates)
-        try:
-            old_instance = String.objects.get(pk=instance.pk)
-            instance._old_effective_variable_name = old_instance.effective_variable_name
-        except String.DoesNotExist:
-            instance._old_effective_variable_name = None
-    else:
-        instance._old_effective_variable_name = None
+    instance._old_effective_variable_name = None
+    instance._resolution_inputs_changed = True
+    if not instance.pk:  # Only for existing instances (updates)
+        return
+    
+    loaded_names = getattr(instance, '_loaded_variable_names', None)
+    loaded_content = getattr(instance, '_loaded_content', None)
+    if loaded_names is None or not hasattr(instance, '_loaded_content'):
+        row = String.objects.filter(pk=instance.pk).values_list('variable_name', 'variable_hash', 'content').first()
+        if row is None:
+            return
+        loaded_names, loaded_content = row[:2], row[2]
+    
+    old_variable_name, old_variable_hash = loaded_names
+    instance._old_effective_variable_name = old_variable_name or old_variable_hash
+    instance._resolution_inputs_changed = (
+        loaded_content != instance.content
+        or tuple(loaded_names) != (instance.variable_name, instance.variable_hash)
+    )
 
 
 @receiver(post_save, sender=String)
@@ -163,17 +299,172 @@ def update_variable_references_on_rename(sender, instance, **kwargs):
     new_name = instance.effective_variable_name
     
     if old_name and old_name != new_name:
-        # Variable was renamed, update all content that references the old name
-        old_reference = f'{{{{{old_name}}}}}'
-        new_reference = f'{{{{{new_name}}}}}'
-        
-        for string in instance.project.strings.all():
-            if string.id == instance.id:
-                continue  # Skip self
-            
-            if old_reference in string.content:
-                # Update the content to use the new variable name
-                new_content = string.content.replace(old_reference, new_reference)
-                # Use update() to avoid triggering signals again
-                String.objects.filter(id=string.id).update(content=new_content)
-                print(f"Updated variable reference in string {string.id}: {old_name} -> {new_name}")
+        from .graph import propagate_rename
+        updated_ids = propagate_rename(instance, old_name, new_name)
+        logger.info(f"Updated variable references in {len(updated_ids)} strings: {old_name} -> {new_name}")
+    
+    # The saved names are what the next save compares against
+    instance._loaded_variable_names = (instance.variable_name, instance.variable_hash)
+
+
+@receiver(post_save, sender=String)
+def update_string_references(sender, instance, created, **kwargs):
+    """
+    Keep the dependency graph in step with the string's content and name.
+    """
+    from .graph import sync_references, link_dangling_references
+    
+    if not getattr(instance, '_resolution_inputs_changed', True):
+        return
+    sync_references([instance])
+    
+    old_name = getattr(instance, '_old_effective_variable_name', None)
+    if created or old_name != instance.effective_variable_name:
+        # Embeds written before this name existed now resolve to this string
+        link_dangling_references([instance])
+
+
+@receiver(post_save, sender=String)
+def refresh_resolved_content_on_save(sender, instance, **kwargs):
+    """
+    Re-materialize the string and everything embedding it. Runs after
+    update_string_references so the dependency graph is already current.
+    Saves that change neither content nor names (display name, publish flag)
+    leave resolution as it is.
+    """
+    from .materialize import refresh_resolved_content
+    
+    changed = getattr(instance, '_resolution_inputs_changed', True)
+    instance._loaded_content = instance.content
+    if not changed:
+        return
+    for string in refresh_resolved_content(instance.project_id, [instance.id]):
+        if string.id == instance.id:
+            instance.resolved_content = string.resolved_content
+            instance.resolution_digest = string.resolution_digest
+
+
+def _deleted_directly(sender, origin):
+    """False when the row goes as part of a cascade from another model (e.g. its project being deleted)."""
+    if origin is None:
+        return True
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    return origin_model is sender
+
+
+@receiver(pre_delete, sender=String)
+def remember_dependents_on_delete(sender, instance, origin=None, **kwargs):
+    """Capture who embeds the string before its edges lose their target."""
+    if _deleted_directly(sender, origin):
+        instance._dependent_ids = list(
+            StringReference.objects.filter(target=instance).values_list('source_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=String)
+def refresh_resolved_content_on_delete(sender, instance, **kwargs):
+    """Embeds of a deleted string fall back to the literal {{name}} in its dependents."""
+    dependent_ids = getattr(instance, '_dependent_ids', None)
+    if dependent_ids:
+        from .materialize import refresh_resolved_content
+        refresh_resolved_content(instance.project_id, dependent_ids)
+
+
+# Project versioning: any write to a project or its contents advances Project.version
+VERSIONED_MODELS = {
+    String: lambda string: {'pk': string.project_id},
+    Dimension: lambda dimension: {'pk': dimension.project_id},
+    DimensionValue: lambda value: {'dimensions': value.dimension_id},
+    StringDimensionValue: lambda assignment: {'strings': assignment.string_id},
+}
+
+
+@receiver(post_save, sender=Project)
+def bump_version_on_project_save(sender, instance, created, **kwargs):
+    if not created:
+        bump_project_version(pk=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=String)
+@receiver([post_save, post_delete], sender=Dimension)
+@receiver([post_save, post_delete], sender=DimensionValue)
+@receiver([post_save, post_delete], sender=StringDimensionValue)
+def bump_version_on_change(sender, instance, origin=None, **kwargs):
+    """
+    Bump the owning project's version after a save or delete. A cascading or
+    queryset delete sends one signal per row, so it only bumps once, and not
+    at all when the project itself (or its owner) is what is being deleted.
+    """
+    if origin is not None:
+        origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+        if origin_model not in VERSIONED_MODELS or getattr(origin, '_project_version_bumped', False):
+            return
+        origin._project_version_bumped = True
+    bump_project_version(**VERSIONED_MODELS[sender](instance))
+
+
+
+TOMBSTONE_KINDS = {
+    String: (Tombstone.STRING, lambda string: string.project_id),
+    Dimension: (Tombstone.DIMENSION, lambda dimension: dimension.project_id),
+    DimensionValue: (Tombstone.DIMENSION_VALUE, lambda value: value.dimension.project_id),
+    StringDimensionValue: (Tombstone.STRING_DIMENSION_VALUE, lambda assignment: assignment.string.project_id),
+}
+
+
+def _loaded_project_id(instance, relation):
+    """The project id through `relation` if that row is already loaded, else None (no query)."""
+    if not instance._meta.get_field(relation).is_cached(instance):
+        return None
+    return getattr(instance, relation).project_id
+
+
+# The project whose snapshot a row's save or delete drops, when known without a query
+SNAPSHOT_PROJECT_IDS = {
+    String: lambda string: string.project_id,
+    Dimension: lambda dimension: dimension.project_id,
+    DimensionValue: lambda value: _loaded_project_id(value, 'dimension'),
+    StringDimensionValue: lambda assignment: _loaded_project_id(assignment, 'string'),
+}
+
+
+# Project snapshots (strings_api.snapshots) are dropped as soon as their project changes;
+# writes that skip signals are still caught by the version in the snapshot's stamp
+@receiver([post_save, post_delete], sender=Project)
+def drop_snapshot_on_project_change(sender, instance, **kwargs):
+    from .snapshots import invalidate
+    invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=String)
+@receiver([post_save, post_delete], sender=Dimension)
+@receiver([post_save, post_delete], sender=DimensionValue)
+@receiver([post_save, post_delete], sender=StringDimensionValue)
+def drop_snapshot_on_change(sender, instance, origin=None, **kwargs):
+    """
+    Like the version bump, a cascading or queryset delete only drops the
+    snapshot once. Dimension values and assignments whose parent row isn't
+    loaded leave it in place: the version bump already keeps it from being
+    served, and the next read replaces it.
+    """
+    if origin is not None:
+        origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+        if origin_model not in VERSIONED_MODELS or getattr(origin, '_project_snapshot_dropped', False):
+            return
+        origin._project_snapshot_dropped = True
+    project_id = SNAPSHOT_PROJECT_IDS[sender](instance)
+    if project_id is not None:
+        from .snapshots import invalidate
+        invalidate(project_id)
+
+
+@receiver(post_delete, sender=String)
+@receiver(post_delete, sender=Dimension)
+@receiver(post_delete, sender=DimensionValue)
+@receiver(post_delete, sender=StringDimensionValue)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    """Leave a tombstone for rows deleted directly (not through a cascade from another model)."""
+    if not _deleted_directly(sender, origin):
+        return
+    kind, project_id = TOMBSTONE_KINDS[sender]
+    Tombstone.objects.create(project_id=project_id(instance), model=kind, object_id=instance.pk)
@@ -0,0 +1,107 @@
+"""
+Process-wide OpenAI clients, reused across AI jobs.
+
+Building an OpenAI client builds its own HTTP client, so a client per call
+pays for a new TCP connection and TLS handshake every time. Instead:
+
+- every OpenAI client shares one HTTP client, whose keep-alive pool is reused
+  by all API keys (the key is a per-request header, not part of the connection);
+- clients are cached per API key, least recently used evicted past
+  OPENAI_CLIENT_CACHE_SIZE, and rebuilt after OPENAI_CLIENT_TTL seconds so a
+  rotated key's client doesn't linger;
+- timeouts, retries and pool limits come from the OPENAI_* settings.
+
+Workers are threads, so the cache is locked; the HTTP client is thread-safe.
+openai builds on httpx2 but doesn't re-export its Limits, hence the direct
+dependency in requirements.txt.
+"""
+import threading
+import time
+from collections import OrderedDict
+import httpx2
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from openai import DefaultHttpxClient, OpenAI, Timeout
+
+
+class ClientPool:
+    """LRU + TTL cache of OpenAI clients by API key, over one shared HTTP client."""
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._clients = OrderedDict()  # api key -> (client, expires at)
+        self._lock = threading.Lock()
+        self.http_client = DefaultHttpxClient(
+            timeout=_timeout(),
+            limits=httpx2.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    def get(self, api_key):
+        """The cached client for an API key, built if missing or expired."""
+        now = self._clock()
+        with self._lock:
+            cached = self._clients.get(api_key)
+            if cached is not None and cached[1] > now:
+                self._clients.move_to_end(api_key)
+                return cached[0]
+            client = OpenAI(
+                api_key=api_key,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=_timeout(),
+                max_retries=settings.OPENAI_MAX_RETRIES,
+                http_client=self.http_client,
+            )
+            self._clients[api_key] = (client, now + self.ttl)
+            self._clients.move_to_end(api_key)
+            while len(self._clients) > self.max_size:
+                # Evicted clients only drop their reference; the shared HTTP client stays open
+                self._clients.popitem(last=False)
+            return client
+
+    def __len__(self):
+        return len(self._clients)
+
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+            self.http_client.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def client_for(api_key):
+    """The process-wide OpenAI client for an API key."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ClientPool(settings.OPENAI_CLIENT_CACHE_SIZE, settings.OPENAI_CLIENT_TTL)
+    return _pool.get(api_key)
+
+
+def reset():
+    """Close the process-wide pool; the next client_for() builds a new one from the current settings."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('OPENAI_'):
+        reset()
+
+
+def _timeout():
+    return Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
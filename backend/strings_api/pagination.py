@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProjectCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the project list, newest projects first.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class RegistryCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the registry, most recently updated first. The
+    (updated_at, id) keyset is served by the published strings index.
+    """
+    ordering = ('-updated_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
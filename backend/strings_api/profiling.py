@@ -0,0 +1,175 @@
+"""
+Per-request profiling, used by strings_api.middleware.ProfilingMiddleware.
+
+A RequestProfile collects, for one request: wall time, time spent in the
+database and the number of queries (through connection.execute_wrapper, so
+raw cursors count too), queries run more than once with the same SQL, time
+spent producing serializer data, and response size.
+
+Repeated queries are grouped by fingerprint: the SQL with its parameters
+left out (they are placeholders already), IN lists collapsed and whitespace
+normalised, so the 50 "SELECT ... WHERE id = %s" of an N+1 are one entry
+with a count of 50.
+
+SlowestProfiles keeps cProfile dumps for the slowest requests seen by the
+process, deleting a dump once enough slower requests have replaced it.
+"""
+import contextvars
+import cProfile
+import hashlib
+import heapq
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+# Repeated queries reported per request
+DUPLICATE_LIMIT = 5
+# Characters of a repeated query's SQL kept in the log
+SQL_SAMPLE_LENGTH = 300
+
+IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+|\'[^\']*\')\s*,?)+\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+_current = contextvars.ContextVar('strings_api_request_profile', default=None)
+
+
+def fingerprint(sql):
+    """A short id for a query's shape, the same for every set of parameters."""
+    normalized = WHITESPACE.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.serializer_ms = 0.0
+        self._serializer_depth = 0
+        self._fingerprints = {}  # fingerprint -> [count, normalized sql]
+
+    @contextmanager
+    def active(self):
+        """Record the queries and serializer work done inside the block."""
+        token = _current.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self._record_query))
+                yield self
+        finally:
+            _current.reset(token)
+            self.wall_ms = (time.perf_counter() - self.started) * 1000
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.queries += 1
+            key, normalized = fingerprint(sql)
+            entry = self._fingerprints.setdefault(key, [0, normalized])
+            entry[0] += 1
+
+    def duplicates(self):
+        """The most repeated queries: [{'fingerprint', 'count', 'sql'}], most frequent first."""
+        repeated = [(count, key, sql) for key, (count, sql) in self._fingerprints.items() if count > 1]
+        return [
+            {'fingerprint': key, 'count': count, 'sql': sql[:SQL_SAMPLE_LENGTH]}
+            for count, key, sql in sorted(repeated, key=lambda item: -item[0])[:DUPLICATE_LIMIT]
+        ]
+
+    def server_timing(self):
+        """A Server-Timing header value; browsers show it in the network panel."""
+        metrics = [
+            f'total;dur={self.wall_ms:.1f}',
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serializer_ms:.1f}',
+        ]
+        duplicates = self.duplicates()
+        if duplicates:
+            metrics.append(f'dup;desc="{duplicates[0]["count"]}x {duplicates[0]["fingerprint"]}"')
+        return ', '.join(metrics)
+
+
+def instrument_serializers():
+    """
+    Time serializer .data (where to_representation runs) for the active
+    profile. Only the outermost .data counts, so nested serializers aren't
+    counted twice. Without an active profile this is one context var lookup.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, 'profiled', False):
+        return
+
+    def data(serializer):
+        profile = _current.get()
+        if profile is None:
+            return original.fget(serializer)
+        profile._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(serializer)
+        finally:
+            profile._serializer_depth -= 1
+            if not profile._serializer_depth:
+                profile.serializer_ms += (time.perf_counter() - started) * 1000
+
+    data.profiled = True
+    BaseSerializer.data = property(data)
+
+
+class SlowestProfiles:
+    """
+    cProfile dumps of the `keep` slowest profiled requests, in `directory`.
+    Only one request is profiled at a time; the others run unprofiled.
+    """
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self._slowest = []  # min-heap of (wall ms, path)
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self):
+        """Yields a cProfile.Profile running for the block, or None if another request holds the profiler."""
+        if not self._profiling.acquire(blocking=False):
+            yield None
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield profiler
+            finally:
+                profiler.disable()
+        finally:
+            self._profiling.release()
+
+    def offer(self, profiler, wall_ms, request):
+        """Write the dump if the request is among the slowest; returns its path or None."""
+        with self._lock:
+            if len(self._slowest) >= self.keep and wall_ms <= self._slowest[0][0]:
+                return None
+            slug = re.sub(r'[^\w]+', '-', request.path).strip('-') or 'root'
+            path = os.path.join(self.directory, f'{wall_ms:010.1f}ms-{request.method}-{slug}-{time.time_ns()}.prof')
+            profiler.dump_stats(path)
+            heapq.heappush(self._slowest, (wall_ms, path))
+            if len(self._slowest) > self.keep:
+                _, evicted = heapq.heappop(self._slowest)
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+            return path
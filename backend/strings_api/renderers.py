@@ -0,0 +1,24 @@
+"""
+Renderers for the columnar project payload (see strings_api.columnar).
+ProjectViewSet offers them on retrieve only, selected with ?format= or the
+Accept header.
+"""
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.strings.columnar+json'
+    format = 'columnar'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
@@ -0,0 +1,143 @@
+"""
+Variable resolution engine.
+
+Resolves ``{{variable}}`` embeds for a whole project in one pass: the project's
+strings are loaded once into a name/hash lookup table, every template is
+tokenized once, and resolved subresults are memoized so an embed shared by many
+strings is only expanded a single time.
+"""
+import re
+from collections import defaultdict
+from .metrics import RESOLUTIONS
+
+VARIABLE_PATTERN = re.compile(r'{{([^}]+)}}')
+
+# Columns the resolver needs; use with .only() to keep project loads cheap
+RESOLUTION_FIELDS = ('id', 'project_id', 'content', 'variable_name', 'variable_hash')
+
+
+def extract_variable_names(content):
+    """Return the variable names embedded in content, in order of appearance."""
+    return VARIABLE_PATTERN.findall(content or '')
+
+
+def tokenize(content):
+    """
+    Split a template into alternating literal and variable-name tokens.
+    Even indexes are literal text, odd indexes are variable names.
+    """
+    return VARIABLE_PATTERN.split(content or '')
+
+
+def embed(name):
+    """Return the ``{{name}}`` embed markup for a variable name."""
+    return f'{{{{{name}}}}}'
+
+
+class VariableResolver:
+    """
+    Resolves string content against a fixed set of strings (usually one project).
+
+    Unknown variables and references that would recurse into a string that is
+    already being resolved are left in place as ``{{name}}``.
+    """
+
+    def __init__(self, strings):
+        self._strings = {}
+        self._by_name = {}
+        for string in strings:
+            self._strings[string.id] = string
+            # First match wins, mirroring project.strings.filter(...).first()
+            for key in (string.variable_name, string.variable_hash):
+                if key:
+                    self._by_name.setdefault(key, string)
+        self._tokens = {}
+        self._resolved = {}
+
+    @classmethod
+    def for_project(cls, project):
+        """Build a resolver from a single query over the project's strings."""
+        return cls(project.strings.only(*RESOLUTION_FIELDS))
+
+    def lookup(self, name):
+        """Return the string a variable name or hash refers to, or None."""
+        return self._by_name.get(name)
+
+    def resolve(self, string):
+        """Return the fully resolved content of a string."""
+        if string.id not in self._strings:
+            return self.resolve_content(string.content)
+        self._resolve_id(string.id)
+        return self._resolved[string.id]
+
+    def resolve_content(self, content):
+        """Resolve an arbitrary template against the loaded strings."""
+        tokens = tokenize(content)
+        for name in tokens[1::2]:
+            target = self._by_name.get(name)
+            if target is not None:
+                self._resolve_id(target.id)
+        return self._render(tokens)
+
+    def resolve_all(self):
+        """Resolve every loaded string; returns a dict of string id -> content."""
+        for string_id in self._strings:
+            self._resolve_id(string_id)
+        return dict(self._resolved)
+
+    def _tokens_for(self, string_id):
+        tokens = self._tokens.get(string_id)
+        if tokens is None:
+            tokens = self._tokens[string_id] = tokenize(self._strings[string_id].content)
+        return tokens
+
+    def _resolve_id(self, root_id):
+        # Iterative depth-first walk so deep embed chains can't hit the recursion limit
+        resolved = self._resolved
+        if root_id in resolved:
+            return
+        count = len(resolved)
+        active = set()
+        stack = [(root_id, False)]
+        while stack:
+            string_id, expanded = stack.pop()
+            if string_id in resolved:
+                continue
+            tokens = self._tokens_for(string_id)
+            if expanded:
+                resolved[string_id] = self._render(tokens)
+                active.discard(string_id)
+                continue
+            active.add(string_id)
+            stack.append((string_id, True))
+            for name in tokens[1::2]:
+                target = self._by_name.get(name)
+                if target is not None and target.id not in resolved and target.id not in active:
+                    stack.append((target.id, False))
+        RESOLUTIONS.inc(len(resolved) - count)
+
+    def _render(self, tokens):
+        parts = []
+        for index, token in enumerate(tokens):
+            if index % 2 == 0:
+                parts.append(token)
+                continue
+            target = self._by_name.get(token)
+            if target is not None and target.id in self._resolved:
+                parts.append(self._resolved[target.id])
+            else:
+                parts.append(embed(token))
+        return ''.join(parts)
+
+
+def resolvers_for_projects(project_ids):
+    """
+    Build one resolver per project from a single query.
+    Returns a dict of project id -> VariableResolver.
+    """
+    from .models import String
+
+    strings_by_project = defaultdict(list)
+    for string in String.objects.filter(project_id__in=set(project_ids)).only(*RESOLUTION_FIELDS):
+        strings_by_project[string.project_id].append(string)
+    return {project_id: VariableResolver(strings_by_project[project_id]) for project_id in project_ids}
@@ -0,0 +1,153 @@
+"""
+Full-text search over string content, display names and variable hashes.
+
+search_strings() returns the strings of a queryset matching a query, best
+first, each with a `search_rank` (higher is better). Each backend has its
+own index:
+
+- PostgreSQL: a GIN index on a 'simple' tsvector of display_name,
+  variable_hash and content (word and prefix matches, ranked with ts_rank),
+  plus pg_trgm GIN indexes on UPPER(variable_hash) and UPPER(display_name),
+  so the icontains substring lookups use an index too.
+- SQLite: two external-content FTS5 tables kept in sync by triggers, which
+  also covers bulk_create() and queryset.update(): a unicode61 word index
+  ranked with bm25, and a trigram index over variable_hash and display_name
+  for substring matches.
+- Anything else falls back to icontains scans.
+
+On top of the text rank, exact and prefix matches on variable_hash are
+boosted, so looking a string up by its identifier puts it first.
+
+The indexes, tables and triggers are created by migration 0029. SQLite drops
+a table's triggers when a migration rebuilds it (e.g. AlterField on String),
+so such migrations must create them again from their own copy of that SQL.
+"""
+import re
+from django.db import connection, models
+from django.db.models.functions import Coalesce
+
+# Substring matching needs at least a trigram; shorter queries only match word prefixes
+TRIGRAM_LENGTH = 3
+# Added to the text rank, so identifier lookups come first
+EXACT_IDENTIFIER_BOOST = 100.0
+PREFIX_IDENTIFIER_BOOST = 10.0
+SUBSTRING_BOOST = 1.0
+
+POSTGRES_VECTOR = (
+    "to_tsvector('simple', coalesce(strings_api_string.display_name, '') || ' ' || "
+    "strings_api_string.variable_hash || ' ' || strings_api_string.content)"
+)
+
+SQLITE_WORD_MATCHES = 'SELECT rowid FROM strings_api_string_fts WHERE strings_api_string_fts MATCH %s'
+
+def search_terms(query):
+    """The words of a query, as the indexes tokenize them."""
+    return re.findall(r'\w+', query or '')
+
+
+def search_filter(query):
+    """
+    A Q matching the strings search_strings() finds for `query`, unranked,
+    for narrowing querysets that keep their own ordering.
+    """
+    query = (query or '').strip()
+    terms = search_terms(query)
+    if not query:
+        return models.Q(pk__in=[])
+    if connection.vendor == 'postgresql' and terms:
+        return _postgres_match(terms) | _substring(query)
+    if connection.vendor == 'sqlite' and terms:
+        return models.Q(id__in=models.expressions.RawSQL(
+            *_sqlite_candidates(query, SQLITE_WORD_MATCHES, (_fts_expression(terms),))
+        ))
+    return _substring(query) | models.Q(content__icontains=query)
+
+
+def search_strings(queryset, query, limit=None):
+    """
+    Strings in `queryset` matching `query`, best match first, each with a
+    `search_rank` attribute. An empty query matches nothing.
+    """
+    query = (query or '').strip()
+    terms = search_terms(query)
+    if not query:
+        return []
+
+    if connection.vendor == 'postgresql' and terms:
+        matches = _postgres_match(terms) | _substring(query)
+        text_rank = models.expressions.RawSQL(
+            f"ts_rank({POSTGRES_VECTOR}, to_tsquery('simple', %s))", (_tsquery(terms),), output_field=models.FloatField()
+        )
+    elif connection.vendor == 'sqlite' and terms:
+        matches, text_rank = _sqlite_matches(query, terms)
+    else:
+        matches = _substring(query) | models.Q(content__icontains=query)
+        text_rank = models.Value(0.0)
+
+    identifier_rank = models.Case(
+        models.When(variable_hash__iexact=query, then=models.Value(EXACT_IDENTIFIER_BOOST)),
+        models.When(variable_hash__istartswith=query, then=models.Value(PREFIX_IDENTIFIER_BOOST)),
+        models.When(_substring(query), then=models.Value(SUBSTRING_BOOST)),
+        default=models.Value(0.0),
+        output_field=models.FloatField(),
+    )
+    strings = queryset.filter(matches).annotate(
+        search_rank=Coalesce(text_rank, models.Value(0.0)) + identifier_rank
+    ).order_by('-search_rank', '-updated_at', '-id')
+    # Evaluated here: on SQLite the ranks live in a temporary table the next search overwrites
+    return list(strings[:limit] if limit is not None else strings)
+
+
+def _sqlite_matches(query, terms):
+    """
+    The match filter and text rank for SQLite. bm25() only works next to its
+    MATCH, and as a per-row subquery it re-runs the MATCH for every row, so
+    all word matches are scored once into a temporary table (per connection)
+    and ranks are looked up there by id. bm25 is lower for better matches.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS strings_api_search_rank (id INTEGER PRIMARY KEY, rank REAL NOT NULL)')
+        cursor.execute('DELETE FROM temp.strings_api_search_rank')
+        cursor.execute(
+            'INSERT INTO temp.strings_api_search_rank SELECT rowid, -bm25(strings_api_string_fts) '
+            'FROM strings_api_string_fts WHERE strings_api_string_fts MATCH %s',
+            (_fts_expression(terms),),
+        )
+
+    candidates, params = _sqlite_candidates(query, 'SELECT id FROM temp.strings_api_search_rank', ())
+    text_rank = models.expressions.RawSQL(
+        'SELECT rank FROM temp.strings_api_search_rank WHERE id = strings_api_string.id', (),
+        output_field=models.FloatField(),
+    )
+    return models.Q(id__in=models.expressions.RawSQL(candidates, params)), text_rank
+
+
+def _sqlite_candidates(query, sql, params):
+    """
+    SQL and params selecting the ids of word matches (given) and trigram
+    substring matches. One IN over a UNION is driven by rowid; OR-ing two INs
+    scans the table.
+    """
+    if len(query) >= TRIGRAM_LENGTH:
+        sql += ' UNION SELECT rowid FROM strings_api_string_trigram WHERE strings_api_string_trigram MATCH %s'
+        params += ('"{}"'.format(query.replace('"', '""')),)
+    return sql, params
+
+
+def _fts_expression(terms):
+    # Every term as a prefix, all of them required
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _postgres_match(terms):
+    return models.Q(models.expressions.RawSQL(
+        f"{POSTGRES_VECTOR} @@ to_tsquery('simple', %s)", (_tsquery(terms),), output_field=models.BooleanField()
+    ))
+
+
+def _substring(query):
+    return models.Q(variable_hash__icontains=query) | models.Q(display_name__icontains=query)
@@ -1,7 +1,24 @@
 from rest_framework import serializers
-from .models import Project, String, Dimension, DimensionValue, StringDimensionValue
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from .models import Project, String, Dimension, DimensionValue, StringDimensionValue, Job
+from .graph import DependencyGraph, referenced_names, resolve_names
+from .resolution import extract_variable_names
+from .batch import StringBatch
 import re
-from django.db import models
+
+VARIABLE_HASH_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9\-]*$')
+
+
+def variable_hash_format_error(variable_hash):
+    """Return why a user-supplied variable hash is malformed, or None if it is valid."""
+    # Must be alphanumeric with optional hyphens, no spaces, reasonable length
+    if not VARIABLE_HASH_PATTERN.match(variable_hash):
+        return 'Hash must start with a letter or number and contain only letters, numbers, and hyphens (no spaces).'
+    if len(variable_hash) > 50:
+        return 'Hash must be 50 characters or less.'
+    return None
+
 
 class StringSerializer(serializers.ModelSerializer):
     dimension_values = serializers.SerializerMethodField()
@@ -21,6 +38,13 @@ class StringSerializer(serializers.ModelSerializer):
         # Disable automatic unique_together validation since variable_name is synced with variable_hash
         validators = []
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Prefetch the relations this serializer renders so lists cost a constant number of queries."""
+        return queryset.prefetch_related(
+            Prefetch('dimension_values', queryset=StringDimensionValue.objects.select_related('dimension_value'))
+        )
+
     def get_dimension_values(self, obj):
         return StringDimensionValueSerializer(obj.dimension_values.all(), many=True).data
 
@@ -28,14 +52,10 @@ class StringSerializer(serializers.ModelSerializer):
         # Validate variable_hash format if provided
         variable_hash = data.get('variable_hash')
         if variable_hash:
-            # Must be alphanumeric with optional hyphens, no spaces, reasonable length
-            if not re.match(r'^[A-Za-z0-9][A-Za-z0-9\-]*$', variable_hash):
+            hash_error = variable_hash_format_error(variable_hash)
+            if hash_error:
                 raise serializers.ValidationError({
-                    'variable_hash': 'Hash must start with a letter or number and contain only letters, numbers, and hyphens (no spaces).'
-                })
-            if len(variable_hash) > 50:
-                raise serializers.ValidationError({
-                    'variable_hash': 'Hash must be 50 characters or less.'
+                    'variable_hash': hash_error
                 })
             # Check for uniqueness within the project
             project = data.get('project') or (self.instance.project if self.instance else None)
@@ -51,12 +71,15 @@ class StringSerializer(serializers.ModelSerializer):
                         'variable_hash': f'A variable with hash "{variable_hash}" already exists in this project.'
                     })
         
-        project = data.get('project')
-        content = data.get('content', '')
+        project = data.get('project') or (self.instance.project if self.instance else None)
+        content = data.get('content', self.instance.content if self.instance else '')
+        current_name = variable_hash or (self.instance.variable_hash if self.instance else None)
         
-        # Check for circular references in string variables
-        if content and project:
-            circular_error = self._detect_circular_references(content, project, self.instance.id if self.instance else None)
+        # Check for circular references in string variables (only when embeds or the name change)
+        if content and project and ('content' in data or 'variable_hash' in data):
+            circular_error = self._detect_circular_references(
+                content, project, self.instance.id if self.instance else None, current_name
+            )
             if circular_error:
                 raise serializers.ValidationError({
                     'content': circular_error
@@ -64,49 +87,72 @@ class StringSerializer(serializers.ModelSerializer):
         
         return data
     
-    def _detect_circular_references(self, content, project, current_string_id=None, visited=None):
+    def _detect_circular_references(self, content, project, current_string_id=None, current_name=None):
         """
         Detect circular references in string variables.
         Returns error message if circular reference found, None otherwise.
+        
+        Walks an in-memory adjacency map of the project, visiting only the
+        strings reachable from the new content's embeds, each at most once.
         """
-        if visited is None:
-            visited = set()
+        variable_names = extract_variable_names(content)
+        targets = resolve_names(project.id, referenced_names(content))
+        if not targets:
+            return None
         
-        # Extract variable names from content
-        variable_pattern = re.compile(r'{{([^}]+)}}')
-        variable_names = variable_pattern.findall(content)
+        graph = DependencyGraph.for_project(project)
         
-        for variable_name in variable_names:
-            # Find the string variable that matches this variable name
-            string_variable = project.strings.filter(
-                models.Q(variable_name=variable_name) | models.Q(variable_hash=variable_name)
-            ).first()
+        # Strings whose embeds would point back at the string being saved
+        closing = set(graph.dangling.get(current_name, ())) if current_name else set()
+        if current_string_id:
+            closing.add(current_string_id)
+            closing |= graph.dependents[current_string_id]
+        
+        finished = set()
+        for variable_name in dict.fromkeys(variable_names):
+            target_id = targets.get(variable_name)
+            if target_id is None:
+                continue
+            
+            # Check if this would create a self-reference
+            if current_string_id and target_id == current_string_id:
+                return f'String cannot reference itself through variable "{{{{ {variable_name} }}}}"'
             
-            # Calculate effective variable name for comparison
-            if string_variable:
-                effective_name = string_variable.variable_name if string_variable.variable_name else string_variable.variable_hash
-                if effective_name == variable_name:
-                    # Check if this would create a self-reference
-                    if current_string_id and string_variable.id == current_string_id:
-                        return f'String cannot reference itself through variable "{{{{ {variable_name} }}}}"'
-                    
-                    # Check if we've already visited this string (circular reference)
-                    if string_variable.id in visited:
-                        return f'Circular reference detected involving variable "{{{{ {variable_name} }}}}"'
-                    
-                    # Add current string to visited set and recursively check
-                    new_visited = visited.copy()
-                    if current_string_id:
-                        new_visited.add(current_string_id)
-                    new_visited.add(string_variable.id)
-                    
-                    nested_error = self._detect_circular_references(
-                        string_variable.content, project, string_variable.id, new_visited
-                    )
-                    if nested_error:
-                        return nested_error
+            if self._reaches_cycle(graph, target_id, closing, finished):
+                return f'Circular reference detected involving variable "{{{{ {variable_name} }}}}"'
         
         return None
+    
+    @staticmethod
+    def _reaches_cycle(graph, start_id, closing, finished):
+        """
+        Iterative depth-first walk from start_id. True if it reaches one of the
+        closing strings or an existing cycle. Strings fully explored without
+        finding one are added to `finished` and never walked again.
+        """
+        if start_id in closing:
+            return True
+        if start_id in finished:
+            return False
+        
+        on_path = {start_id}
+        stack = [(start_id, iter(graph.dependencies[start_id]))]
+        while stack:
+            string_id, children = stack[-1]
+            child_id = next(children, None)
+            if child_id is None:
+                stack.pop()
+                on_path.discard(string_id)
+                finished.add(string_id)
+                continue
+            if child_id in closing or child_id in on_path:
+                return True
+            if child_id in finished:
+                continue
+            on_path.add(child_id)
+            stack.append((child_id, iter(graph.dependencies[child_id])))
+        
+        return False
 
     def create(self, validated_data):
         string = String.objects.create(**validated_data)
@@ -121,6 +167,65 @@ class StringSerializer(serializers.ModelSerializer):
 
 
 
+class StringBatchItemSerializer(serializers.Serializer):
+    """One create or update in a string batch; rules spanning items are checked by StringBatch."""
+    id = serializers.IntegerField(required=False)
+    ref = serializers.CharField(required=False, max_length=100)
+    content = serializers.CharField(required=False, allow_blank=True)
+    variable_hash = serializers.CharField(required=False, allow_blank=True)
+    display_name = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=200)
+    is_conditional = serializers.BooleanField(required=False)
+    is_conditional_container = serializers.BooleanField(required=False)
+    is_published = serializers.BooleanField(required=False)
+    # A string id, or the ref of a string created in the same batch
+    controlled_by_spawn = serializers.JSONField(required=False, allow_null=True)
+    dimension_values = serializers.ListField(child=serializers.JSONField(), required=False)
+
+    def validate_variable_hash(self, value):
+        hash_error = variable_hash_format_error(value) if value else None
+        if hash_error:
+            raise serializers.ValidationError(hash_error)
+        return value
+
+
+class StringBatchSerializer(serializers.Serializer):
+    """
+    Transactional batch of string creates, updates and deletes for one project.
+    Validated against a single snapshot of the project and written with bulk operations.
+    """
+    project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all())
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Declared here because class attributes named create/update would shadow the serializer's methods
+        fields['create'] = StringBatchItemSerializer(many=True, required=False)
+        fields['update'] = StringBatchItemSerializer(many=True, required=False)
+        return fields
+
+    def validate_project(self, project):
+        request = self.context.get('request')
+        if request and project.user_id != request.user.id:
+            raise serializers.ValidationError('Project not found or you do not have permission to add strings to it.')
+        return project
+
+    def validate(self, data):
+        self.batch = StringBatch(
+            data['project'],
+            create=data.get('create', ()),
+            update=data.get('update', ()),
+            delete=data.get('delete', ()),
+        )
+        errors = self.batch.validate()
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
+    def create(self, validated_data):
+        created, updated, deleted = self.batch.save()
+        return {'created': created, 'updated': updated, 'deleted': deleted}
+
+
 class DimensionValueSerializer(serializers.ModelSerializer):
     class Meta:
         model = DimensionValue
@@ -183,19 +288,84 @@ class StringDimensionValueSerializer(serializers.ModelSerializer):
         representation['dimension_value_detail'] = {
             'id': instance.dimension_value.id,
             'value': instance.dimension_value.value,
-            'dimension': instance.dimension_value.dimension.id
+            'dimension': instance.dimension_value.dimension_id
         }
         return representation
 
 class ProjectSerializer(serializers.ModelSerializer):
     strings = serializers.SerializerMethodField()
-    dimensions = DimensionSerializer(many=True, read_only=True)
+    dimensions = serializers.SerializerMethodField()
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Prefetch everything the nested representation renders."""
+        return queryset.prefetch_related(
+            Prefetch('strings', queryset=StringSerializer.setup_eager_loading(String.objects.order_by('-created_at'))),
+            'dimensions__values',
+        )
+
     def get_strings(self, obj):
-        # Explicitly order strings by creation date (newest first)
-        strings = obj.strings.order_by('-created_at')
+        # Strings are ordered by creation date (newest first); use the view's
+        # prefetch when there is one, otherwise prefetch their assignments here
+        if 'strings' in getattr(obj, '_prefetched_objects_cache', {}):
+            strings = obj.strings.all()
+        else:
+            strings = StringSerializer.setup_eager_loading(obj.strings.order_by('-created_at'))
         return StringSerializer(strings, many=True).data
     
+    def get_dimensions(self, obj):
+        if 'dimensions' in getattr(obj, '_prefetched_objects_cache', {}):
+            dimensions = obj.dimensions.all()
+        else:
+            dimensions = obj.dimensions.prefetch_related('values')
+        return DimensionSerializer(dimensions, many=True).data
+    
     class Meta:
         model = Project
-        fields = ['id', 'name', 'description', 'strings', 'dimensions', 'created_at', 'updated_at'] 
\ No newline at end of file
+        fields = ['id', 'name', 'description', 'strings', 'dimensions', 'created_at', 'updated_at'] 
+
+
+class ProjectSummarySerializer(serializers.ModelSerializer):
+    """
+    Lightweight project representation for list views: counts instead of
+    nested strings and dimensions. Expects the queryset to be annotated with
+    `with_summary_counts`.
+    """
+    string_count = serializers.IntegerField(read_only=True)
+    dimension_count = serializers.IntegerField(read_only=True)
+    published_count = serializers.IntegerField(read_only=True)
+    last_updated = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'description', 'string_count', 'dimension_count', 'published_count', 'last_updated', 'created_at', 'updated_at']
+
+    @staticmethod
+    def with_summary_counts(queryset):
+        """Annotate a Project queryset with the counts this serializer renders."""
+        def count(model_queryset):
+            counts = model_queryset.filter(project=OuterRef('pk')).order_by().values('project').annotate(count=Count('pk')).values('count')
+            return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+        strings_updated_at = String.objects.filter(project=OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+        return queryset.annotate(
+            string_count=count(String.objects.all()),
+            dimension_count=count(Dimension.objects.all()),
+            published_count=count(String.objects.filter(is_published=True)),
+            strings_updated_at=Subquery(strings_updated_at),
+        )
+
+    def get_last_updated(self, obj):
+        strings_updated_at = getattr(obj, 'strings_updated_at', None)
+        if strings_updated_at and strings_updated_at > obj.updated_at:
+            return strings_updated_at
+        return obj.updated_at
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Status and outcome of an AI job; the (possibly large) input is not echoed back."""
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
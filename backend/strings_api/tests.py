@@ -1,3 +1,1823 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import importlib
+import json
+import math
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+import brotli
+import msgpack
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient, APITestCase
+from .models import Project, String, Dimension, DimensionValue, StringDimensionValue, StringReference, Tombstone, Job, UserProfile, bump_project_version, prune_tombstones
+from . import ai, jobs, openai_clients, resolution
+from .middleware import CSRFRefreshMiddleware, ProfilingMiddleware
+from .hashing import HashAllocator, random_hash
+from .profiling import SlowestProfiles
+from .graph import sync_references
+from .materialize import refresh_resolved_content
+from .resolution import VariableResolver, extract_variable_names
+from .variants import VariantRenderer, VariantLimitExceeded
 
-# Create your tests here.
+
+# In-memory stand-ins for the file caches, so tests neither write to disk nor touch
+# (or clear) a developer's cached snapshots and AI results
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+    for alias in ('default', 'ai_results', 'snapshots')
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectTestCase(APITestCase):
+    """
+    Base class for API tests: an authenticated owner with one project, over
+    in-memory caches emptied for every test. Subclasses add their own rows
+    after calling super().setUp().
+    """
+    # Set to give the owner an OpenAI API key
+    openai_api_key = None
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(username='owner', password='password')
+        if self.openai_api_key:
+            UserProfile.objects.create(user=self.user, openai_api_key=self.openai_api_key)
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='Project', user=self.user)
+
+
+class QueryCountTestCase(ProjectTestCase):
+    """
+    Base class for asserting that an endpoint's query count doesn't grow with
+    the amount of data it serializes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.dimension_values = []
+        for dimension_index in range(2):
+            dimension = Dimension.objects.create(name=f'Conditional {dimension_index}', project=self.project)
+            for value_index in range(3):
+                self.dimension_values.append(
+                    DimensionValue.objects.create(dimension=dimension, value=f'Spawn {dimension_index}.{value_index}')
+                )
+
+    def add_strings(self, count):
+        """Add strings that embed each other and carry dimension value assignments."""
+        previous = None
+        for index in range(count):
+            content = f'String {index}' + (f' {{{{{previous.variable_hash}}}}}' if previous else '')
+            string = String.objects.create(project=self.project, content=content, is_published=True)
+            for dimension_value in self.dimension_values[index % 3::3]:
+                StringDimensionValue.objects.create(string=string, dimension_value=dimension_value)
+            previous = string
+
+    def count_queries(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400, response.content[:500])
+        return len(queries)
+
+    def assertConstantQueries(self, method, path, data=None):
+        self.add_strings(2)
+        small = self.count_queries(method, path, data)
+        self.add_strings(20)
+        large = self.count_queries(method, path, data)
+        self.assertEqual(small, large, f'{method.upper()} {path} went from {small} to {large} queries')
+
+
+class SerializerQueryCountTests(QueryCountTestCase):
+    def test_project_detail_query_count_is_constant(self):
+        self.assertConstantQueries('get', f'/api/projects/{self.project.id}/')
+
+    def test_columnar_project_detail_query_count_is_constant(self):
+        self.assertConstantQueries('get', f'/api/projects/{self.project.id}/?format=msgpack')
+
+    def test_string_list_query_count_is_constant(self):
+        self.assertConstantQueries('get', '/api/strings/')
+
+    def test_project_update_query_count_is_constant(self):
+        self.assertConstantQueries('patch', f'/api/projects/{self.project.id}/', {'name': 'Renamed'})
+
+
+# ---------------------------------------------------------------------------
+# Endpoint query budgets
+#
+# Seeds one project per configured size and hits every API endpoint against
+# each of them, recording query count, wall time and response size. A test
+# fails when an endpoint's query count grows between the smallest and a larger
+# dataset by more than its declared budget.
+#
+# Sizes, embed depth and dimension fan-out are configurable so the same suite
+# can run as a quick check or as a local benchmark, e.g.:
+#
+#   STRINGS_BENCHMARK_SIZES=100,1000,10000 STRINGS_BENCHMARK_REPORT=1 \
+#       python manage.py test strings_api.tests.EndpointQueryBudgetTests
+# ---------------------------------------------------------------------------
+
+BENCHMARK_SIZES = sorted(int(size) for size in os.environ.get('STRINGS_BENCHMARK_SIZES', '100,400').split(','))
+BENCHMARK_EMBED_DEPTH = int(os.environ.get('STRINGS_BENCHMARK_EMBED_DEPTH', '4'))
+# One conditional per this many strings, so dimension fan-out grows with size
+BENCHMARK_STRINGS_PER_CONDITIONAL = int(os.environ.get('STRINGS_BENCHMARK_STRINGS_PER_CONDITIONAL', '50'))
+BENCHMARK_SPAWNS_PER_CONDITIONAL = int(os.environ.get('STRINGS_BENCHMARK_SPAWNS_PER_CONDITIONAL', '3'))
+BENCHMARK_REPORT = os.environ.get('STRINGS_BENCHMARK_REPORT') == '1'
+
+
+class Budget(namedtuple('Budget', ['extra', 'per_thousand'])):
+    """
+    Allowed query growth from the smallest dataset to a larger one: a fixed
+    number of extra queries plus some per thousand additional strings (for
+    operations Django batches, like cascading deletes).
+    """
+
+    def allowed(self, small_size, large_size):
+        return self.extra + self.per_thousand * math.ceil((large_size - small_size) / 1000)
+
+
+CONSTANT = Budget(0, 0)
+
+
+def seed_project(user, size, embed_depth=BENCHMARK_EMBED_DEPTH):
+    """
+    Bulk-create a project with `size` strings: conditionals with spawns and
+    dimension assignments, and regular strings that embed each other in
+    chains of `embed_depth` and embed the conditionals. Returns a namespace
+    with handy objects for building endpoint paths.
+    """
+    project = Project.objects.create(name=f'Benchmark {size}', user=user)
+    conditional_count = max(1, size // BENCHMARK_STRINGS_PER_CONDITIONAL)
+    strings = []
+
+    def new_string(variable_hash, content='', **fields):
+        string = String(project=project, variable_hash=variable_hash, variable_name=variable_hash, content=content, **fields)
+        strings.append(string)
+        return string
+
+    containers, spawns_by_container = [], {}
+    for conditional_index in range(conditional_count):
+        container = new_string(f'C{size}X{conditional_index}', is_conditional=True, is_conditional_container=True)
+        containers.append(container)
+        spawns_by_container[container.variable_hash] = [
+            new_string(f'C{size}X{conditional_index}S{spawn_index}', f'Spawn {spawn_index} of {conditional_index}')
+            for spawn_index in range(BENCHMARK_SPAWNS_PER_CONDITIONAL)
+        ]
+
+    previous, regular = None, []
+    for index in range(size - len(strings)):
+        embeds = []
+        if previous is not None and index % embed_depth:
+            embeds.append(previous.variable_hash)
+        if index % 3 == 0:
+            embeds.append(containers[index % len(containers)].variable_hash)
+        content = f'String {index} ' + ' '.join(f'{{{{{name}}}}}' for name in embeds)
+        previous = new_string(f'S{size}X{index}', content.strip(), is_published=index % 2 == 0)
+        regular.append(previous)
+
+    String.objects.bulk_create(strings, batch_size=500)
+
+    by_name = {string.variable_hash: string for string in strings}
+    String.objects.bulk_update(
+        [
+            # The second spawn of each conditional follows the first spawn of the previous one
+            _set_attr(spawns[1], 'controlled_by_spawn_id', spawns_by_container[containers[index - 1].variable_hash][0].id)
+            for index, spawns in enumerate(spawns_by_container[container.variable_hash] for container in containers)
+            if index and len(spawns) > 1
+        ],
+        ['controlled_by_spawn'],
+        batch_size=500,
+    )
+    StringReference.objects.bulk_create(
+        [
+            StringReference(project=project, source=string, target=by_name.get(name), name=name)
+            for string in strings
+            for name in set(extract_variable_names(string.content))
+        ],
+        batch_size=500,
+    )
+    # Bulk inserts skip the save signals, so materialize resolutions as they would have
+    refresh_resolved_content(project.id, [string.id for string in strings])
+
+    dimensions = Dimension.objects.bulk_create(
+        [Dimension(project=project, name=container.variable_hash) for container in containers]
+    )
+    values = DimensionValue.objects.bulk_create(
+        [
+            DimensionValue(dimension=dimension, value=spawn.variable_hash)
+            for dimension in dimensions
+            for spawn in spawns_by_container[dimension.name]
+        ],
+        batch_size=500,
+    )
+    assignments = StringDimensionValue.objects.bulk_create(
+        [StringDimensionValue(string=by_name[value.value], dimension_value=value) for value in values],
+        batch_size=500,
+    )
+
+    return SimpleNamespace(
+        size=size,
+        user=user,
+        project=project,
+        # A string in the middle of an embed chain, with dependents and dependencies,
+        # picked so its neighbourhood looks the same at every size
+        string=regular[embed_depth + 1],
+        container=containers[0],
+        spawn=spawns_by_container[containers[0].variable_hash][0],
+        dimension=dimensions[0],
+        dimension_value=values[0],
+        assignment=assignments[0],
+    )
+
+
+def _set_attr(obj, name, value):
+    setattr(obj, name, value)
+    return obj
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EndpointQueryBudgetTests(APITestCase):
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.datasets = [
+            seed_project(User.objects.create_user(username=f'benchmark-{size}', password='password'), size)
+            for size in BENCHMARK_SIZES
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if BENCHMARK_REPORT and cls.results:
+            print('\n\nEndpoint                              Strings  Queries   Time (ms)       Bytes')
+            for name, size, queries, elapsed, response_bytes in sorted(cls.results):
+                print(f'{name:<36} {size:>8} {queries:>8} {elapsed * 1000:>11.1f} {response_bytes:>11}')
+
+    def measure(self, name, dataset, method, path, data=None):
+        self.client.force_authenticate(dataset.user)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json')
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+        elapsed = time.perf_counter() - started
+        self.assertLess(response.status_code, 400, f'{name} on {dataset.size} strings: {content[:500]}')
+        self.results.append((name, dataset.size, len(queries), elapsed, len(content)))
+        return len(queries)
+
+    def check_budget(self, name, method, path, data=None, budget=CONSTANT):
+        """
+        Hit an endpoint on every dataset. `path` and `data` are callables
+        taking the dataset, so each size gets its own object ids.
+        """
+        counts = [
+            self.measure(name, dataset, method, path(dataset), data(dataset) if data else None)
+            for dataset in self.datasets
+        ]
+        smallest = self.datasets[0].size
+        for dataset, count in zip(self.datasets[1:], counts[1:]):
+            allowed = budget.allowed(smallest, dataset.size)
+            self.assertLessEqual(
+                count - counts[0], allowed,
+                f'{name}: {counts[0]} queries at {smallest} strings, {count} at {dataset.size} '
+                f'(budget allows {allowed} more)'
+            )
+
+    # Projects
+
+    def test_project_list(self):
+        self.check_budget('project-list', 'get', lambda d: '/api/projects/')
+
+    def test_project_create(self):
+        self.check_budget('project-create', 'post', lambda d: '/api/projects/', lambda d: {'name': 'New'})
+
+    def test_project_retrieve(self):
+        self.check_budget('project-retrieve', 'get', lambda d: f'/api/projects/{d.project.id}/')
+
+    def test_project_retrieve_columnar(self):
+        self.check_budget('project-retrieve-columnar', 'get', lambda d: f'/api/projects/{d.project.id}/?format=columnar')
+
+    def test_project_retrieve_msgpack(self):
+        self.check_budget('project-retrieve-msgpack', 'get', lambda d: f'/api/projects/{d.project.id}/?format=msgpack')
+
+    def test_project_update(self):
+        self.check_budget('project-update', 'patch', lambda d: f'/api/projects/{d.project.id}/', lambda d: {'name': 'Renamed'})
+
+    def test_project_destroy(self):
+        # Cascading deletes are batched by Django, a few queries per thousand rows
+        self.check_budget('project-destroy', 'delete', lambda d: f'/api/projects/{d.project.id}/', budget=Budget(0, 16))
+
+    def test_project_download_csv(self):
+        self.check_budget('project-download-csv', 'post', lambda d: f'/api/projects/{d.project.id}/download-csv/', lambda d: {})
+
+    def test_project_download_csv_filtered(self):
+        self.check_budget(
+            'project-download-csv-filtered', 'post', lambda d: f'/api/projects/{d.project.id}/download-csv/',
+            lambda d: {'selected_dimension_values': {str(d.dimension.id): d.dimension_value.value}},
+        )
+
+    def test_project_changes(self):
+        self.check_budget(
+            'project-changes', 'get', lambda d: f'/api/projects/{d.project.id}/changes/?since=2000-01-01T00:00:00Z'
+        )
+
+    def test_project_variants(self):
+        self.check_budget('project-variants', 'get', lambda d: f'/api/projects/{d.project.id}/variants/')
+
+    def test_project_duplicate(self):
+        # Bulk inserts; SQLite's parameter limit caps the rows per INSERT
+        self.check_budget(
+            'project-duplicate', 'post', lambda d: f'/api/projects/{d.project.id}/duplicate/', budget=Budget(0, 24)
+        )
+
+    # Strings
+
+    def test_string_list(self):
+        self.check_budget('string-list', 'get', lambda d: '/api/strings/')
+
+    def test_string_create(self):
+        self.check_budget(
+            'string-create', 'post', lambda d: '/api/strings/',
+            lambda d: {'project': d.project.id, 'content': f'New {{{{{d.string.variable_hash}}}}}'},
+        )
+
+    def test_string_retrieve(self):
+        self.check_budget('string-retrieve', 'get', lambda d: f'/api/strings/{d.string.id}/')
+
+    def test_string_update(self):
+        self.check_budget(
+            'string-update', 'patch', lambda d: f'/api/strings/{d.string.id}/',
+            lambda d: {'content': f'Edited {{{{{d.container.variable_hash}}}}}'},
+        )
+
+    def test_string_rename(self):
+        self.check_budget(
+            'string-rename', 'patch', lambda d: f'/api/strings/{d.string.id}/',
+            lambda d: {'variable_hash': f'RENAMED{d.size}'},
+        )
+
+    def test_string_destroy(self):
+        self.check_budget('string-destroy', 'delete', lambda d: f'/api/strings/{d.string.id}/')
+
+    def test_string_duplicate(self):
+        self.check_budget('string-duplicate', 'post', lambda d: f'/api/strings/{d.spawn.id}/duplicate/')
+
+    def test_string_search(self):
+        self.check_budget('string-search', 'get', lambda d: '/api/strings/search/?q=string')
+
+    def test_string_usages(self):
+        self.check_budget('string-usages', 'get', lambda d: f'/api/strings/{d.string.id}/usages/?transitive=true')
+
+    def test_string_batch(self):
+        self.check_budget(
+            'string-batch', 'post', lambda d: '/api/strings/batch/',
+            lambda d: {
+                'project': d.project.id,
+                'create': [{'ref': 'new', 'content': f'New {{{{{d.string.variable_hash}}}}}', 'dimension_values': [d.dimension_value.id]}],
+                'update': [{'id': d.container.id, 'content': 'Edited {{new}}'}],
+            },
+        )
+
+    # Dimensions, values and assignments
+
+    def test_dimension_list(self):
+        self.check_budget('dimension-list', 'get', lambda d: '/api/dimensions/')
+
+    def test_dimension_create(self):
+        self.check_budget(
+            'dimension-create', 'post', lambda d: '/api/dimensions/',
+            lambda d: {'project': d.project.id, 'name': 'New dimension'},
+        )
+
+    def test_dimension_retrieve(self):
+        self.check_budget('dimension-retrieve', 'get', lambda d: f'/api/dimensions/{d.dimension.id}/')
+
+    def test_dimension_destroy(self):
+        self.check_budget('dimension-destroy', 'delete', lambda d: f'/api/dimensions/{d.dimension.id}/')
+
+    def test_dimension_value_list(self):
+        self.check_budget('dimension-value-list', 'get', lambda d: '/api/dimension-values/')
+
+    def test_dimension_value_create(self):
+        self.check_budget(
+            'dimension-value-create', 'post', lambda d: '/api/dimension-values/',
+            lambda d: {'dimension': d.dimension.id, 'value': 'Hidden'},
+        )
+
+    def test_dimension_value_update(self):
+        self.check_budget(
+            'dimension-value-update', 'patch', lambda d: f'/api/dimension-values/{d.dimension_value.id}/',
+            lambda d: {'value': 'Renamed'},
+        )
+
+    def test_string_dimension_value_list(self):
+        self.check_budget('string-dimension-value-list', 'get', lambda d: '/api/string-dimension-values/')
+
+    def test_string_dimension_value_create(self):
+        self.check_budget(
+            'string-dimension-value-create', 'post', lambda d: '/api/string-dimension-values/',
+            lambda d: {'string': d.string.id, 'dimension_value': d.dimension_value.id},
+        )
+
+    def test_string_dimension_value_destroy(self):
+        self.check_budget(
+            'string-dimension-value-destroy', 'delete', lambda d: f'/api/string-dimension-values/{d.assignment.id}/'
+        )
+
+    # Function views
+
+    def test_registry(self):
+        self.check_budget('registry', 'get', lambda d: '/api/registry/')
+
+    def test_registry_search(self):
+        self.check_budget('registry-search', 'get', lambda d: '/api/registry/?q=string')
+
+    def test_registry_sparse_fields(self):
+        self.check_budget('registry-sparse-fields', 'get', lambda d: '/api/registry/?fields=id,variable_hash,project_name')
+
+    def test_me(self):
+        self.check_budget('me', 'get', lambda d: '/api/auth/me/')
+
+    def test_openai_settings(self):
+        self.check_budget('openai-settings', 'get', lambda d: '/api/settings/openai/')
+
+    def test_check_openai_configured(self):
+        self.check_budget('check-openai-configured', 'get', lambda d: '/api/settings/openai/check/')
+
+
+class HashAllocatorTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Project.objects.create(name='Other', user=self.user)
+        String.objects.create(project=self.other, content='Taken hash', variable_hash='AAAAAA')
+        String.objects.create(project=self.project, content='Taken name', variable_hash='XXXXXX', variable_name='BBBBBB')
+        String.objects.filter(variable_hash='XXXXXX').update(variable_name='BBBBBB')
+        String.objects.create(project=self.other, content='Name elsewhere', variable_hash='YYYYYY')
+        String.objects.filter(variable_hash='YYYYYY').update(variable_name='DDDDDD')
+
+    def candidates(self, *hashes):
+        return mock.patch('strings_api.hashing.random_hash', side_effect=list(hashes))
+
+    def test_skips_existing_hashes_and_project_names(self):
+        with self.candidates('AAAAAA', 'BBBBBB', 'CCCCCC', 'DDDDDD', 'EEEEEE'):
+            self.assertEqual(set(HashAllocator(project_id=self.project.id).allocate(2)), {'CCCCCC', 'DDDDDD'})
+
+    def test_reserved_hashes_are_not_handed_out(self):
+        allocator = HashAllocator(project_id=self.project.id)
+        allocator.reserve(['CCCCCC'])
+        with self.candidates('CCCCCC', 'EEEEEE', 'FFFFFF', 'GGGGGG'):
+            first = allocator.allocate(1)
+        # Hashes reserved after a refill are dropped from the pool too
+        allocator.reserve(first)
+        allocator.reserve(['EEEEEE'])
+        with self.candidates('HHHHHH', 'JJJJJJ', 'KKKKKK'):
+            rest = allocator.allocate(2)
+        self.assertNotIn('CCCCCC', first + rest)
+        self.assertNotIn('EEEEEE', rest)
+        self.assertEqual(len(set(first + rest)), 3)
+
+    def test_hashes_are_unique_within_and_across_batches(self):
+        allocator = HashAllocator(project_id=self.project.id, batch_size=20)
+        hashes = allocator.allocate(50) + [allocator.next() for _ in range(30)]
+        self.assertEqual(len(set(hashes)), 80)
+        self.assertFalse(set(hashes) & {'AAAAAA', 'BBBBBB'})
+
+    def test_single_saves_check_a_handful_of_candidates(self):
+        with mock.patch('strings_api.hashing.random_hash', wraps=random_hash) as generate:
+            string = String.objects.create(project=self.project, content='New')
+        self.assertLessEqual(generate.call_count, 10)
+        self.assertNotIn(string.variable_hash, {'AAAAAA', 'XXXXXX', 'YYYYYY'})
+
+
+class StringBatchTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.greeting = String.objects.create(project=self.project, content='Hello', variable_hash='greeting')
+        # An existing conditional, so every measured batch starts from the same shape of project
+        Dimension.objects.create(name='tone', project=self.project)
+
+    def create_conditional(self, name, spawn_count):
+        spawns = [
+            {'ref': f'spawn-{index}', 'content': f'Option {index} {{{{greeting}}}}', 'is_conditional': True,
+             'dimension_values': [{'conditional': 'container'}]}
+            for index in range(spawn_count)
+        ]
+        spawns[-1]['controlled_by_spawn'] = 'spawn-0'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/strings/batch/', {
+                'project': self.project.id,
+                'create': [{'ref': 'container', 'variable_hash': name, 'is_conditional_container': True}] + spawns,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json(), len(queries)
+
+    def test_conditional_with_spawns_is_one_request_with_constant_queries(self):
+        small, small_queries = self.create_conditional('size', 2)
+        large, large_queries = self.create_conditional('color', 20)
+        self.assertEqual(small_queries, large_queries)
+
+        created = {item['ref']: item for item in large['created']}
+        dimension = Dimension.objects.get(project=self.project, name='color')
+        self.assertEqual(
+            set(dimension.values.values_list('value', flat=True)),
+            {created[f'spawn-{index}']['variable_hash'] for index in range(20)},
+        )
+        self.assertEqual(created['spawn-19']['controlled_by_spawn_id'], created['spawn-0']['id'])
+        self.assertEqual(StringReference.objects.filter(target=self.greeting).count(), 22)
+
+    def test_invalid_batch_writes_nothing(self):
+        response = self.client.post('/api/strings/batch/', {
+            'project': self.project.id,
+            'create': [{'variable_hash': 'loop', 'content': '{{greeting}}'}],
+            'update': [{'id': self.greeting.id, 'content': 'Hello {{loop}}'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Circular reference', response.json()['update'][0]['content'])
+        self.assertFalse(String.objects.filter(variable_hash='loop').exists())
+        self.greeting.refresh_from_db()
+        self.assertEqual(self.greeting.content, 'Hello')
+
+    def test_malformed_dimension_ids_are_validation_errors(self):
+        response = self.client.post('/api/strings/batch/', {
+            'project': self.project.id,
+            'create': [{'dimension_values': [{'dimension': [1]}, {'dimension': True}, {'dimension': {'id': 1}}]}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['create'][0]['dimension_values'], ['Dimension must be a dimension id.'] * 3)
+
+    def test_rename_rewrites_embeds_inside_and_outside_the_batch(self):
+        outside = String.objects.create(project=self.project, content='{{greeting}} there')
+        response = self.client.post('/api/strings/batch/', {
+            'project': self.project.id,
+            'create': [{'content': 'Say {{greeting}}'}],
+            'update': [{'id': self.greeting.id, 'variable_hash': 'salutation'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        self.assertEqual(response.json()['created'][0]['content'], 'Say {{salutation}}')
+        outside.refresh_from_db()
+        self.assertEqual(outside.content, '{{salutation}} there')
+        self.assertEqual(
+            set(StringReference.objects.filter(target=self.greeting).values_list('name', flat=True)),
+            {'salutation'},
+        )
+
+
+class ProjectDuplicateTests(ProjectTestCase):
+
+    def test_copies_point_at_the_new_rows(self):
+        world = String.objects.create(project=self.project, content='World', variable_hash='world')
+        greeting = String.objects.create(project=self.project, content='Hello {{world}} {{later}}', variable_hash='greeting')
+        String.objects.create(project=self.project, content='Hi', variable_hash='spawn', controlled_by_spawn=greeting)
+        tone = Dimension.objects.create(name='Tone', project=self.project)
+        formal = DimensionValue.objects.create(dimension=tone, value='Formal')
+        StringDimensionValue.objects.create(string=world, dimension_value=formal)
+
+        response = self.client.post(f'/api/projects/{self.project.id}/duplicate/')
+        self.assertEqual(response.status_code, 201)
+        copy = Project.objects.get(id=response.json()['id'])
+        copies = {string.variable_hash: string for string in copy.strings.all()}
+        self.assertEqual(copies['spawn'].controlled_by_spawn_id, copies['greeting'].id)
+        self.assertEqual(copies['greeting'].resolved_content, 'Hello World {{later}}')
+        self.assertEqual(
+            list(StringDimensionValue.objects.filter(string__project=copy).values_list('string_id', 'dimension_value__value', 'dimension_value__dimension__project')),
+            [(copies['world'].id, 'Formal', copy.id)],
+        )
+        self.assertEqual(
+            set(StringReference.objects.filter(project=copy).values_list('source_id', 'name', 'target_id')),
+            {(copies['greeting'].id, 'world', copies['world'].id), (copies['greeting'].id, 'later', None)},
+        )
+
+        # Edits to the copy only reach the copy's dependents
+        self.client.patch(f'/api/strings/{copies["world"].id}/', {'content': 'Earth'}, format='json')
+        self.assertEqual(String.objects.get(id=copies['greeting'].id).resolved_content, 'Hello Earth {{later}}')
+        self.assertEqual(String.objects.get(id=greeting.id).resolved_content, 'Hello World {{later}}')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectSummaryTests(APITestCase):
+
+    def test_counts_and_last_updated(self):
+        user = User.objects.create_user(username='owner', password='password')
+        self.client.force_authenticate(user)
+        busy = Project.objects.create(name='Busy', user=user)
+        empty = Project.objects.create(name='Empty', user=user)
+        strings = [
+            String.objects.create(project=busy, content=f'String {index}', is_published=index < 2)
+            for index in range(3)
+        ]
+        for name in ('Tone', 'Length'):
+            Dimension.objects.create(name=name, project=busy)
+        String.objects.create(project=Project.objects.create(name='Other', user=user), content='Elsewhere', is_published=True)
+        edited_at = timezone.now() + timedelta(hours=1)
+        String.objects.filter(id=strings[1].id).update(updated_at=edited_at)
+
+        results = {project['name']: project for project in self.client.get('/api/projects/').data['results']}
+        self.assertEqual(
+            {name: (project['string_count'], project['dimension_count'], project['published_count']) for name, project in results.items()},
+            {'Busy': (3, 2, 2), 'Empty': (0, 0, 0), 'Other': (1, 0, 1)},
+        )
+        self.assertEqual(results['Busy']['last_updated'], edited_at)
+        self.assertEqual(results['Empty']['last_updated'], Project.objects.get(id=empty.id).updated_at)
+
+
+class ConditionalGetTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.string = String.objects.create(project=self.project, content='Hello', is_published=True)
+
+    def etag_of(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_project_is_not_modified_after_one_query(self):
+        path = f'/api/projects/{self.project.id}/'
+        etag = self.etag_of(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_every_kind_of_change_produces_a_new_etag(self):
+        path = f'/api/projects/{self.project.id}/'
+        dimension = Dimension.objects.create(name='Tone', project=self.project)
+        changes = [
+            lambda: self.client.patch(f'/api/strings/{self.string.id}/', {'content': 'Hi'}, format='json'),
+            lambda: self.client.patch(path, {'name': 'Renamed'}, format='json'),
+            lambda: DimensionValue.objects.create(dimension=dimension, value='Formal'),
+            lambda: StringDimensionValue.objects.create(string=self.string, dimension_value=dimension.values.get()),
+            lambda: StringDimensionValue.objects.filter(string=self.string).delete(),
+            lambda: self.client.post('/api/strings/batch/', {'project': self.project.id, 'create': [{'content': 'New'}]}, format='json'),
+            lambda: self.client.delete(f'/api/strings/{self.string.id}/'),
+        ]
+        etags = [self.etag_of(path)]
+        for change in changes:
+            change()
+            etags.append(self.etag_of(path))
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_registry_etag_follows_versions_and_query(self):
+        etag = self.etag_of('/api/registry/')
+        self.assertEqual(self.client.get('/api/registry/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.etag_of('/api/registry/?project=1'), etag)
+        self.string.content = 'Changed'
+        self.string.save()
+        self.assertEqual(self.client.get('/api/registry/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(PROJECT_CHANGES_MARGIN=0)
+class ProjectChangesTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.kept = String.objects.create(project=self.project, content='Kept')
+        self.edited = String.objects.create(project=self.project, content='Before')
+        self.removed = String.objects.create(project=self.project, content='Removed')
+        self.dimension = Dimension.objects.create(name='Tone', project=self.project)
+        self.value = DimensionValue.objects.create(dimension=self.dimension, value='Formal')
+        StringDimensionValue.objects.create(string=self.removed, dimension_value=self.value)
+        self.path = f'/api/projects/{self.project.id}/changes/'
+
+    def test_returns_only_what_changed_since_the_token(self):
+        token = self.client.get(self.path).json()['token']
+
+        self.edited.content = 'After'
+        self.edited.save()
+        self.client.delete(f'/api/strings/{self.removed.id}/')
+        assignment = StringDimensionValue.objects.create(string=self.kept, dimension_value=self.value)
+
+        changes = self.client.get(self.path, {'since': token}).json()
+        self.assertEqual([string['content'] for string in changes['strings']], ['After'])
+        self.assertEqual([row['id'] for row in changes['string_dimension_values']], [assignment.id])
+        self.assertEqual(changes['deleted']['strings'], [self.removed.id])
+        # The removed string's assignment went with it and is implied by its tombstone
+        self.assertEqual(changes['deleted']['string_dimension_values'], [])
+        self.assertIsNone(changes['project'])
+        self.assertGreater(changes['token'], token)
+
+    def test_late_commits_inside_the_margin_are_resent(self):
+        token = self.client.get(self.path).json()['token']
+        # Stamped before the token was issued, committed after it
+        String.objects.filter(id=self.edited.id).update(content='Late', updated_at=parse_datetime(token) - timedelta(seconds=5))
+
+        with self.settings(PROJECT_CHANGES_MARGIN=60):
+            changes = self.client.get(self.path, {'since': token}).json()
+        self.assertIn('Late', [string['content'] for string in changes['strings']])
+        with self.settings(PROJECT_CHANGES_MARGIN=0):
+            changes = self.client.get(self.path, {'since': token}).json()
+        self.assertNotIn('Late', [string['content'] for string in changes['strings']])
+
+    def test_deleting_the_project_leaves_no_tombstones(self):
+        self.client.delete(f'/api/dimensions/{self.dimension.id}/')
+        self.assertEqual(list(Tombstone.objects.values_list('model', flat=True)), [Tombstone.DIMENSION])
+        self.client.delete(f'/api/projects/{self.project.id}/')
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_rejects_malformed_token(self):
+        self.assertEqual(self.client.get(self.path, {'since': 'yesterday'}).status_code, 400)
+
+    @override_settings(PROJECT_CHANGES_RETENTION=60 * 60 * 24)
+    def test_tokens_older_than_the_retained_tombstones_get_everything(self):
+        token = self.client.get(self.path).json()['token']
+        self.assertFalse(self.client.get(self.path, {'since': token}).json()['full'])
+        self.client.delete(f'/api/strings/{self.removed.id}/')
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertFalse(Tombstone.objects.exists())
+
+        old_token = (timezone.now() - timedelta(days=2)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        changes = self.client.get(self.path, {'since': old_token}).json()
+        self.assertTrue(changes['full'])
+        self.assertEqual({string['id'] for string in changes['strings']}, {self.kept.id, self.edited.id})
+        self.assertIsNotNone(changes['project'])
+
+
+class StringReferenceTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.world = String.objects.create(project=self.project, content='World', variable_hash='world')
+        self.greeting = String.objects.create(project=self.project, content='Hello {{world}} {{world}}', variable_hash='greeting')
+
+    def edges(self):
+        return set(StringReference.objects.filter(project=self.project).values_list('source_id', 'name', 'target_id'))
+
+    def test_usages_cost_the_same_for_any_number_of_dependents(self):
+        tone = DimensionValue.objects.create(dimension=Dimension.objects.create(name='tone', project=self.project), value='Formal')
+        StringDimensionValue.objects.create(string=self.greeting, dimension_value=tone)
+
+        def queries(params):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(f'/api/strings/{self.world.id}/usages/', params)
+            return len(captured), len(response.data)
+
+        before = [queries({}), queries({'transitive': 'true'})]
+        for index in range(5):
+            dependent = String.objects.create(project=self.project, content=f'{index} {{{{world}}}}')
+            StringDimensionValue.objects.create(string=dependent, dimension_value=tone)
+        after = [queries({}), queries({'transitive': 'true'})]
+        self.assertEqual([(count, usages + 5) for count, usages in before], after)
+
+    def test_edges_follow_content(self):
+        self.assertEqual(self.edges(), {(self.greeting.id, 'world', self.world.id)})
+
+        response = self.client.patch(f'/api/strings/{self.greeting.id}/', {'content': 'Hi {{footer}}'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.edges(), {(self.greeting.id, 'footer', None)})
+
+        self.client.patch(f'/api/strings/{self.greeting.id}/', {'content': 'Hello {{world}}'}, format='json')
+        self.client.delete(f'/api/strings/{self.world.id}/')
+        self.assertEqual(self.edges(), {(self.greeting.id, 'world', None)})
+
+        self.client.delete(f'/api/strings/{self.greeting.id}/')
+        self.assertEqual(self.edges(), set())
+
+    def test_dangling_edges_are_linked_when_the_target_appears(self):
+        page = String.objects.create(project=self.project, content='{{footer}} {{greeting}}', variable_hash='page')
+        self.assertIn((page.id, 'footer', None), self.edges())
+        response = self.client.post('/api/strings/', {'project': self.project.id, 'content': 'Bye', 'variable_hash': 'footer'}, format='json')
+        self.assertEqual(self.edges(), {
+            (self.greeting.id, 'world', self.world.id),
+            (page.id, 'footer', response.json()['id']),
+            (page.id, 'greeting', self.greeting.id),
+        })
+
+    def test_renaming_rewrites_dependents(self):
+        page = String.objects.create(project=self.project, content='<{{world}}>', variable_hash='page')
+        before = {string.id: string.updated_at for string in String.objects.filter(id__in=[self.greeting.id, page.id])}
+
+        response = self.client.patch(f'/api/strings/{self.world.id}/', {'variable_hash': 'planet'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        greeting, page = String.objects.get(id=self.greeting.id), String.objects.get(id=page.id)
+        self.assertEqual(greeting.content, 'Hello {{planet}} {{planet}}')
+        self.assertEqual(page.content, '<{{planet}}>')
+        self.assertGreater(greeting.updated_at, before[greeting.id])
+        self.assertGreater(page.updated_at, before[page.id])
+        self.assertEqual(page.resolved_content, '<World>')
+        self.assertEqual(self.edges(), {
+            (self.greeting.id, 'planet', self.world.id),
+            (page.id, 'planet', self.world.id),
+        })
+
+    def test_migration_backfill_builds_the_same_edges(self):
+        String.objects.create(project=self.project, content='{{greeting}} {{nobody}}', variable_hash='page')
+        other = Project.objects.create(name='Other', user=self.user)
+        String.objects.create(project=other, content='{{world}}', variable_hash='elsewhere')
+        expected = set(StringReference.objects.values_list('project_id', 'source_id', 'name', 'target_id'))
+
+        StringReference.objects.all().delete()
+        migration = importlib.import_module('strings_api.migrations.0024_string_reference')
+        migration.build_string_references(django_apps, None)
+        self.assertEqual(set(StringReference.objects.values_list('project_id', 'source_id', 'name', 'target_id')), expected)
+
+
+class CircularReferenceTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = String.objects.create(project=self.project, content='A {{b}} {{c}}', variable_hash='a')
+        self.b = String.objects.create(project=self.project, content='B', variable_hash='b')
+
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, response.json()['content'][0])
+
+    def test_self_reference(self):
+        response = self.client.patch(f'/api/strings/{self.b.id}/', {'content': 'B {{b}}'}, format='json')
+        self.assertRejected(response, 'cannot reference itself')
+
+    def test_indirect_cycle(self):
+        response = self.client.patch(f'/api/strings/{self.b.id}/', {'content': 'B {{a}}'}, format='json')
+        self.assertRejected(response, 'Circular reference detected involving variable "{{ a }}"')
+        self.assertEqual(String.objects.get(id=self.b.id).content, 'B')
+
+    def test_new_string_closing_a_dangling_embed(self):
+        # a already embeds the missing {{c}}; a new c embedding a would close the loop
+        response = self.client.post('/api/strings/', {'project': self.project.id, 'content': '{{a}}', 'variable_hash': 'c'}, format='json')
+        self.assertRejected(response, 'Circular reference detected')
+        response = self.client.post('/api/strings/', {'project': self.project.id, 'content': '{{b}}', 'variable_hash': 'c'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class VariableResolverTests(SimpleTestCase):
+
+    def resolver(self, *strings):
+        return VariableResolver([
+            SimpleNamespace(id=index, content=content, variable_name=name, variable_hash=hash)
+            for index, (content, name, hash) in enumerate(strings, start=1)
+        ])
+
+    def test_shared_embeds_are_resolved_once(self):
+        resolver = self.resolver(
+            ('World', None, 'world'), ('Hello {{world}}', None, 'greeting'),
+            ('<{{greeting}}>', None, 'page'), ('{{greeting}}, {{world}}!', None, 'banner'),
+        )
+        with mock.patch('strings_api.resolution.tokenize', wraps=resolution.tokenize) as tokenize:
+            resolved = resolver.resolve_all()
+        self.assertEqual(resolved, {1: 'World', 2: 'Hello World', 3: '<Hello World>', 4: 'Hello World, World!'})
+        self.assertEqual(sorted(call.args[0] for call in tokenize.call_args_list), sorted(
+            ['World', 'Hello {{world}}', '<{{greeting}}>', '{{greeting}}, {{world}}!']
+        ))
+
+    def test_cycles_are_left_as_literal_embeds(self):
+        resolver = self.resolver(('a {{b}}', None, 'a'), ('b {{a}}', None, 'b'), ('{{self}}', None, 'self'))
+        self.assertEqual(resolver.resolve(resolver.lookup('a')), 'a b {{a}}')
+        self.assertEqual(resolver.resolve(resolver.lookup('self')), '{{self}}')
+
+    def test_unknown_names_are_left_untouched(self):
+        resolver = self.resolver(('Hi {{missing}} {{ spaced }}', None, 'greeting'))
+        self.assertEqual(resolver.resolve(resolver.lookup('greeting')), 'Hi {{missing}} {{ spaced }}')
+        self.assertEqual(resolver.resolve_content('{{greeting}}!'), 'Hi {{missing}} {{ spaced }}!')
+
+    def test_lookup_by_name_or_hash(self):
+        resolver = self.resolver(('World', 'planet', 'x7k2'), ('{{planet}} / {{x7k2}}', None, 'both'))
+        self.assertIs(resolver.lookup('planet'), resolver.lookup('x7k2'))
+        self.assertEqual(resolver.resolve(resolver.lookup('both')), 'World / World')
+
+
+class MaterializedResolutionTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.world = String.objects.create(project=self.project, content='World', variable_hash='world')
+        self.greeting = String.objects.create(project=self.project, content='Hello {{world}}', variable_hash='greeting')
+        self.page = String.objects.create(project=self.project, content='<{{greeting}}> {{footer}}', variable_hash='page')
+
+    def assertMaterialized(self):
+        resolver = VariableResolver.for_project(self.project)
+        for string in self.project.strings.all():
+            self.assertEqual(string.resolved_content, resolver.resolve(string), string.variable_hash)
+
+    def test_a_failed_refresh_rolls_back_the_whole_save(self):
+        version = Project.objects.get(id=self.project.id).version
+        world = String.objects.get(id=self.world.id)
+        world.variable_hash = 'planet'
+        with mock.patch('strings_api.materialize.refresh_resolved_content', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            world.save()
+
+        self.assertEqual(String.objects.get(id=self.world.id).variable_hash, 'world')
+        self.assertEqual(String.objects.get(id=self.greeting.id).content, 'Hello {{world}}')
+        self.assertEqual(set(StringReference.objects.filter(target=self.world).values_list('name', flat=True)), {'world'})
+        self.assertEqual(Project.objects.get(id=self.project.id).version, version)
+
+    def test_changes_reach_transitive_dependents(self):
+        self.assertEqual(String.objects.get(id=self.page.id).resolved_content, '<Hello World> {{footer}}')
+        self.client.patch(f'/api/strings/{self.world.id}/', {'content': 'Earth'}, format='json')
+        self.client.post('/api/strings/', {'project': self.project.id, 'content': 'Bye', 'variable_hash': 'footer'}, format='json')
+        self.assertEqual(String.objects.get(id=self.page.id).resolved_content, '<Hello Earth> Bye')
+        self.assertMaterialized()
+
+    def test_deleting_an_embedded_string_restores_the_literal_embed(self):
+        self.client.delete(f'/api/strings/{self.world.id}/')
+        self.assertEqual(String.objects.get(id=self.page.id).resolved_content, '<Hello {{world}}> {{footer}}')
+        self.assertMaterialized()
+
+    def test_unchanged_inputs_skip_rewrites(self):
+        digest = String.objects.get(id=self.page.id).resolution_digest
+        self.world.display_name = 'Planet'
+        self.world.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.greeting.save()
+        self.assertFalse(any(query['sql'].startswith('UPDATE "strings_api_string" SET "resolved_content"') for query in queries))
+        self.assertEqual(String.objects.get(id=self.page.id).resolution_digest, digest)
+
+    def test_saves_that_dont_touch_content_or_names_skip_resolution(self):
+        world = String.objects.get(id=self.world.id)
+        for change in ({'display_name': 'Planet'}, {'is_published': True}):
+            for field, value in change.items():
+                setattr(world, field, value)
+            with CaptureQueriesContext(connection) as queries:
+                world.save()
+            self.assertFalse([query for query in queries if 'strings_api_stringreference' in query['sql']], change)
+
+        world.content = 'Earth'
+        world.save()
+        self.assertEqual(String.objects.get(id=self.page.id).resolved_content, '<Hello Earth> {{footer}}')
+
+    def test_migration_backfill_matches_materialize(self):
+        loop = String.objects.create(project=self.project, content='Loop {{page}}', variable_hash='loop')
+        String.objects.filter(id=self.page.id).update(content='<{{greeting}}> {{footer}} {{loop}}')
+        String.objects.create(project=self.project, content='{{loop}}!', variable_hash='outer')
+        sync_references(list(String.objects.filter(id=self.page.id)))
+        refresh_resolved_content(self.project.id, [self.page.id, loop.id])
+        expected = set(String.objects.values_list('id', 'resolved_content', 'resolution_digest'))
+
+        String.objects.update(resolved_content='', resolution_digest='')
+        migration = importlib.import_module('strings_api.migrations.0028_string_resolved_content')
+        migration.materialize_resolved_content(django_apps, None)
+        self.assertEqual(set(String.objects.values_list('id', 'resolved_content', 'resolution_digest')), expected)
+
+
+class VariantRendererTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.strings = {}
+        for name, content in [('size', ''), ('small', 'S {{color}}'), ('large', 'L'), ('color', ''), ('red', 'red'), ('blue', 'blue')]:
+            self.strings[name] = String.objects.create(
+                project=self.project, content=content, variable_hash=name, is_conditional_container=name in ('size', 'color')
+            )
+        self.shirt = String.objects.create(project=self.project, content='Shirt {{size}}', variable_hash='shirt')
+        self.dimensions = {}
+        for conditional, spawns in [('size', ['small', 'large', 'Hidden']), ('color', ['red', 'blue'])]:
+            self.dimensions[conditional] = Dimension.objects.create(project=self.project, name=conditional)
+            for spawn in spawns:
+                value = DimensionValue.objects.create(dimension=self.dimensions[conditional], value=spawn)
+                if spawn in self.strings:
+                    StringDimensionValue.objects.create(string=self.strings[spawn], dimension_value=value)
+
+    def variants(self, string, **params):
+        renderer = VariantRenderer.for_project(self.project)
+        return [(variant.selection, variant.content) for variant in renderer.variants(string, **params)]
+
+    def test_only_reached_conditionals_are_branched(self):
+        self.assertEqual(self.variants(self.shirt), [
+            ({'size': 'small', 'color': 'red'}, 'Shirt S red'),
+            ({'size': 'small', 'color': 'blue'}, 'Shirt S blue'),
+            ({'size': 'large'}, 'Shirt L'),
+            ({'size': 'Hidden'}, 'Shirt '),
+        ])
+
+    def test_controlled_spawns_prune_combinations(self):
+        self.strings['blue'].controlled_by_spawn = self.strings['small']
+        self.strings['blue'].save()
+        self.assertEqual([content for _, content in self.variants(self.shirt)], ['Shirt S blue', 'Shirt L', 'Shirt '])
+
+    def test_repeated_conditional_renders_one_choice(self):
+        self.shirt.content = '{{size}}/{{size}}'
+        self.shirt.save()
+        self.assertEqual([content for _, content in self.variants(self.shirt, limit=3)], ['S red/S red', 'S blue/S blue', 'L/L'])
+
+    def test_sampling_returns_distinct_valid_variants(self):
+        renderer = VariantRenderer.for_project(self.project)
+        samples = list(renderer.sample(self.shirt, 10, seed=1))
+        self.assertEqual(len(samples), 4)
+        self.assertCountEqual([variant.content for variant in samples], [content for _, content in self.variants(self.shirt)])
+
+    def test_subtree_limit(self):
+        renderer = VariantRenderer.for_project(self.project, max_subtree_variants=1)
+        with self.assertRaises(VariantLimitExceeded):
+            list(renderer.variants(self.shirt))
+
+    def test_variants_endpoint_streams_ndjson(self):
+        response = self.client.get(f'/api/projects/{self.project.id}/variants/?string={self.shirt.id}&limit=2')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(lines, [
+            {'string': self.shirt.id, 'selection': {'size': 'small', 'color': 'red'}, 'content': 'Shirt S red'},
+            {'string': self.shirt.id, 'selection': {'size': 'small', 'color': 'blue'}, 'content': 'Shirt S blue'},
+        ])
+        self.assertEqual(self.client.get(f'/api/projects/{self.project.id}/variants/?limit=0').status_code, 400)
+        response = self.client.get(f'/api/strings/{self.strings["small"].id}/variants/')
+        self.assertEqual([json.loads(line)['content'] for line in b''.join(response.streaming_content).decode().splitlines()], ['S red', 'S blue'])
+
+    def test_csv_export_renders_selected_spawns(self):
+        self.strings['blue'].controlled_by_spawn = self.strings['small']
+        self.strings['blue'].save()
+        response = self.client.post(
+            f'/api/projects/{self.project.id}/download-csv/',
+            {'selected_dimension_values': {str(self.dimensions['size'].id): 'small'}}, format='json',
+        )
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row[:3] for row in rows[1:]], [[str(self.strings['small'].id), 'S {{color}}', 'S blue']])
+
+    def test_csv_export_rejects_malformed_filters(self):
+        path = f'/api/projects/{self.project.id}/download-csv/'
+        for filters in ({'size': 'small'}, {str(self.dimensions['size'].id): ['small']}, ['small']):
+            response = self.client.post(path, {'selected_dimension_values': filters}, format='json')
+            self.assertEqual(response.status_code, 400, filters)
+
+    def test_csv_export_reports_strings_over_the_variant_limit(self):
+        with mock.patch.object(VariantRenderer, 'render', side_effect=VariantLimitExceeded('"size" has too many renderings')):
+            response = self.client.post(
+                f'/api/projects/{self.project.id}/download-csv/',
+                {'selected_dimension_values': {str(self.dimensions['size'].id): 'small'}}, format='json',
+            )
+            rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row[2] for row in rows[1:]], ['Error: "size" has too many renderings'])
+
+
+class SearchTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_project = Project.objects.create(name='Other', user=self.user)
+        self.title = String.objects.create(
+            project=self.project, content='Hello there', variable_hash='welcome-title', display_name='Welcome banner'
+        )
+        self.footer = String.objects.create(project=self.project, content='Welcome to the footer', variable_hash='footer')
+        self.button = String.objects.create(
+            project=self.other_project, content='Pay', variable_hash='checkout-button', display_name='Buy now', is_published=True
+        )
+        stranger = User.objects.create_user(username='stranger', password='password')
+        String.objects.create(project=Project.objects.create(name='Theirs', user=stranger), content='Welcome', variable_hash='welcome')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/strings/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_ranks_identifier_matches_first(self):
+        self.assertEqual(self.search('welcome'), [self.title.id, self.footer.id])
+        self.assertEqual(self.search('footer'), [self.footer.id])
+
+    def test_prefix_and_substring_matches(self):
+        self.assertEqual(self.search('welc'), [self.title.id, self.footer.id])
+        self.assertEqual(self.search('kout-but'), [self.button.id])
+        self.assertEqual(self.search('fo'), [self.footer.id])
+        self.assertEqual(self.search(''), [])
+
+    def test_filters(self):
+        self.assertEqual(self.search('welcome', project=self.other_project.id), [])
+        self.assertEqual(self.search('pay', published='true'), [self.button.id])
+        self.assertEqual(self.search('pay', published='false'), [])
+        self.assertEqual(self.search('hello', conditional='false', limit=1), [self.title.id])
+
+    def test_index_follows_bulk_writes(self):
+        String.objects.filter(id=self.footer.id).update(content='Goodbye')
+        String.objects.bulk_create([String(project=self.project, content='Fresh', variable_hash='bulk-made')])
+        self.title.delete()
+        self.assertEqual(self.search('welcome'), [])
+        self.assertEqual(self.search('goodbye'), [self.footer.id])
+        self.assertEqual(len(self.search('fresh')), 1)
+
+    def test_registry_search(self):
+        response = self.client.get('/api/registry/', {'q': 'buy'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.button.id])
+        self.assertEqual(self.client.get('/api/registry/', {'q': 'welcome'}).data['results'], [])
+
+
+class RegistryTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_project = Project.objects.create(name='Other', user=self.user)
+        self.strings = [
+            String.objects.create(
+                project=self.project if index % 2 else self.other_project,
+                content=f'Published {index}', variable_hash=f'published-{index}', is_published=True,
+            )
+            for index in range(5)
+        ]
+        String.objects.create(project=self.project, content='Draft', variable_hash='draft')
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        first = self.client.get('/api/registry/', {'page_size': 2})
+        seen = self.ids(first)
+        # A string touched between pages moves to the front without being repeated or skipped further on
+        self.strings[4].save()
+        response = first
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += self.ids(response)
+        self.assertEqual(seen, [string.id for string in reversed(self.strings)])
+
+    def test_filters(self):
+        self.assertEqual(self.ids(self.client.get('/api/registry/', {'project': self.project.id})), [self.strings[3].id, self.strings[1].id])
+        self.assertEqual(self.ids(self.client.get('/api/registry/', {'q': 'published-2'})), [self.strings[2].id])
+        since = String.objects.get(id=self.strings[3].id).updated_at.isoformat()
+        self.assertEqual(self.ids(self.client.get('/api/registry/', {'updated_since': since})), [self.strings[4].id, self.strings[3].id])
+        self.assertEqual(self.client.get('/api/registry/', {'updated_since': 'yesterday'}).status_code, 400)
+
+    def test_resolved_content(self):
+        String.objects.create(project=self.project, content='Draft world', variable_hash='world')
+        string = String.objects.create(project=self.project, content='Hello {{world}} {{nobody}}', is_published=True)
+        result = self.client.get('/api/registry/', {'fields': 'id,content,resolved_content', 'page_size': 1}).data['results'][0]
+        self.assertEqual(result, {'id': string.id, 'content': 'Hello {{world}} {{nobody}}', 'resolved_content': 'Hello Draft world {{nobody}}'})
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/registry/', {'fields': 'id,project_name', 'page_size': 1})
+        self.assertEqual(response.data['results'], [{'id': self.strings[4].id, 'project_name': 'Other'}])
+        self.assertEqual(self.client.get('/api/registry/', {'fields': 'id,secret'}).status_code, 400)
+
+
+def completion(text):
+    """A stand-in for an OpenAI chat completion response."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+@override_settings(AI_JOBS_PER_USER_CONCURRENCY=1, AI_JOBS_PER_USER_QUEUED=2)
+class JobTests(ProjectTestCase):
+    openai_api_key = 'sk-test'
+
+    def submit(self):
+        return self.client.post('/api/settings/openai/test/')
+
+    def test_submit_returns_at_once_and_the_worker_stores_the_result(self):
+        with mock.patch('strings_api.ai.client_for') as client:
+            response = self.submit()
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['status'], Job.QUEUED)
+            client.assert_not_called()
+
+            client.return_value.chat.completions.create.return_value = completion(' A joke. ')
+            self.assertTrue(jobs.run_next('test'))
+            self.assertFalse(jobs.run_next('test'))
+
+        job = self.client.get(f'/api/jobs/{response.data["id"]}/').data
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual(job['result']['joke'], 'A joke.')
+
+    def test_requests_are_validated_before_queueing(self):
+        self.assertEqual(self.client.post('/api/ai/extract-text/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/ai/style-guide/').status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_per_user_limits(self):
+        first, second = self.submit(), self.submit()
+        self.assertEqual(self.submit().status_code, 429)
+        other = User.objects.create_user(username='other', password='password')
+        other_job = jobs.submit(other, 'test_connection')
+
+        # One running job per user: the owner's second job waits while the other user's is claimed
+        self.assertEqual(jobs.claim('test').id, first.data['id'])
+        self.assertEqual(jobs.claim('test').id, other_job.id)
+        self.assertIsNone(jobs.claim('test'))
+        Job.objects.filter(id=first.data['id']).update(status=Job.SUCCEEDED)
+        self.assertEqual(jobs.claim('test').id, second.data['id'])
+
+    def test_cancelled_job_discards_its_result(self):
+        job_id = self.submit().data['id']
+        job = jobs.claim('test')
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/cancel/').data['status'], Job.CANCELLED)
+        with mock.patch('strings_api.ai.client_for') as client:
+            client.return_value.chat.completions.create.return_value = completion('Too late.')
+            jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.CANCELLED, None))
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/cancel/').status_code, 409)
+
+    def test_failures_are_reported_on_the_job(self):
+        job_id = self.submit().data['id']
+        with mock.patch('strings_api.ai.client_for') as client:
+            client.return_value.chat.completions.create.side_effect = Exception('Error: invalid_api_key')
+            jobs.run_next('test')
+        job = self.client.get(f'/api/jobs/{job_id}/').data
+        self.assertEqual(job['status'], Job.FAILED)
+        self.assertEqual(job['error'], 'Invalid API key. Please check your key in Settings.')
+
+    def test_lost_jobs_are_failed(self):
+        job_id = self.submit().data['id']
+        jobs.claim('test')
+        Job.objects.filter(id=job_id).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.fail_lost_jobs(), 1)
+        self.assertEqual(Job.objects.get(id=job_id).status, Job.FAILED)
+
+    def test_finished_jobs_drop_large_inputs_and_are_pruned(self):
+        image = 'data:image/png;base64,' + 'A' * 5000
+        job_id = self.client.post('/api/ai/extract-text/', {'image': image}, format='json').data['id']
+        self.assertEqual(Job.objects.get(id=job_id).input, {'image': image})
+        with mock.patch('strings_api.ai.client_for') as client:
+            client.return_value.chat.completions.create.return_value = completion('Hello')
+            jobs.run_next('test')
+        stored = Job.objects.get(id=job_id).input['image']
+        self.assertEqual(stored, f'sha256:{hashlib.sha256(image.encode()).hexdigest()} ({len(image)} chars)')
+
+        queued = self.submit().data['id']
+        Job.objects.filter(id=job_id).update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(jobs.prune_finished_jobs(), 1)
+        self.assertEqual(list(Job.objects.values_list('id', flat=True)), [queued])
+
+    def test_jobs_are_private(self):
+        job_id = self.submit().data['id']
+        self.client.force_authenticate(User.objects.create_user(username='other', password='password'))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').status_code, 404)
+
+
+class AIResultCacheTests(ProjectTestCase):
+    openai_api_key = 'sk-test'
+
+    def setUp(self):
+        super().setUp()
+        self.strings = [
+            String.objects.create(project=self.project, content=f'Save item {index}', variable_hash=f'save-{index}', is_published=True)
+            for index in range(3)
+        ]
+        patcher = mock.patch('strings_api.ai.client_for')
+        self.create = patcher.start().return_value.chat.completions.create
+        self.create.return_value = completion('Model reply')
+        self.addCleanup(patcher.stop)
+
+    def request(self, path, data=None):
+        """POST an AI request and run the worker; returns the initial response and the finished job."""
+        response = self.client.post(path, data or {}, format='json')
+        jobs.run_next('test')
+        return response, self.client.get(f'/api/jobs/{response.data["id"]}/').data
+
+    def prompt(self):
+        return self.create.call_args.kwargs['messages'][-1]['content']
+
+    def test_repeat_image_is_answered_from_the_cache(self):
+        image = 'data:image/png;base64,' + base64.b64encode(b'image bytes').decode()
+        response, job = self.request('/api/ai/extract-text/', {'image': image})
+        self.assertEqual((response.status_code, job['result']['text']), (202, 'Model reply'))
+
+        # Same bytes, even with another media type: finished at once, no tokens spent
+        response, job = self.request('/api/ai/extract-text/', {'image': image.replace('png', 'jpeg')})
+        self.assertEqual((response.status_code, response.data['status']), (200, Job.SUCCEEDED))
+        self.assertEqual(response.data['result']['text'], 'Model reply')
+        self.assertEqual(self.create.call_count, 1)
+
+        self.request('/api/ai/extract-text/', {'image': 'data:image/png;base64,' + base64.b64encode(b'other').decode()})
+        self.assertEqual(self.create.call_count, 2)
+
+    def test_style_guide_is_cached_until_a_string_changes(self):
+        self.assertEqual(self.request('/api/ai/style-guide/')[1]['result']['strings_analyzed'], 3)
+        response, _ = self.request('/api/ai/style-guide/')
+        self.assertEqual((response.status_code, self.create.call_count), (200, 1))
+
+        self.strings[1].content = 'Save this item'
+        self.strings[1].save()
+        response, job = self.request('/api/ai/style-guide/')
+        self.assertEqual((response.status_code, job['status'], self.create.call_count), (202, Job.SUCCEEDED, 2))
+
+    def test_style_guide_analyzes_the_newest_strings(self):
+        for index in range(3, ai.STYLE_GUIDE_STRING_LIMIT + 1):
+            String.objects.create(project=self.project, content=f'Save item {index}', variable_hash=f'save-{index}', is_published=True)
+        self.assertEqual(self.request('/api/ai/style-guide/')[1]['result']['strings_analyzed'], ai.STYLE_GUIDE_STRING_LIMIT)
+        self.assertIn(f'Save item {ai.STYLE_GUIDE_STRING_LIMIT}', self.prompt())
+        self.assertNotIn('"Save item 0"', self.prompt())
+        self.assertEqual(self.client.post('/api/ai/style-guide/', format='json').status_code, 200)
+
+    def test_incremental_style_guide_sends_only_changed_strings(self):
+        # Without a previous guide, incremental generates a full one
+        self.assertFalse(self.request('/api/ai/style-guide/', {'incremental': True})[1]['result']['incremental'])
+        self.assertEqual(self.client.post('/api/ai/style-guide/', {'incremental': True}, format='json').status_code, 200)
+
+        self.strings[2].content = 'Keep item'
+        self.strings[2].save()
+        self.create.return_value = completion('Revised guide')
+        job = self.request('/api/ai/style-guide/', {'incremental': True})[1]
+        self.assertEqual(job['result']['style_guide'], 'Revised guide')
+        self.assertEqual((job['result']['strings_analyzed'], job['result']['incremental']), (1, True))
+        self.assertIn('Model reply', self.prompt())
+        self.assertIn('Keep item', self.prompt())
+        self.assertNotIn('Save item 0', self.prompt())
+
+        response = self.client.post('/api/ai/style-guide/', {'incremental': True}, format='json')
+        self.assertEqual(response.data['result']['style_guide'], 'Revised guide')
+        self.assertEqual(self.create.call_count, 2)
+
+    def test_incremental_style_guide_with_too_many_changes_writes_a_full_one(self):
+        self.request('/api/ai/style-guide/')
+        for index in range(3, ai.STYLE_GUIDE_STRING_LIMIT + 4):
+            String.objects.create(project=self.project, content=f'Save item {index}', variable_hash=f'save-{index}', is_published=True)
+        self.create.return_value = completion('New guide')
+        job = self.request('/api/ai/style-guide/', {'incremental': True})[1]
+        self.assertEqual((job['result']['incremental'], job['result']['strings_analyzed']), (False, ai.STYLE_GUIDE_STRING_LIMIT))
+        self.assertNotIn('Model reply', self.prompt())
+        self.assertIn(f'"Save item {ai.STYLE_GUIDE_STRING_LIMIT + 3}"', self.prompt())
+
+
+class ProfilingMiddlewareTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.strings = [
+            String.objects.create(project=self.project, content=f'Item {index}', variable_hash=f'item-{index}')
+            for index in range(3)
+        ]
+
+    def profiled(self, method, path):
+        with self.assertLogs('strings_api.profiling', 'INFO') as logs:
+            response = getattr(self.client, method)(path)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content, json.loads(logs.records[-1].getMessage())
+
+    def test_off_unless_enabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(f'/api/projects/{self.project.id}/'))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_records_timings_queries_and_size(self):
+        response, content, record = self.profiled('get', f'/api/projects/{self.project.id}/')
+        timing = response['Server-Timing']
+        self.assertIn(f'db;dur={record["db_ms"]:.1f};desc="{record["queries"]} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertEqual(record['view'], 'project-detail')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['serializer_ms'], 0)
+        self.assertEqual(record['response_bytes'], len(content))
+
+        # Streamed responses are measured as they go out
+        _, content, record = self.profiled('get', f'/api/projects/{self.project.id}/variants/')
+        self.assertEqual(record['response_bytes'], len(content))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_fingerprints_repeated_queries(self):
+        def n_plus_one(request):
+            for string in self.strings:
+                String.objects.filter(id=string.id).first()
+            list(String.objects.filter(id__in=[self.strings[0].id]))
+            list(String.objects.filter(id__in=[string.id for string in self.strings]))
+            return HttpResponse('ok')
+
+        with self.assertLogs('strings_api.profiling', 'INFO') as logs:
+            response = ProfilingMiddleware(n_plus_one)(RequestFactory().get('/api/n-plus-one/'))
+        duplicates = json.loads(logs.records[0].getMessage())['duplicate_queries']
+        self.assertEqual([duplicate['count'] for duplicate in duplicates], [3, 2])
+        self.assertTrue(duplicates[1]['sql'].startswith('SELECT "strings_api_string"."id"'))
+        self.assertIn(f'dup;desc="3x {duplicates[0]["fingerprint"]}"', response['Server-Timing'])
+
+    def test_keeps_dumps_of_the_slowest_requests(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        slowest = SlowestProfiles(directory, keep=2)
+        request = RequestFactory().get('/api/projects/')
+
+        def dump(wall_ms):
+            with slowest.profile() as profiler:
+                pass
+            return slowest.offer(profiler, wall_ms, request)
+
+        fast, slow = dump(10), dump(30)
+        self.assertIsNotNone(dump(20))
+        self.assertIsNone(dump(5))
+        self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertFalse(os.path.exists(fast))
+        self.assertTrue(os.path.exists(slow))
+        pstats.Stats(slow)
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_CPROFILE_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(PROFILING_CPROFILE_DIR=directory):
+            _, _, record = self.profiled('get', '/api/projects/')
+        self.assertEqual(os.listdir(directory), [os.path.basename(record['profile'])])
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(ProjectTestCase):
+    openai_api_key = 'sk-test'
+
+    def setUp(self):
+        super().setUp()
+        String.objects.create(project=self.project, content='Hello {{name}}', variable_hash='greeting')
+        String.objects.create(project=self.project, content='World', variable_hash='name')
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+
+    def test_requests_are_timed_per_route(self):
+        before = self.sample('strings_http_request_duration_seconds_count', route='project-detail', method='GET')
+        self.client.get(f'/api/projects/{self.project.id}/')
+        self.client.get('/api/registry/')
+        self.assertEqual(self.sample('strings_http_request_duration_seconds_count', route='project-detail', method='GET'), before + 1)
+
+        # Content is resolved when it is written
+        resolutions = self.sample('strings_variable_resolutions_total')
+        self.client.post('/api/strings/', {'project': self.project.id, 'content': 'Say {{greeting}}'}, format='json')
+        self.assertGreaterEqual(self.sample('strings_variable_resolutions_total'), resolutions + 1)
+
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'strings_http_request_duration_seconds_bucket{le="0.005",method="GET",route="registry"}', response.content)
+        self.assertIn(b'strings_http_requests_total{method="GET",route="registry",status="200"}', response.content)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_off_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+    def test_token_protects_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    def test_openai_calls_and_cache_lookups_are_counted(self):
+        image = {'image': 'data:image/png;base64,' + base64.b64encode(b'metrics').decode()}
+        hits, misses = (self.sample('strings_cache_requests_total', cache='ai_results', result=result) for result in ('hit', 'miss'))
+        calls = self.sample('strings_openai_request_duration_seconds_count', model='gpt-4o-mini')
+        errors = self.sample('strings_openai_errors_total', model='gpt-4o-mini', error='TimeoutError')
+        with mock.patch('strings_api.ai.client_for') as client:
+            create = client.return_value.chat.completions.create
+            create.side_effect = TimeoutError('timed out')
+            self.client.post('/api/ai/extract-text/', image, format='json')
+            jobs.run_next('test')
+            create.side_effect, create.return_value = None, completion('Text')
+            self.client.post('/api/ai/extract-text/', image, format='json')
+            jobs.run_next('test')
+            self.client.post('/api/ai/extract-text/', image, format='json')
+
+        self.assertEqual(self.sample('strings_cache_requests_total', cache='ai_results', result='miss'), misses + 2)
+        self.assertEqual(self.sample('strings_cache_requests_total', cache='ai_results', result='hit'), hits + 1)
+        self.assertEqual(self.sample('strings_openai_request_duration_seconds_count', model='gpt-4o-mini'), calls + 2)
+        self.assertEqual(self.sample('strings_openai_errors_total', model='gpt-4o-mini', error='TimeoutError'), errors + 1)
+
+    def test_multiprocess_mode_adds_up_the_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        worker = (
+            'import django; django.setup(); '
+            'from strings_api.metrics import RESOLUTIONS; RESOLUTIONS.inc(3)'
+        )
+        environment = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'strings_project.settings', 'PROMETHEUS_MULTIPROC_DIR': directory}
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', worker], env=environment, check=True, cwd=settings.BASE_DIR)
+
+        with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            response = self.scrape()
+        self.assertIn(b'strings_variable_resolutions_total 6.0', response.content)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CSRFRefreshTests(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient(enforce_csrf_checks=True)
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.project = Project.objects.create(name='Project', user=self.user)
+        response = self.client.post('/api/auth/login/', {'username': 'owner', 'password': 'password'}, format='json')
+        self.assertIn('csrftoken', response.cookies)
+
+    def write(self):
+        response = self.client.patch(
+            f'/api/projects/{self.project.id}/', {'name': 'Renamed'}, format='json',
+            HTTP_X_CSRFTOKEN=self.client.cookies['csrftoken'].value,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_steady_writes_leave_the_cookie_alone(self):
+        for _ in range(3):
+            self.assertNotIn('csrftoken', self.write().cookies)
+
+    def test_cookie_is_resent_near_expiry(self):
+        session = self.client.session
+        session[CSRFRefreshMiddleware.SENT_AT] = int(time.time()) - settings.CSRF_COOKIE_AGE + 60
+        session.save()
+        self.assertIn('csrftoken', self.write().cookies)
+        self.assertNotIn('csrftoken', self.write().cookies)
+
+    def test_missing_cookie_is_sent_without_creating_a_session(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(f'/api/projects/{self.project.id}/', {'name': 'Renamed'}, format='json')
+        self.assertIn('csrftoken', response.cookies)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_logout_keeps_the_cookie_deleted(self):
+        response = self.client.post('/api/auth/logout/', HTTP_X_CSRFTOKEN=self.client.cookies['csrftoken'].value)
+        self.assertEqual(response.cookies['csrftoken'].value, '')
+
+    def test_refresh_logs_are_sampled(self):
+        del self.client.cookies['csrftoken']
+        with override_settings(CSRF_REFRESH_LOG_SAMPLE_RATE=0.0), self.assertNoLogs('strings_api.middleware'):
+            self.client.post('/api/auth/login/', {'username': 'owner', 'password': 'password'}, format='json')
+        with override_settings(CSRF_REFRESH_LOG_SAMPLE_RATE=1.0), self.assertLogs('strings_api.middleware') as logs:
+            client = APIClient()
+            client.force_authenticate(self.user)
+            client.post('/api/projects/', {'name': 'New'}, format='json')
+        self.assertIn('(missing)', logs.output[0])
+
+    def test_write_overhead(self):
+        """
+        Per-write cost of the middleware under a stream of writes from one
+        session (STRINGS_BENCHMARK_CSRF_WRITES of them), against a bare
+        handler and against resending the cookie on every write; printed with
+        STRINGS_BENCHMARK_REPORT=1. Only the first write refreshes the cookie
+        or touches the database.
+        """
+        writes = int(os.environ.get('STRINGS_BENCHMARK_CSRF_WRITES', '2000'))
+        session = SessionStore()
+        session.create()
+        factory = RequestFactory()
+
+        def resend_every_write(request):
+            response = HttpResponse()
+            response.set_cookie('csrftoken', get_token(request))
+            return response
+
+        def run(handler):
+            started = time.perf_counter()
+            for _ in range(writes):
+                request = factory.patch('/api/strings/1/')
+                request.COOKIES['csrftoken'] = 'x' * 32
+                request.session = session
+                handler(request)
+            return (time.perf_counter() - started) / writes * 1e6
+
+        middleware = CSRFRefreshMiddleware(lambda request: HttpResponse())
+        run(middleware)
+        session.save()
+        session.modified = False
+        with CaptureQueriesContext(connection) as queries:
+            bare, refreshing, resending = run(lambda request: HttpResponse()), run(middleware), run(resend_every_write)
+        self.assertEqual(len(queries), 0)
+        self.assertFalse(session.modified)
+        if BENCHMARK_REPORT:
+            print(
+                f'\nCSRF refresh over {writes} writes: {refreshing - bare:.2f} us per write '
+                f'(resending every write: {resending - bare:.2f} us)'
+            )
+
+
+class ProjectSnapshotTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.string = String.objects.create(project=self.project, content='Hello', variable_hash='hello')
+        self.path = f'/api/projects/{self.project.id}/'
+
+    def test_repeat_reads_are_served_from_the_snapshot(self):
+        first = self.client.get(self.path)
+        self.assertNotIn('Content-Encoding', first)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.path, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(len(queries), 1)  # The version lookup behind the ETag
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(brotli.decompress(response.content), first.content)
+        response = self.client.get(self.path, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(response.content), first.content)
+        self.assertEqual(self.client.get(self.path).content, first.content)
+
+    def test_changes_drop_the_snapshot(self):
+        self.client.get(self.path)
+        self.client.patch(f'/api/strings/{self.string.id}/', {'content': 'Hi'}, format='json')
+        self.assertIsNone(caches['snapshots'].get(f'snapshot:project:{self.project.id}'))
+        self.assertEqual(self.client.get(self.path).json()['strings'][0]['content'], 'Hi')
+
+        # Writes that skip signals still bump the version, which the snapshot is stamped with
+        self.client.get(self.path)
+        String.objects.filter(id=self.string.id).update(content='Hey')
+        bump_project_version(pk=self.project.id)
+        self.assertEqual(self.client.get(self.path).json()['strings'][0]['content'], 'Hey')
+
+    def test_dimension_value_saves_do_not_look_up_their_project(self):
+        size = Dimension.objects.create(name='Size', project=self.project)
+        DimensionValue.objects.create(dimension=size, value='Small')
+        StringDimensionValue.objects.create(string=self.string, dimension_value=DimensionValue.objects.get())
+        self.client.get(self.path)
+
+        value, assignment = DimensionValue.objects.get(), StringDimensionValue.objects.get()
+        value.value = 'Tiny'
+        with CaptureQueriesContext(connection) as queries:
+            value.save()
+            assignment.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        # The snapshot outlives the save, but its stamp no longer matches the project's version
+        self.assertIsNotNone(caches['snapshots'].get(f'snapshot:project:{self.project.id}'))
+        self.assertEqual(self.client.get(self.path).json()['dimensions'][0]['values'][0]['value'], 'Tiny')
+
+    def test_recreated_project_does_not_get_an_old_snapshot(self):
+        self.client.get(self.path)
+        project_id = self.project.id
+        Project.objects.filter(id=project_id).update(created_at=timezone.now() + timedelta(seconds=1))
+        String.objects.filter(id=self.string.id).update(content='Other')
+        self.assertEqual(self.client.get(f'/api/projects/{project_id}/').json()['strings'][0]['content'], 'Other')
+
+    def test_browsable_api_is_not_snapshotted(self):
+        self.client.get(self.path, HTTP_ACCEPT='text/html')
+        self.assertIsNone(caches['snapshots'].get(f'snapshot:project:{self.project.id}'))
+
+
+def inflate_columns(payload):
+    """Rebuild the nested project representation from the columnar one, like the editor does."""
+    def rows(table):
+        return [dict(zip(table, values)) for values in zip(*table.values())]
+
+    dimensions = [dict(dimension, values=[]) for dimension in rows(payload['dimensions'])]
+    values = rows(payload['dimension_values'])
+    for value in values:
+        dimension = dimensions[value['dimension']]
+        value['dimension'] = dimension['id']
+        dimension['values'].append(value)
+    strings = [
+        dict(string, project=payload['project']['id'], dimension_values=[],
+             effective_variable_name=string['variable_name'] or string['variable_hash'])
+        for string in rows(payload['strings'])
+    ]
+    assignments = payload['assignments']
+    for (string_row, value_row), assignment_id, created_at in zip(assignments['pairs'], assignments['id'], assignments['created_at']):
+        string, value = strings[string_row], values[value_row]
+        string['dimension_values'].append({
+            'id': assignment_id, 'string': string['id'], 'dimension_value': value['id'], 'created_at': created_at,
+            'dimension_value_detail': {'id': value['id'], 'value': value['value'], 'dimension': value['dimension']},
+        })
+    return dict(payload['project'], strings=strings, dimensions=dimensions)
+
+
+class ColumnarProjectTests(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project.description = 'Copy'
+        self.project.save()
+        size = Dimension.objects.create(name='Size', project=self.project)
+        tone = Dimension.objects.create(name='Tone', project=self.project)
+        small, large = (DimensionValue.objects.create(dimension=size, value=value) for value in ('Small', 'Large'))
+        DimensionValue.objects.create(dimension=tone, value='Formal')
+        greeting = String.objects.create(project=self.project, content='Hello', variable_hash='greeting')
+        spawn = String.objects.create(project=self.project, content='Hi {{greeting}}', is_conditional=True, variable_name='spawn')
+        String.objects.create(project=self.project, content='{{spawn}}', controlled_by_spawn=spawn, is_published=True)
+        StringDimensionValue.objects.create(string=spawn, dimension_value=large)
+        StringDimensionValue.objects.create(string=greeting, dimension_value=small)
+        StringDimensionValue.objects.create(string=spawn, dimension_value=small)
+        self.path = f'/api/projects/{self.project.id}/'
+
+    def test_columnar_payload_has_the_same_content(self):
+        response = self.client.get(f'{self.path}?format=columnar')
+        self.assertEqual(response['Content-Type'], 'application/vnd.strings.columnar+json')
+        payload = response.json()
+        self.assertEqual(payload['schema'], 'columnar/1')
+        self.assertEqual(len(payload['assignments']['pairs']), 3)
+        self.assertEqual(inflate_columns(payload), self.client.get(self.path).json())
+
+    def test_msgpack_by_accept_header(self):
+        response = self.client.get(self.path, HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get(f'{self.path}?format=columnar').json())
+
+    def test_formats_have_their_own_etags_and_snapshots(self):
+        etags = {
+            self.client.get(self.path, HTTP_ACCEPT=accept)['ETag']
+            for accept in ('application/json', 'application/vnd.strings.columnar+json', 'application/x-msgpack')
+        }
+        self.assertEqual(len(etags), 3)
+
+        first = self.client.get(f'{self.path}?format=msgpack')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.path}?format=msgpack', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(gzip.decompress(response.content), first.content)
+        self.assertEqual(
+            self.client.get(f'{self.path}?format=msgpack', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304,
+        )
+
+    def test_other_project_actions_only_speak_json(self):
+        self.assertEqual(self.client.get('/api/projects/?format=msgpack').status_code, 404)
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers chat completions like the OpenAI API, recording connections and keys."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.keys.append(self.headers['Authorization'])
+        status, body = self.server.responses.pop(0) if self.server.responses else (200, {
+            'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': 0, 'model': 'stub',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'Stub reply'}}],
+        })
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OpenAIClientPoolTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings = override_settings(
+            OPENAI_BASE_URL=f'http://127.0.0.1:{cls.server.server_address[1]}/v1',
+            OPENAI_MAX_RETRIES=1, OPENAI_CLIENT_CACHE_SIZE=2,
+        )
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        openai_clients.reset()
+        self.server.connections, self.server.keys, self.server.responses = 0, [], []
+
+    def tearDown(self):
+        openai_clients.reset()
+
+    def ask(self, api_key):
+        response = openai_clients.client_for(api_key).chat.completions.create(
+            model='stub', messages=[{'role': 'user', 'content': 'Hi'}]
+        )
+        return response.choices[0].message.content
+
+    def test_repeated_calls_reuse_the_client_and_connection(self):
+        self.assertEqual([self.ask('sk-one'), self.ask('sk-one'), self.ask('sk-two')], ['Stub reply'] * 3)
+        self.assertIs(openai_clients.client_for('sk-one'), openai_clients.client_for('sk-one'))
+        # Keys are per request; every client shares the one pooled connection
+        self.assertEqual(self.server.keys, ['Bearer sk-one', 'Bearer sk-one', 'Bearer sk-two'])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_least_recently_used_clients_are_evicted(self):
+        one, two = openai_clients.client_for('sk-one'), openai_clients.client_for('sk-two')
+        openai_clients.client_for('sk-one')
+        openai_clients.client_for('sk-three')
+        self.assertIs(openai_clients.client_for('sk-one'), one)
+        self.assertIsNot(openai_clients.client_for('sk-two'), two)
+
+    def test_clients_expire(self):
+        now = [0.0]
+        pool = openai_clients.ClientPool(max_size=10, ttl=60, clock=lambda: now[0])
+        client = pool.get('sk-one')
+        now[0] = 59
+        self.assertIs(pool.get('sk-one'), client)
+        now[0] = 61
+        self.assertIsNot(pool.get('sk-one'), client)
+        pool.close()
+
+    def test_failed_calls_are_retried(self):
+        error = {'error': {'message': 'Overloaded', 'type': 'server_error'}}
+        self.server.responses = [(500, error)]
+        self.assertEqual(self.ask('sk-one'), 'Stub reply')
+        self.server.responses = [(500, error), (500, error)]
+        with self.assertRaises(Exception):
+            self.ask('sk-one')
+        self.assertEqual(len(self.server.keys), 4)
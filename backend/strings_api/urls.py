@@ -8,6 +8,7 @@ router.register(r'strings', views.StringViewSet, basename='string')
 router.register(r'dimensions', views.DimensionViewSet, basename='dimension')
 router.register(r'dimension-values', views.DimensionValueViewSet, basename='dimension-value')
 router.register(r'string-dimension-values', views.StringDimensionValueViewSet, basename='string-dimension-value')
+router.register(r'jobs', views.JobViewSet, basename='job')
 
 urlpatterns = [
     path('', include(router.urls)),
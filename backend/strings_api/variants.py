@@ -0,0 +1,249 @@
+"""
+Variant-matrix renderer.
+
+A string that embeds conditionals renders differently for every choice of
+spawn. VariantRenderer enumerates (or samples) those renderings:
+
+- a conditional's options are the values of the dimension sharing its name
+  that name a spawn, plus "Hidden" (renders as nothing) if the dimension has it;
+- only conditionals actually reached under a selection are branched on, so a
+  conditional inside one spawn doesn't multiply the renderings of its siblings;
+- controlled_by_spawn is enforced: once a controller spawn is chosen, the
+  spawn it controls is the only option left for that spawn's conditional;
+- each string's renderings are expanded once and shared by every string and
+  combination that embeds it; only the string being rendered is combined
+  lazily, so results stream out without building the full matrix.
+
+A variant is a (selection, content) pair where selection maps conditional
+name -> chosen spawn name (or "Hidden") for the conditionals it went through.
+"""
+import random
+from collections import defaultdict, namedtuple
+from django.db import models
+from .resolution import embed, tokenize
+
+HIDDEN = 'Hidden'
+DEFAULT_MAX_SUBTREE_VARIANTS = 10000
+
+Variant = namedtuple('Variant', ['selection', 'content'])
+
+
+class VariantLimitExceeded(Exception):
+    """An embedded string has more renderings than the renderer is allowed to hold in memory."""
+
+
+class VariantRenderer:
+
+    def __init__(self, strings, dimensions, max_subtree_variants=DEFAULT_MAX_SUBTREE_VARIANTS):
+        self.max_subtree_variants = max_subtree_variants
+        self.strings = {}  # id -> String
+        self._by_name = {}
+        for string in strings:
+            self.strings[string.id] = string
+            # First match wins, as in VariableResolver
+            for key in (string.variable_name, string.variable_hash):
+                if key:
+                    self._by_name.setdefault(key, string)
+
+        self._options = {}  # conditional name -> spawn names / HIDDEN, in dimension value order
+        conditionals_of_spawn = defaultdict(list)
+        for dimension in dimensions:
+            options = [
+                value.value for value in dimension.values.all()
+                if value.value == HIDDEN or value.value in self._by_name
+            ]
+            self._options[dimension.name] = options
+            for option in options:
+                conditionals_of_spawn[option].append(dimension.name)
+
+        # controller spawn name -> [(conditional name, controlled spawn name)]
+        self._controls = defaultdict(list)
+        for string in self.strings.values():
+            controller = self.strings.get(string.controlled_by_spawn_id)
+            if controller is None:
+                continue
+            name = _name(string)
+            for conditional in conditionals_of_spawn.get(name, ()):
+                self._controls[_name(controller)].append((conditional, name))
+
+        self._expanded = {}
+
+    @classmethod
+    def for_project(cls, project, **kwargs):
+        """Load the project's strings and dimensions in three queries."""
+        from .models import DimensionValue
+
+        strings = project.strings.only(
+            'id', 'project_id', 'content', 'variable_name', 'variable_hash', 'is_conditional_container',
+            'controlled_by_spawn_id',
+        )
+        values = models.Prefetch('values', queryset=DimensionValue.objects.order_by('id'))
+        return cls(strings, project.dimensions.prefetch_related(values), **kwargs)
+
+    def variants(self, string, limit=None):
+        """Yield every valid Variant of a string, in option order."""
+        for count, (selection, content) in enumerate(self._combine(string.id, {}), start=1):
+            yield Variant(selection, content)
+            if limit is not None and count >= limit:
+                return
+
+    def sample(self, string, count, seed=None):
+        """
+        Yield up to `count` distinct Variants picked at random, for strings
+        whose full matrix is too large to enumerate.
+        """
+        rng = random.Random(seed)
+        alternatives = self._alternatives(string.id)
+        seen = set()
+        for _ in range(count * 10):
+            if len(seen) >= count:
+                return
+            selection, parts = {}, []
+            for options in alternatives:
+                choice_selection, text = rng.choice(options)
+                selection = self._merge(selection, choice_selection)
+                if selection is None:
+                    break
+                parts.append(text)
+            if selection is None:
+                continue
+            key = tuple(sorted(selection.items()))
+            if key not in seen:
+                seen.add(key)
+                yield Variant(selection, ''.join(parts))
+
+    def render(self, string, selection):
+        """
+        Render a string under a (possibly partial) selection. Conditionals the
+        selection leaves open fall back to their first valid option, as the
+        project page does.
+        """
+        for _, content in self._combine(string.id, dict(selection)):
+            return content
+        return string.content
+
+    # Expansion
+
+    def _combine(self, string_id, selection):
+        # Lazy product over the string's tokens; each token's alternatives are pre-expanded
+        alternatives = self._alternatives(string_id)
+
+        def walk(index, selection, parts):
+            if index == len(alternatives):
+                yield selection, ''.join(parts)
+                return
+            for choice_selection, text in alternatives[index]:
+                merged = self._merge(selection, choice_selection)
+                if merged is not None:
+                    parts.append(text)
+                    yield from walk(index + 1, merged, parts)
+                    parts.pop()
+
+        initial = self._merge({}, selection)
+        if initial is not None:
+            yield from walk(0, initial, [])
+
+    def _alternatives(self, string_id):
+        """Per-token lists of (selection, text) for a string, literals included."""
+        # Expand what the string embeds, but not the string itself, which is combined lazily
+        self._expand(self._children(string_id), active={string_id})
+        return [
+            [({}, token)] if index % 2 == 0 else self._token_alternatives(token, active=frozenset())
+            for index, token in enumerate(tokenize(self.strings[string_id].content))
+        ]
+
+    def _token_alternatives(self, name, active):
+        target = self._by_name.get(name)
+        if target is None:
+            return [({}, embed(name))]
+        if not target.is_conditional_container:
+            if target.id in active or target.id not in self._expanded:
+                return [({}, embed(name))]
+            return self._expanded[target.id]
+
+        conditional = _name(target)
+        alternatives = []
+        for option in self._options.get(conditional, ()):
+            if option == HIDDEN:
+                alternatives.append(({conditional: HIDDEN}, ''))
+                continue
+            spawn = self._by_name[option]
+            if spawn.id in active or spawn.id not in self._expanded:
+                alternatives.append(({conditional: option}, embed(option)))
+                continue
+            for spawn_selection, text in self._expanded[spawn.id]:
+                merged = self._merge({conditional: option}, spawn_selection)
+                if merged is not None:
+                    alternatives.append((merged, text))
+        # A conditional without spawns renders as nothing
+        return alternatives or [({}, '')]
+
+    def _children(self, string_id):
+        for name in tokenize(self.strings[string_id].content)[1::2]:
+            target = self._by_name.get(name)
+            if target is None:
+                continue
+            if not target.is_conditional_container:
+                yield target.id
+                continue
+            for option in self._options.get(_name(target), ()):
+                if option != HIDDEN:
+                    yield self._by_name[option].id
+
+    def _expand(self, string_ids, active):
+        # Iterative post-order walk, like VariableResolver, so deep embed chains can't hit the recursion limit
+        active = set(active)
+        stack = [(string_id, False) for string_id in string_ids]
+        while stack:
+            string_id, expanded = stack.pop()
+            if string_id in self._expanded:
+                continue
+            if expanded:
+                active.discard(string_id)
+                self._expanded[string_id] = self._fold(string_id, frozenset(active))
+                continue
+            active.add(string_id)
+            stack.append((string_id, True))
+            for child_id in self._children(string_id):
+                if child_id not in self._expanded and child_id not in active:
+                    stack.append((child_id, False))
+
+    def _fold(self, string_id, active):
+        combined = [({}, '')]
+        for index, token in enumerate(tokenize(self.strings[string_id].content)):
+            if index % 2 == 0:
+                if token:
+                    combined = [(selection, text + token) for selection, text in combined]
+                continue
+            alternatives = self._token_alternatives(token, active | {string_id})
+            combined = [
+                (merged, text + alternative_text)
+                for selection, text in combined
+                for alternative_selection, alternative_text in alternatives
+                for merged in [self._merge(selection, alternative_selection)]
+                if merged is not None
+            ]
+            if len(combined) > self.max_subtree_variants:
+                raise VariantLimitExceeded(
+                    f'"{_name(self.strings[string_id])}" has more than {self.max_subtree_variants} renderings; '
+                    f'sample it instead.'
+                )
+        return combined
+
+    def _merge(self, selection, other):
+        """Union of two selections, or None if they conflict or break a controlled_by_spawn rule."""
+        if not other:
+            return selection
+        merged = dict(selection)
+        for conditional, choice in other.items():
+            if merged.setdefault(conditional, choice) != choice:
+                return None
+        for choice in merged.values():
+            for conditional, controlled in self._controls.get(choice, ()):
+                if merged.get(conditional, controlled) != controlled:
+                    return None
+        return merged
+
+
+def _name(string):
+    return string.variable_name or string.variable_hash
@@ -2,6 +2,7 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.models import User
 from django.middleware.csrf import get_token
@@ -11,20 +12,155 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.db import models
-from django.db.models.signals import post_save
-from .models import Project, String, Dimension, DimensionValue, StringDimensionValue, UserProfile
-from .serializers import ProjectSerializer, StringSerializer, DimensionSerializer, DimensionValueSerializer, StringDimensionValueSerializer
+from django.views.decorators.http import condition
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.db import models, transaction
+from .models import Project, String, Dimension, DimensionValue, StringDimensionValue, StringReference, Tombstone, UserProfile, Job, tombstone_cutoff
+from .serializers import ProjectSerializer, ProjectSummarySerializer, StringSerializer, StringBatchSerializer, DimensionSerializer, DimensionValueSerializer, StringDimensionValueSerializer, JobSerializer
+from .pagination import ProjectCursorPagination, RegistryCursorPagination
+from .hashing import HashAllocator
+from .graph import DependencyGraph, dependents
+from .variants import VariantRenderer, VariantLimitExceeded
+from .search import search_filter, search_strings
+from .renderers import ColumnarJSONRenderer, MessagePackRenderer
+from . import ai, columnar, jobs, snapshots
 from rest_framework import serializers
 import logging
+from datetime import timedelta
 import csv
-import io
-from django.http import HttpResponse
-import re
-from openai import OpenAI
+import hashlib
+import json
+from django.http import StreamingHttpResponse
 
 logger = logging.getLogger(__name__)
 
+# Rows per INSERT/UPDATE statement for bulk operations
+BULK_BATCH_SIZE = 1000
+# Project detail formats kept in the snapshot cache (not the browsable API)
+SNAPSHOT_FORMATS = ('json',) + columnar.FORMATS
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer rows."""
+
+    def write(self, value):
+        return value
+
+
+def project_etag(request, pk=None, *args, **kwargs):
+    """
+    ETag for a project detail response: one indexed lookup of the project's
+    version, plus the payload format for the columnar ones. The project's
+    snapshot stamp is kept on the request for retrieve().
+    """
+    try:
+        row = Project.objects.filter(pk=pk, user=request.user).values_list('id', 'version', 'created_at').first()
+    except (TypeError, ValueError):
+        return None
+    if row is None:
+        return None
+    project_id, version, created_at = row
+    request.project_snapshot = (project_id, snapshots.project_stamp(created_at, version))
+    format = request.accepted_renderer.format
+    return f'project-{pk}-v{version}-{format}' if format in columnar.FORMATS else f'project-{pk}-v{version}'
+
+
+def registry_etag(request, *args, **kwargs):
+    """ETag for the registry: a digest of the user's project versions and the query string."""
+    digest = hashlib.sha256(f'{request.user.pk}?{request.META.get("QUERY_STRING", "")}'.encode())
+    for project_id, version in Project.objects.filter(user=request.user).order_by('id').values_list('id', 'version'):
+        digest.update(f';{project_id}:{version}'.encode())
+    return f'registry-{digest.hexdigest()[:32]}'
+
+
+def revalidate(response):
+    """Let browsers cache the response but revalidate it (If-None-Match) on every use."""
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def parse_timestamp(value, param, message='Invalid timestamp.'):
+    """An aware datetime from an ISO 8601 query parameter, None if it is absent."""
+    if not value:
+        return None
+    try:
+        timestamp = parse_datetime(value)
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise serializers.ValidationError({param: message})
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def parse_dimension_filters(value):
+    """{dimension id: selected value} from a {"<dimension id>": value or null} mapping; nulls are left out."""
+    if not isinstance(value, dict):
+        raise serializers.ValidationError({'selected_dimension_values': 'Expected an object of dimension ids to values.'})
+    filters = {}
+    for dimension_id, selected_value in value.items():
+        if selected_value is None:
+            continue
+        if not dimension_id.isdigit() or not isinstance(selected_value, str):
+            raise serializers.ValidationError({'selected_dimension_values': f'Invalid filter "{dimension_id}".'})
+        filters[int(dimension_id)] = selected_value
+    return filters
+
+
+def filter_strings(strings, params):
+    """Narrow a String queryset by the `project`, `published` and `conditional` query parameters."""
+    project = params.get('project')
+    if project:
+        try:
+            strings = strings.filter(project_id=int(project))
+        except ValueError:
+            raise serializers.ValidationError({'project': 'Must be an integer.'})
+    for param, field in (('published', 'is_published'), ('conditional', 'is_conditional_container')):
+        value = params.get(param)
+        if value in ('1', 'true'):
+            strings = strings.filter(**{field: True})
+        elif value in ('0', 'false'):
+            strings = strings.filter(**{field: False})
+    return strings
+
+
+def variant_params(request, names):
+    """Integer query parameters for the variants endpoints; limit and sample must be positive."""
+    params = {}
+    for param in names:
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        try:
+            params[param] = int(value)
+        except ValueError:
+            raise serializers.ValidationError({param: 'Must be an integer.'})
+        if param in ('limit', 'sample') and params[param] < 1:
+            raise serializers.ValidationError({param: 'Must be at least 1.'})
+    return params
+
+
+def stream_variants(renderer, strings, params):
+    """NDJSON response with the variants of each string, one per line."""
+    def lines():
+        for string in strings:
+            try:
+                if 'sample' in params:
+                    variants = renderer.sample(string, params['sample'], seed=params.get('seed'))
+                else:
+                    variants = renderer.variants(string, limit=params.get('limit'))
+                for variant in variants:
+                    yield json.dumps({'string': string.id, 'selection': variant.selection, 'content': variant.content}) + '\n'
+            except VariantLimitExceeded as exc:
+                yield json.dumps({'string': string.id, 'error': str(exc)}) + '\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
 @ensure_csrf_cookie
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -176,247 +312,346 @@ def me(request):
 class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProjectCursorPagination
 
     def get_queryset(self):
-        return Project.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Project.objects.filter(user=self.request.user).order_by('-created_at')
+        if self.action == 'list':
+            queryset = ProjectSummarySerializer.with_summary_counts(queryset)
+        elif self.action == 'retrieve' and self.request.accepted_renderer.format not in columnar.FORMATS:
+            queryset = ProjectSerializer.setup_eager_loading(queryset)
+        return queryset
+
+    def get_renderers(self):
+        # The detail can also be had as columns, in JSON or MessagePack
+        renderers = super().get_renderers()
+        if self.action == 'retrieve':
+            renderers += [ColumnarJSONRenderer(), MessagePackRenderer()]
+        return renderers
+
+    def get_serializer_class(self):
+        # The list only needs counts; nested strings are served on retrieve
+        if self.action == 'list':
+            return ProjectSummarySerializer
+        return ProjectSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @method_decorator(condition(etag_func=project_etag))
+    def retrieve(self, request, *args, **kwargs):
+        # An unchanged project is answered with 304 before anything is serialized,
+        # and a changed one from its snapshot once any worker has serialized it
+        snapshot = getattr(request, 'project_snapshot', None)
+        format = request.accepted_renderer.format
+        if snapshot is None or format not in SNAPSHOT_FORMATS:
+            return revalidate(self._retrieve(request, *args, **kwargs))
+        project_id, stamp = snapshot
+        payloads = snapshots.get(project_id, stamp, format)
+        if payloads is not None:
+            response = snapshots.response(payloads, request, request.accepted_renderer.media_type)
+            patch_vary_headers(response, ['Accept'])
+            return revalidate(response)
+
+        def store(rendered):
+            snapshots.put(project_id, stamp, rendered.content, format)
+
+        response = self._retrieve(request, *args, **kwargs)
+        response.add_post_render_callback(store)
+        patch_vary_headers(response, ['Accept'])
+        return revalidate(response)
+
+    def _retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format in columnar.FORMATS:
+            return Response(columnar.project_columns(self.get_object()))
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['post'], url_path='download-csv')
     def download_csv(self, request, pk=None):
         """
         Download CSV for filtered strings based on current filter state.
         Accepts filter parameters to determine which strings to include.
+        Rows are streamed straight from the materialized resolved_content
+        column, so large exports start immediately and don't build the
+        whole file in memory. When filters are selected, conditionals are
+        rendered with the selected spawns instead; a string with too many
+        renderings to expand gets the error in its Processed Content cell,
+        since the response has already started when it is reached.
         """
         project = self.get_object()
         
         # Get filter parameters from request
         selected_dimension_values = request.data.get('selected_dimension_values', {})
+        filters = parse_dimension_filters(selected_dimension_values)
         
-        # Get all strings for the project
-        strings = project.strings.all()
-        
-        # Apply dimension filtering (same logic as frontend)
+        # Apply dimension filtering (same logic as frontend) in the database:
+        # strings need at least one dimension value and must match ALL selected filters
+        strings = project.strings.only('id', 'project_id', 'content', 'resolved_content', 'created_at')
         if selected_dimension_values:
-            filtered_strings = []
-            for string in strings:
-                # Check if string has dimension values
-                if not string.dimension_values.exists():
-                    continue  # String has no dimension values, skip it
-                
-                # Check if string matches ALL selected dimension filters
-                matches_all_filters = True
-                for dimension_id_str, selected_value in selected_dimension_values.items():
-                    if selected_value is None:
-                        continue
-                    
-                    dimension_id = int(dimension_id_str)
-                    string_has_matching_value = string.dimension_values.filter(
+            strings = strings.filter(models.Exists(
+                StringDimensionValue.objects.filter(string=models.OuterRef('pk'))
+            ))
+            for dimension_id, selected_value in filters.items():
+                strings = strings.filter(models.Exists(
+                    StringDimensionValue.objects.filter(
+                        string=models.OuterRef('pk'),
                         dimension_value__dimension_id=dimension_id,
-                        dimension_value__value=selected_value
-                    ).exists()
-                    
-                    if not string_has_matching_value:
-                        matches_all_filters = False
-                        break
-                
-                if matches_all_filters:
-                    filtered_strings.append(string)
-            
-            strings = filtered_strings
+                        dimension_value__value=selected_value,
+                    )
+                ))
         
-        # Process strings with current filters
-        processed_strings = []
-        for string in strings:
-            processed_content = self._process_string_content(
-                string.content, 
-                project, 
-                selected_dimension_values
-            )
-            processed_strings.append({
-                'id': string.id,
-                'original_content': string.content,
-                'processed_content': processed_content,
-                'created_at': string.created_at
-            })
-        
-        # Generate CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        headers = ['String ID', 'Original Content', 'Processed Content', 'Created At']
-        writer.writerow(headers)
-        
-        # Write data rows
-        for string_data in processed_strings:
-            writer.writerow([
-                string_data['id'],
-                string_data['original_content'],
-                string_data['processed_content'],
-                string_data['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        # Create HTTP response
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
+        renderer = None
+        if filters:
+            renderer = VariantRenderer.for_project(project)
+            dimension_names = dict(project.dimensions.values_list('id', 'name'))
+            selection = {
+                dimension_names[dimension_id]: selected_value
+                for dimension_id, selected_value in filters.items()
+                if dimension_id in dimension_names
+            }
+        
+        def processed(string):
+            if not renderer:
+                return string.resolved_content
+            try:
+                return renderer.render(string, selection)
+            except VariantLimitExceeded as exc:
+                return f'Error: {exc}'
+        
+        def rows():
+            yield ['String ID', 'Original Content', 'Processed Content', 'Created At']
+            for string in strings.iterator(chunk_size=2000):
+                yield [
+                    string.id,
+                    string.content,
+                    processed(string),
+                    string.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                ]
+        
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse((writer.writerow(row) for row in rows()), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{project.name}_filtered_strings.csv"'
         
         return response
-    
-    def _process_string_content(self, content, project, selected_dimension_values=None):
+
+    @action(detail=True, methods=['get'], url_path='changes')
+    def changes(self, request, pk=None):
         """
-        Process string content by replacing variable references with their values.
+        Everything in the project created, updated or deleted since a sync token.
+        
+        GET /api/projects/<id>/changes/?since=<token> returns the changed strings,
+        dimensions, dimension values and assignments, the ids deleted since
+        (from tombstones) and a new token for the next call. Without `since`
+        everything is returned, and `full` is true: the payload replaces the
+        client's copy instead of being merged into it. Tombstones are pruned
+        after PROJECT_CHANGES_RETENTION seconds, so tokens older than that
+        get the same full response.
+        
+        Tokens are timestamps, but a row's updated_at is set before its
+        transaction commits, so a write committing after a token was issued
+        can carry an earlier stamp. Rows stamped up to PROJECT_CHANGES_MARGIN
+        seconds before the token are therefore sent again (clients merge by
+        id). A transaction that commits later than that after stamping its
+        rows can still be missed until the next full load.
         """
-        # Process string variables by replacing {{variableName}} with their content
-        processed_content = content
-        variable_pattern = re.compile(r'{{([^}]+)}}')
-        variables_in_content = variable_pattern.findall(processed_content)
-        
-        for variable_name in variables_in_content:
-            # Try string variable (match by name or hash)
-            string_variable = project.strings.filter(
-                models.Q(variable_name=variable_name) | models.Q(variable_hash=variable_name)
-            ).first()
-            
-            if string_variable:
-                # Recursively process string variable content
-                replacement_value = self._process_string_content(
-                    string_variable.content, 
-                    project, 
-                    selected_dimension_values
-                )
-                processed_content = processed_content.replace(f'{{{{{variable_name}}}}}', replacement_value)
-        
-        return processed_content
-    
+        # Taken before reading anything, so writes landing during this request show up next time
+        token = timezone.now()
+        project = self.get_object()
+        
+        since = parse_timestamp(request.query_params.get('since'), 'since', 'Invalid sync token.')
+        if since:
+            since -= timedelta(seconds=settings.PROJECT_CHANGES_MARGIN)
+            if since < tombstone_cutoff():
+                # Deletes from before the cutoff are no longer recorded
+                since = None
+        
+        strings = project.strings.all()
+        dimensions = project.dimensions.prefetch_related('values')
+        dimension_values = DimensionValue.objects.filter(dimension__project=project)
+        assignments = StringDimensionValue.objects.filter(string__project=project).select_related('dimension_value')
+        tombstones = project.tombstones.all()
+        if since:
+            strings = strings.filter(updated_at__gte=since)
+            dimensions = dimensions.filter(updated_at__gte=since)
+            dimension_values = dimension_values.filter(updated_at__gte=since)
+            assignments = assignments.filter(created_at__gte=since)
+            tombstones = tombstones.filter(deleted_at__gte=since)
+        
+        deleted = {kind: [] for kind in (Tombstone.STRING, Tombstone.DIMENSION, Tombstone.DIMENSION_VALUE, Tombstone.STRING_DIMENSION_VALUE)}
+        for kind, object_id in tombstones.values_list('model', 'object_id'):
+            deleted[kind].append(object_id)
+        
+        project_changed = not since or project.updated_at >= since
+        return Response({
+            'token': token.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'full': not since,
+            'project': {
+                'id': project.id,
+                'name': project.name,
+                'description': project.description,
+                'created_at': project.created_at,
+                'updated_at': project.updated_at,
+            } if project_changed else None,
+            'strings': StringSerializer(StringSerializer.setup_eager_loading(strings), many=True).data,
+            'dimensions': DimensionSerializer(dimensions, many=True).data,
+            'dimension_values': DimensionValueSerializer(dimension_values, many=True).data,
+            'string_dimension_values': StringDimensionValueSerializer(assignments, many=True).data,
+            'deleted': {
+                'strings': deleted[Tombstone.STRING],
+                'dimensions': deleted[Tombstone.DIMENSION],
+                'dimension_values': deleted[Tombstone.DIMENSION_VALUE],
+                'string_dimension_values': deleted[Tombstone.STRING_DIMENSION_VALUE],
+            },
+        })
 
+    @action(detail=True, methods=['get'], url_path='variants')
+    def variants(self, request, pk=None):
+        """
+        Stream every rendering of the project's strings under each valid
+        combination of conditional spawns, as NDJSON.
+        
+        Each line is {"string", "selection", "content"}, where selection maps
+        conditional name -> chosen spawn (or "Hidden"). Query parameters:
+        `string` renders a single string, `limit` caps the variants per string,
+        and `sample` (with an optional `seed`) picks that many random variants
+        per string instead of enumerating them all. Conditional containers are
+        rendered through the strings that embed them, not on their own.
+        """
+        project = self.get_object()
+        params = variant_params(request, ('string', 'limit', 'sample', 'seed'))
+        renderer = VariantRenderer.for_project(project)
+        if 'string' in params:
+            if params['string'] not in renderer.strings:
+                raise serializers.ValidationError({'string': 'String not found in this project.'})
+            roots = [renderer.strings[params['string']]]
+        else:
+            roots = sorted(
+                (string for string in renderer.strings.values() if not string.is_conditional_container),
+                key=lambda string: string.id,
+            )
+        return stream_variants(renderer, roots, params)
 
     @action(detail=True, methods=['post'], url_path='duplicate')
     def duplicate(self, request, pk=None):
         """
         Duplicate a project with all its strings, dimensions, and relationships.
         Creates a new project with "Copy of " prepended to the name.
+        
+        Rows are copied in bulk_create batches inside one transaction, mapping
+        old ids to new ones in memory. bulk_create deliberately bypasses the
+        String save signals: hashes are preserved, so there is nothing to
+        rename, and dependency graph edges are copied rather than rebuilt.
         """
         original_project = self.get_object()
         logger.info(f"Starting duplication of project {original_project.id}: {original_project.name}")
         
-        # Create the new project
-        new_project = Project.objects.create(
-            name=f"Copy of {original_project.name}",
-            description=original_project.description,
-            user=self.request.user
-        )
-        logger.info(f"Created new project {new_project.id}: {new_project.name}")
-        
-        # Dictionary to map old dimension IDs to new dimension IDs
-        dimension_mapping = {}
-        # Dictionary to map old dimension value IDs to new dimension value IDs
-        dimension_value_mapping = {}
-        
-        # Duplicate all dimensions
-        dimensions_count = original_project.dimensions.count()
-        logger.info(f"Duplicating {dimensions_count} dimensions")
-        
-        for dimension in original_project.dimensions.all():
-            new_dimension = Dimension.objects.create(
-                name=dimension.name,
-                project=new_project
+        with transaction.atomic():
+            new_project = Project.objects.create(
+                name=f"Copy of {original_project.name}",
+                description=original_project.description,
+                user=self.request.user
+            )
+            
+            # Duplicate dimensions and their values, mapping old IDs to new IDs
+            dimensions = list(original_project.dimensions.all())
+            new_dimensions = Dimension.objects.bulk_create(
+                [Dimension(name=dimension.name, project=new_project) for dimension in dimensions],
+                batch_size=BULK_BATCH_SIZE,
             )
-            dimension_mapping[dimension.id] = new_dimension.id
+            dimension_mapping = {old.id: new.id for old, new in zip(dimensions, new_dimensions)}
             
-            # Duplicate all dimension values for this dimension
-            dim_values_count = dimension.values.count()
-            for dim_value in dimension.values.all():
-                new_dimension_value = DimensionValue.objects.create(
-                    dimension=new_dimension,
-                    value=dim_value.value
-                )
-                dimension_value_mapping[dim_value.id] = new_dimension_value.id
-            logger.info(f"Duplicated dimension '{dimension.name}' with {dim_values_count} values")
-        
-        # Dictionary to map old string IDs to new string IDs
-        string_mapping = {}
-        
-        # Duplicate all strings
-        strings_count = original_project.strings.count()
-        logger.info(f"Duplicating {strings_count} strings")
-        
-        # Temporarily disconnect post_save signal to prevent automatic dimension creation during duplication
-        from .models import update_dependent_strings_when_string_variable_changes
-        post_save.disconnect(update_dependent_strings_when_string_variable_changes, sender=String)
+            dimension_values = list(DimensionValue.objects.filter(dimension__project=original_project))
+            new_dimension_values = DimensionValue.objects.bulk_create(
+                [
+                    DimensionValue(dimension_id=dimension_mapping[dim_value.dimension_id], value=dim_value.value)
+                    for dim_value in dimension_values
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            dimension_value_mapping = {old.id: new.id for old, new in zip(dimension_values, new_dimension_values)}
+            
+            # Duplicate strings oldest first so the copies keep their relative order,
+            # preserving the original variable_hash to maintain familiar identifiers
+            strings = list(original_project.strings.order_by('created_at', 'id'))
+            hash_allocator = HashAllocator(project_id=new_project.id)
+            new_strings = []
+            for string in strings:
+                variable_hash = string.variable_hash or hash_allocator.next()
+                new_strings.append(String(
+                    content=string.content,
+                    project=new_project,
+                    variable_name=variable_hash,
+                    variable_hash=variable_hash,
+                    display_name=string.display_name,
+                    is_conditional=string.is_conditional,
+                    is_conditional_container=string.is_conditional_container,
+                    # Same contents and names, so the materialized resolution carries over
+                    resolved_content=string.resolved_content,
+                    resolution_digest=string.resolution_digest,
+                ))
+            new_strings = String.objects.bulk_create(new_strings, batch_size=BULK_BATCH_SIZE)
+            string_mapping = {old.id: new.id for old, new in zip(strings, new_strings)}
+            
+            # Point controlled spawns at the copies of their controllers
+            String.objects.bulk_update(
+                [
+                    String(id=string_mapping[string.id], controlled_by_spawn_id=string_mapping[string.controlled_by_spawn_id])
+                    for string in strings
+                    if string.controlled_by_spawn_id in string_mapping
+                ],
+                ['controlled_by_spawn'],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            
+            # Duplicate string dimension values
+            StringDimensionValue.objects.bulk_create(
+                [
+                    StringDimensionValue(
+                        string_id=string_mapping[string_id],
+                        dimension_value_id=dimension_value_mapping[dimension_value_id],
+                    )
+                    for string_id, dimension_value_id in StringDimensionValue.objects.filter(
+                        string__project=original_project
+                    ).values_list('string_id', 'dimension_value_id')
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            
+            # Copy the dependency graph instead of re-parsing every string
+            StringReference.objects.bulk_create(
+                [
+                    StringReference(
+                        project=new_project,
+                        source_id=string_mapping[source_id],
+                        target_id=string_mapping.get(target_id),
+                        name=name,
+                    )
+                    for source_id, target_id, name in original_project.string_references.values_list(
+                        'source_id', 'target_id', 'name'
+                    )
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
         
-        try:
-            for string in original_project.strings.all():
-                try:
-                    # Create new string preserving the original variable_hash to maintain familiar identifiers
-                    try:
-                        new_string = String.objects.create(
-                            content=string.content,
-                            project=new_project,
-                            variable_name=string.variable_name,
-                            variable_hash=string.variable_hash,  # Preserve original hash
-                            is_conditional=string.is_conditional,
-                            is_conditional_container=string.is_conditional_container
-                        )
-                    except Exception as e:
-                        # If there's a hash conflict, let it auto-generate a new one
-                        if "variable_hash" in str(e) or "unique" in str(e).lower():
-                            logger.warning(f"Hash conflict for '{string.variable_hash}', generating new hash")
-                            new_string = String.objects.create(
-                                content=string.content,
-                                project=new_project,
-                                variable_name=string.variable_name,
-                                # Don't set variable_hash, let it auto-generate
-                                is_conditional=string.is_conditional,
-                                is_conditional_container=string.is_conditional_container
-                            )
-                        else:
-                            raise
-                    
-                    string_mapping[string.id] = new_string.id
-                    logger.info(f"Duplicated string {string.id} -> {new_string.id} ('{string.effective_variable_name}')")
-                    
-                    # Duplicate string dimension values
-                    sdv_count = string.dimension_values.count()
-                    for sdv in string.dimension_values.all():
-                        try:
-                            # Find the corresponding new dimension value using the mapping
-                            if sdv.dimension_value.id in dimension_value_mapping:
-                                new_dimension_value_id = dimension_value_mapping[sdv.dimension_value.id]
-                                new_dimension_value = DimensionValue.objects.get(id=new_dimension_value_id)
-                                
-                                # Create the string-dimension value relationship
-                                StringDimensionValue.objects.create(
-                                    string=new_string,
-                                    dimension_value=new_dimension_value
-                                )
-                            else:
-                                logger.warning(f"Could not find mapping for dimension value {sdv.dimension_value.id} ('{sdv.dimension_value.value}') for string {string.id}")
-                        except Exception as e:
-                            logger.error(f"Failed to duplicate string dimension value for string {string.id}, dimension value '{sdv.dimension_value.value}': {e}")
-                            
-                    logger.info(f"Duplicated {sdv_count} dimension values for string {new_string.effective_variable_name}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to duplicate string {string.id}: {e}")
-                    raise
-        finally:
-            # Reconnect the post_save signal
-            post_save.connect(update_dependent_strings_when_string_variable_changes, sender=String)
-        
-        logger.info(f"Duplication completed. New project {new_project.id} has {new_project.strings.count()} strings")
+        logger.info(
+            f"Duplication completed. New project {new_project.id} has {len(new_strings)} strings "
+            f"and {len(new_dimensions)} dimensions"
+        )
         
         # Return the new project data
         serializer = self.get_serializer(new_project)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+
 class StringViewSet(viewsets.ModelViewSet):
     serializer_class = StringSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return String.objects.filter(project__user=self.request.user)
+        return StringSerializer.setup_eager_loading(String.objects.filter(project__user=self.request.user))
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -429,6 +664,40 @@ class StringViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError({'project': 'Project not found or you do not have permission to add strings to it.'})
         serializer.save()
 
+    @action(detail=True, methods=['get'], url_path='variants')
+    def variants(self, request, pk=None):
+        """
+        Stream every rendering of this string as NDJSON; see the project
+        variants endpoint for the format and the `limit`/`sample`/`seed` parameters.
+        """
+        string = self.get_object()
+        params = variant_params(request, ('limit', 'sample', 'seed'))
+        renderer = VariantRenderer.for_project(string.project)
+        return stream_variants(renderer, [renderer.strings[string.id]], params)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Ranked full-text search over the user's strings.
+        
+        GET /api/strings/search/?q=<text> matches words and word prefixes in
+        content, display names and variable hashes, and substrings of display
+        names and hashes, best match first. Filter with `project`, and with
+        `published` or `conditional` set to true/false. `limit` caps the
+        results (default 50, at most 200). Each result carries its search_rank.
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Must be an integer.'})
+        strings = filter_strings(self.get_queryset(), request.query_params)
+        strings = search_strings(strings, request.query_params.get('q'), limit=max(limit, 0))
+        
+        data = self.get_serializer(strings, many=True).data
+        for item, string in zip(data, strings):
+            item['search_rank'] = string.search_rank
+        return Response(data)
+
     @action(detail=True, methods=['post'], url_path='duplicate')
     def duplicate(self, request, pk=None):
         """
@@ -450,13 +719,60 @@ class StringViewSet(viewsets.ModelViewSet):
         for sdv in original_string.dimension_values.all():
             StringDimensionValue.objects.create(
                 string=new_string,
-                dimension=sdv.dimension,
                 dimension_value=sdv.dimension_value
             )
         
         serializer = self.get_serializer(new_string)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Create, update and delete many strings of one project in a single transaction.
+
+        Body: {"project": id, "create": [...], "update": [...], "delete": [ids]}.
+        Create items may carry a "ref" that other items use in place of an id
+        (e.g. a spawn's controlled_by_spawn or a {"conditional": ref} dimension
+        value assignment). See strings_api/batch.py for the item format.
+        """
+        batch_serializer = StringBatchSerializer(data=request.data, context=self.get_serializer_context())
+        batch_serializer.is_valid(raise_exception=True)
+        result = batch_serializer.save()
+        
+        changed_ids = [string.id for string in result['created'] + result['updated']]
+        strings = {
+            string.id: string
+            for string in StringSerializer.setup_eager_loading(String.objects.filter(id__in=changed_ids))
+        }
+        created = []
+        for item, string in zip(batch_serializer.validated_data.get('create', ()), result['created']):
+            data = self.get_serializer(strings[string.id]).data
+            data['ref'] = item.get('ref')
+            created.append(data)
+        
+        return Response({
+            'created': created,
+            'updated': self.get_serializer([strings[string.id] for string in result['updated']], many=True).data,
+            'deleted': result['deleted'],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='usages')
+    def usages(self, request, pk=None):
+        """
+        List the strings that embed this string ("where is this used").
+        Pass ?transitive=true to include strings that embed it indirectly.
+        """
+        string = self.get_object()
+        
+        if request.query_params.get('transitive') in ('1', 'true'):
+            graph = DependencyGraph.for_project(string.project_id)
+            usages = String.objects.filter(id__in=graph.transitive_dependents([string.id]))
+        else:
+            usages = dependents(string)
+        
+        serializer = self.get_serializer(StringSerializer.setup_eager_loading(usages), many=True)
+        return Response(serializer.data)
+
 
 class DimensionViewSet(viewsets.ModelViewSet):
     """
@@ -467,7 +783,7 @@ class DimensionViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Dimension.objects.filter(project__user=self.request.user)
+        return Dimension.objects.filter(project__user=self.request.user).prefetch_related('values')
 
     def perform_create(self, serializer):
         project_id = self.request.data.get('project')
@@ -497,41 +813,75 @@ class StringDimensionValueViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return StringDimensionValue.objects.filter(string__project__user=self.request.user)
+        return StringDimensionValue.objects.filter(string__project__user=self.request.user).select_related('dimension_value')
+
+
+# Registry fields, with the columns each one reads
+REGISTRY_FIELDS = {
+    'id': ('id',),
+    'content': ('content',),  # Content with {{variable}} placeholders preserved
+    'resolved_content': ('resolved_content',),
+    'display_name': ('display_name',),
+    'variable_name': ('variable_name',),
+    'variable_hash': ('variable_hash',),
+    'effective_variable_name': ('variable_name', 'variable_hash'),
+    'project_id': ('project_id',),
+    'project_name': ('project__name',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@condition(etag_func=registry_etag)
 def registry(request):
     """
     Get all published strings for the current user across all their projects.
     Returns strings with their content displayed as plaintext with conditional variable placeholders.
     Only non-conditional strings can be published.
+    
+    Results are cursor-paginated ({next, previous, results}), most recently
+    updated first. Filters: ?project=<id>, ?q=<text> (matched like
+    /api/strings/search/, but kept in updated order) and ?updated_since=<ISO
+    timestamp>. ?fields=id,content,... returns only those fields, and reads
+    only the columns they need.
     """
+    fields = list(REGISTRY_FIELDS)
+    if request.query_params.get('fields'):
+        fields = [field.strip() for field in request.query_params['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in REGISTRY_FIELDS]
+        if unknown:
+            raise serializers.ValidationError({'fields': f'Unknown field(s): {", ".join(unknown)}.'})
+    
     # Get all published strings from user's projects (exclude conditionals)
     published_strings = String.objects.filter(
         project__user=request.user,
         is_published=True,
         is_conditional_container=False  # Only regular strings, not conditionals
-    ).select_related('project').order_by('-updated_at')
+    )
+    published_strings = filter_strings(published_strings, {'project': request.query_params.get('project')})
+    if request.query_params.get('q') is not None:
+        published_strings = published_strings.filter(search_filter(request.query_params['q']))
+    updated_since = parse_timestamp(request.query_params.get('updated_since'), 'updated_since')
+    if updated_since:
+        published_strings = published_strings.filter(updated_at__gte=updated_since)
     
-    # Build response with plaintext content (variables shown as placeholders)
-    registry_strings = []
-    for string in published_strings:
-        registry_strings.append({
-            'id': string.id,
-            'content': string.content,  # Content with {{variable}} placeholders preserved
-            'display_name': string.display_name,
-            'variable_name': string.variable_name,
-            'variable_hash': string.variable_hash,
-            'effective_variable_name': string.effective_variable_name,
-            'project_id': string.project.id,
-            'project_name': string.project.name,
-            'created_at': string.created_at,
-            'updated_at': string.updated_at,
-        })
+    # The cursor needs updated_at and id whatever fields were asked for
+    columns = {'id', 'project_id', 'updated_at'}
+    for field in fields:
+        columns.update(REGISTRY_FIELDS[field])
+    if 'project__name' in columns:
+        published_strings = published_strings.select_related('project')
+    published_strings = published_strings.only(*columns)
     
-    return Response(registry_strings)
+    paginator = RegistryCursorPagination()
+    page = paginator.paginate_queryset(published_strings, request)
+    registry_strings = [
+        {field: string.project.name if field == 'project_name' else getattr(string, field) for field in fields}
+        for string in page
+    ]
+    return revalidate(paginator.get_paginated_response(registry_strings))
 
 
 @api_view(['GET', 'POST'])
@@ -597,27 +947,29 @@ def check_openai_configured(request):
         return Response({'configured': False})
 
 
+def submit_job(request, kind, input=None):
+    """
+    Queue an AI job and answer 202 with it; the job runs in a worker. Jobs
+    whose result is cached come back already succeeded, with a 200.
+    """
+    try:
+        job = jobs.submit(request.user, kind, input)
+    except jobs.QueueFull as exc:
+        return Response({'error': str(exc), 'success': False}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    finished = job.status == Job.SUCCEEDED
+    return Response(JobSerializer(job).data, status=status.HTTP_200_OK if finished else status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def extract_text_from_image(request):
     """
     Extract text from an uploaded image using OpenAI's Vision API.
-    Expects base64 encoded image data.
+    Expects base64 encoded image data. Returns a job (202); poll
+    /api/jobs/<id>/ for {'success', 'text'} in its result.
     """
-    # Get user profile and check for API key
-    try:
-        profile = UserProfile.objects.get(user=request.user)
-    except UserProfile.DoesNotExist:
-        return Response(
-            {'error': 'OpenAI not configured. Please add your API key in Settings > AI Features.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    if not profile.openai_api_key:
-        return Response(
-            {'error': 'OpenAI not configured. Please add your API key in Settings > AI Features.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    if not ai.api_key_for(request.user):
+        return Response({'error': ai.NOT_CONFIGURED}, status=status.HTTP_400_BAD_REQUEST)
     
     # Get image data from request
     image_data = request.data.get('image')
@@ -627,117 +979,23 @@ def extract_text_from_image(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=profile.openai_api_key)
-        
-        # Call OpenAI Vision API to extract text
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please extract and transcribe all the text visible in this image. Return only the transcribed text, preserving the original formatting as much as possible. Do not add any commentary or explanation."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_data  # Expects data:image/...;base64,... format
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2000
-        )
-        
-        extracted_text = response.choices[0].message.content.strip()
-        
-        return Response({
-            'success': True,
-            'text': extracted_text
-        })
-        
-    except Exception as e:
-        error_message = str(e)
-        
-        # Provide user-friendly error messages
-        if 'invalid_api_key' in error_message.lower():
-            error_message = 'Invalid API key. Please check your key in Settings.'
-        elif 'rate_limit' in error_message.lower():
-            error_message = 'Rate limit exceeded. Please wait a moment and try again.'
-        elif 'insufficient_quota' in error_message.lower():
-            error_message = 'Insufficient OpenAI quota. Please check your billing settings.'
-        
-        return Response(
-            {'error': error_message, 'success': False},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    return submit_job(request, 'extract_text', {'image': image_data})
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def test_openai_connection(request):
     """
-    Test the OpenAI connection by asking for a one-line joke.
-    Returns the joke if successful, or an error message if not.
+    Test the OpenAI connection by asking for a one-line joke. Returns a job
+    (202); its result has the joke if successful, its error says why not.
     """
-    # Get user profile
-    try:
-        profile = UserProfile.objects.get(user=request.user)
-    except UserProfile.DoesNotExist:
+    if not ai.api_key_for(request.user):
         return Response(
             {'error': 'No API key configured. Please add your OpenAI API key first.'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    if not profile.openai_api_key:
-        return Response(
-            {'error': 'No API key configured. Please add your OpenAI API key first.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    try:
-        # Initialize OpenAI client with user's API key
-        client = OpenAI(api_key=profile.openai_api_key)
-        
-        # Request a one-line joke
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that tells jokes."},
-                {"role": "user", "content": "Tell me a short, clean, one-line joke."}
-            ],
-            max_tokens=100,
-            temperature=0.7
-        )
-        
-        joke = response.choices[0].message.content.strip()
-        
-        return Response({
-            'success': True,
-            'joke': joke,
-            'message': 'Connection successful! Your OpenAI integration is working.'
-        })
-        
-    except Exception as e:
-        error_message = str(e)
-        
-        # Provide user-friendly error messages
-        if 'invalid_api_key' in error_message.lower() or 'incorrect api key' in error_message.lower():
-            error_message = 'Invalid API key. Please check your key and try again.'
-        elif 'rate_limit' in error_message.lower():
-            error_message = 'Rate limit exceeded. Please wait a moment and try again.'
-        elif 'insufficient_quota' in error_message.lower():
-            error_message = 'Insufficient quota. Please check your OpenAI billing settings.'
-        
-        return Response(
-            {'error': error_message, 'success': False},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    return submit_job(request, 'test_connection')
 
 
 @api_view(['POST'])
@@ -746,102 +1004,37 @@ def generate_style_guide(request):
     """
     Generate a style guide based on the organization's published registry strings.
     Analyzes tone, vocabulary, brevity, language patterns, and other important aspects.
+    Returns a job (202); poll /api/jobs/<id>/ for the guide in its result.
+    With {"incremental": true}, the last guide is revised with just the strings
+    changed since. A guide for unchanged strings comes back already finished.
     """
-    from datetime import datetime
+    if not ai.api_key_for(request.user):
+        return Response({'error': ai.NOT_CONFIGURED}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get user profile and check for API key
-    try:
-        profile = UserProfile.objects.get(user=request.user)
-    except UserProfile.DoesNotExist:
-        return Response(
-            {'error': 'OpenAI not configured. Please add your API key in Settings > AI Features.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    if not profile.openai_api_key:
-        return Response(
-            {'error': 'OpenAI not configured. Please add your API key in Settings > AI Features.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Get all published strings from the registry
-    published_strings = String.objects.filter(
-        project__user=request.user,
-        is_published=True,
-        is_conditional_container=False
-    ).select_related('project')
+    if not ai.style_guide_strings(request.user).exists():
+        return Response({'error': ai.NO_PUBLISHED_STRINGS}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not published_strings.exists():
-        return Response(
-            {'error': 'No published strings found in your registry. Publish some strings first to generate a style guide.'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Prepare the strings for analysis (limit to 50 to avoid token limits)
-    strings_for_analysis = []
-    for s in published_strings[:50]:
-        strings_for_analysis.append({
-            'content': s.content or '',
-            'name': s.display_name or s.effective_variable_name or s.variable_hash,
-            'project': s.project.name if s.project else 'Unknown'
-        })
-    
-    # Format strings for the prompt
-    strings_text = "\n\n".join([
-        f"**{s['name']}** (from {s['project']}):\n\"{s['content']}\""
-        for s in strings_for_analysis
-    ])
-    
-    try:
-        client = OpenAI(api_key=profile.openai_api_key)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are an expert UX writer and content strategist. Analyze UI strings and create a concise, actionable style guide.
-
-Focus on:
-1. **Tone & Voice**: Personality (friendly, professional, casual, formal, etc.)
-2. **Vocabulary**: Common words, phrases, terminology patterns
-3. **Brevity**: How concise are the strings? Typical length?
-4. **Language Style**: Sentence structure, punctuation, capitalization
-5. **Patterns**: Action verbs, calls-to-action, error formats
-6. **Key Observations**: Other important patterns or recommendations
-
-Keep the guide succinct and practical for quick reference."""
-                },
-                {
-                    "role": "user",
-                    "content": f"""Analyze these {len(strings_for_analysis)} UI strings and create a style guide:
-
-{strings_text}
-
-Create a concise style guide to help writers match this established voice and style."""
-                }
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        style_guide = response.choices[0].message.content.strip()
-        generated_date = datetime.now().strftime("%B %d, %Y")
-        
-        return Response({
-            'success': True,
-            'style_guide': style_guide,
-            'generated_date': generated_date,
-            'strings_analyzed': len(strings_for_analysis),
-        })
-        
-    except Exception as e:
-        error_message = str(e)
-        if 'invalid_api_key' in error_message.lower():
-            error_message = 'Invalid API key. Please check your key in Settings.'
-        elif 'rate_limit' in error_message.lower():
-            error_message = 'Rate limit exceeded. Please wait and try again.'
-        elif 'insufficient_quota' in error_message.lower():
-            error_message = 'Insufficient OpenAI quota. Please check your billing.'
-        
-        return Response({'error': error_message, 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+    return submit_job(request, 'style_guide', {'incremental': bool(request.data.get('incremental'))})
+
+
+class JobViewSet(viewsets.GenericViewSet):
+    """
+    Status and results of the current user's AI jobs:
+    GET /api/jobs/<id>/ and POST /api/jobs/<id>/cancel/.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['post'], url_path='cancel')
+    def cancel(self, request, pk=None):
+        job = self.get_object()
+        if not jobs.cancel(job):
+            return Response({'error': f'Job already {job.status}.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'strings_api.middleware.MetricsMiddleware',
+    'strings_api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -188,6 +190,15 @@ CSRF_COOKIE_SAMESITE = 'Lax'
 CSRF_COOKIE_SECURE = not DEBUG
 CSRF_USE_SESSIONS = False
 CSRF_COOKIE_HTTPONLY = False
+# strings_api.middleware.CSRFRefreshMiddleware resends the cookie on a write once it is this close to expiring
+CSRF_REFRESH_BEFORE_EXPIRY = int(os.environ.get('CSRF_REFRESH_BEFORE_EXPIRY', 60 * 60 * 24 * 7))
+CSRF_REFRESH_LOG_SAMPLE_RATE = float(os.environ.get('CSRF_REFRESH_LOG_SAMPLE_RATE', 0.01))  # share of refreshes logged
+
+# GET /api/projects/<id>/changes/ also resends rows stamped this many seconds before
+# the sync token, so writes from transactions that committed late are picked up
+PROJECT_CHANGES_MARGIN = int(os.environ.get('PROJECT_CHANGES_MARGIN', 60))
+# Tombstones are kept this many seconds (pruned by run_jobs); older sync tokens get a full resync
+PROJECT_CHANGES_RETENTION = int(os.environ.get('PROJECT_CHANGES_RETENTION', 60 * 60 * 24 * 30))
 
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
@@ -202,3 +213,70 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@strings.app')
 LOGIN_URL = '/api/auth/login/'
 LOGIN_REDIRECT_URL = '/'
 PASSWORD_RESET_TIMEOUT = 259200  # 3 days in seconds
+
+# AI jobs (strings_api.jobs), run by `python manage.py run_jobs`
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 4))
+AI_JOBS_PER_USER_CONCURRENCY = int(os.environ.get('AI_JOBS_PER_USER_CONCURRENCY', 2))
+AI_JOBS_PER_USER_QUEUED = int(os.environ.get('AI_JOBS_PER_USER_QUEUED', 10))
+AI_JOB_TIMEOUT = int(os.environ.get('AI_JOB_TIMEOUT', 300))  # seconds before a running job counts as lost
+AI_JOB_RETENTION = int(os.environ.get('AI_JOB_RETENTION', 60 * 60 * 24))  # seconds finished jobs are kept
+
+# OpenAI clients (strings_api.openai_clients): cached per API key over one shared connection pool
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None  # None uses the OpenAI API
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 120))  # seconds to wait for a response
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 10))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', 60))  # seconds an idle connection is kept
+OPENAI_CLIENT_CACHE_SIZE = int(os.environ.get('OPENAI_CLIENT_CACHE_SIZE', 100))
+OPENAI_CLIENT_TTL = int(os.environ.get('OPENAI_CLIENT_TTL', 3600))
+
+# Caches. 'ai_results' keeps model outputs by a digest of their inputs (strings_api.ai),
+# bounded to AI_RESULT_CACHE_ENTRIES files, so repeat AI requests cost no tokens
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ai_results': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AI_RESULT_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'ai_results')),
+        'TIMEOUT': 60 * 60 * 24 * 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('AI_RESULT_CACHE_ENTRIES', 1000)),
+        },
+    },
+}
+
+# Request profiling (strings_api.middleware.ProfilingMiddleware), off unless PROFILING_ENABLED=1
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_CPROFILE_DIR = os.environ.get('PROFILING_CPROFILE_DIR', '')  # empty: no cProfile dumps
+PROFILING_CPROFILE_SAMPLE_RATE = float(os.environ.get('PROFILING_CPROFILE_SAMPLE_RATE', 0.1))
+PROFILING_CPROFILE_KEEP = int(os.environ.get('PROFILING_CPROFILE_KEEP', 20))  # dumps of the slowest requests kept
+
+# Prometheus metrics (strings_api.metrics) at /metrics; set PROMETHEUS_MULTIPROC_DIR under gunicorn
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # scrapers send "Authorization: Bearer <token>"; unset: /metrics 404s
+
+# Project snapshots (strings_api.snapshots): files shared by the workers on one machine by default,
+# local memory with SNAPSHOT_CACHE=locmem, Redis (needs the redis package) when REDIS_URL is set
+if os.environ.get('REDIS_URL'):
+    CACHES['snapshots'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'KEY_PREFIX': 'strings',
+        'TIMEOUT': 60 * 60 * 24,
+    }
+elif os.environ.get('SNAPSHOT_CACHE') == 'locmem':
+    CACHES['snapshots'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'snapshots',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('SNAPSHOT_CACHE_ENTRIES', 500))},
+    }
+else:
+    CACHES['snapshots'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SNAPSHOT_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'snapshots')),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('SNAPSHOT_CACHE_ENTRIES', 500))},
+    }
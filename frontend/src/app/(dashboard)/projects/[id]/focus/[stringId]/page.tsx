@@ -3,7 +3,7 @@
 import { useEffect, useState, useMemo, useCallback } from "react";
 import { useParams, useRouter } from "next/navigation";
 import Link from "next/link";
-import { apiFetch } from "@/lib/api";
+import { fetchProject } from "@/lib/projectPayload";
 import { useHeader } from "@/lib/HeaderContext";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
@@ -41,7 +41,7 @@ export default function StringFocusPage() {
     async function fetchData() {
       setLoading(true);
       try {
-        const projectData = await apiFetch(`/api/projects/${projectId}/`);
+        const projectData = await fetchProject(projectId);
         setProject(projectData);
 
         const string = projectData.strings?.find(
@@ -1,11 +1,13 @@
 "use client";
-import { useEffect, useState, useCallback } from "react";
+import { useEffect, useState, useCallback, useRef } from "react";
 import { useParams, useRouter } from "next/navigation";
 import { Button } from "@/components/ui/button";
 import { Dialog, DialogContent, DialogTitle, DialogHeader, DialogFooter, DialogDescription } from "@/components/ui/dialog";
 import { Sheet, SheetContent, SheetHeader, SheetTitle, SheetFooter } from "@/components/ui/sheet";
 import { Input } from "@/components/ui/input";
 import { apiFetch } from "@/lib/api";
+import { fetchProjectChanges, latestProjectTimestamp, mergeProjectChanges } from "@/lib/projectSync";
+import { fetchProject } from "@/lib/projectPayload";
 import { Card } from "@/components/ui/card";
 import { Select, SelectTrigger, SelectValue, SelectContent, SelectItem } from "@/components/ui/select";
 
@@ -155,10 +157,20 @@ export default function ProjectDetailPage() {
     return [];
   };
 
+  // Token for delta sync: only rows changed since the last sync are fetched
+  const syncTokenRef = useRef<string | null>(null);
+
   // Function to refresh project data from the backend
   const refreshProject = useCallback(async () => {
     try {
-      const updatedProject = await apiFetch(`/api/projects/${id}/`);
+      if (syncTokenRef.current) {
+        const changes = await fetchProjectChanges(id as string, syncTokenRef.current);
+        syncTokenRef.current = changes.token;
+        setProject((current: any) => current ? sortProjectStrings(mergeProjectChanges(current, changes)) : current);
+        return;
+      }
+      const updatedProject = await fetchProject(id as string);
+      syncTokenRef.current = latestProjectTimestamp(updatedProject);
       setProject(sortProjectStrings(updatedProject));
     } catch (err) {
       console.error('Failed to refresh project:', err);
@@ -600,8 +612,10 @@ export default function ProjectDetailPage() {
 
   useEffect(() => {
     setLoading(true);
-    apiFetch(`/api/projects/${id}/`)
+    syncTokenRef.current = null;
+    fetchProject(id as string)
       .then((data) => {
+        syncTokenRef.current = latestProjectTimestamp(data);
         setProject(sortProjectStrings(data));
 
       })
@@ -908,7 +922,7 @@ export default function ProjectDetailPage() {
         }
         
         // Refresh project data to include new string variables
-        const updatedProject = await apiFetch(`/api/projects/${id}/`);
+        const updatedProject = await fetchProject(id as string);
         setProject(sortProjectStrings(updatedProject));
       }
     } catch (err) {
@@ -1024,7 +1038,7 @@ export default function ProjectDetailPage() {
       }
 
       // Refresh project data
-      const updatedProject = await apiFetch(`/api/projects/${id}/`);
+      const updatedProject = await fetchProject(id as string);
       setProject(sortProjectStrings(updatedProject));
 
       // Close confirmation dialog
@@ -1957,7 +1971,7 @@ export default function ProjectDetailPage() {
       }
 
       // Refresh project data
-      const projectData = await apiFetch(`/api/projects/${id}/`);
+      const projectData = await fetchProject(id as string);
       setProject(sortProjectStrings(projectData));
       clearSelection();
       closeBulkDeleteDialog();
@@ -2062,7 +2076,7 @@ export default function ProjectDetailPage() {
       await Promise.all(stringPromises);
 
       // Refresh project data
-        const updatedProject = await apiFetch(`/api/projects/${id}/`);
+        const updatedProject = await fetchProject(id as string);
       setProject(sortProjectStrings(updatedProject));
 
       // Show success message
@@ -2240,7 +2254,7 @@ export default function ProjectDetailPage() {
       // Refresh project data from API to get the latest state including dimension cleanup
       if (project?.id) {
         try {
-          const updatedProject = await apiFetch(`/api/projects/${project.id}/`);
+          const updatedProject = await fetchProject(project.id);
           setProject(updatedProject);
         } catch (refreshError) {
           console.error('Failed to refresh project data after deletion:', refreshError);
@@ -2273,7 +2287,7 @@ export default function ProjectDetailPage() {
 
       // Refresh project data to show the new string
       if (project?.id) {
-        const updatedProject = await apiFetch(`/api/projects/${project.id}/`);
+        const updatedProject = await fetchProject(project.id);
         setProject(updatedProject);
       }
 
@@ -4853,7 +4867,7 @@ export default function ProjectDetailPage() {
                         ));
                         
                         // Refresh project data to get latest changes
-                        const updatedProject = await apiFetch(`/api/projects/${id}/`);
+                        const updatedProject = await fetchProject(id as string);
                         setProject(sortProjectStrings(updatedProject));
                         
                         toast.success('Spawn updated successfully');
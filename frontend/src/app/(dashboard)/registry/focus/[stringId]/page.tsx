@@ -38,20 +38,18 @@ export default function RegistryStringFocusPage() {
     async function fetchData() {
       setLoading(true);
       try {
-        // First get the registry to find the string and its project
-        const registryData = await apiFetch("/api/registry/");
-        const registryString = registryData.find(
-          (s: any) => s.id === parseInt(stringId)
-        );
+        // First get the string itself to find its project; only published
+        // regular strings are in the registry
+        const registryString = await apiFetch(`/api/strings/${stringId}/`).catch(() => null);
 
-        if (!registryString) {
+        if (!registryString?.is_published || registryString.is_conditional_container) {
           setError("String not found in registry");
           return;
         }
 
         // Now fetch the full project to get conditions data
         const projectData = await apiFetch(
-          `/api/projects/${registryString.project_id}/`
+          `/api/projects/${registryString.project}/`
         );
         setProject(projectData);
 
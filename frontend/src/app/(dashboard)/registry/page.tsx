@@ -3,7 +3,7 @@
 import { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 import Link from "next/link";
-import { apiFetch } from "@/lib/api";
+import { apiFetch, nextPagePath } from "@/lib/api";
 import { useAuth } from "@/lib/useAuth";
 import { useHeader } from "@/lib/HeaderContext";
 import { Button } from "@/components/ui/button";
@@ -17,12 +17,18 @@ interface RegistryString extends StringTileData {
   updated_at: string;
 }
 
+// Only the columns the tiles render; the registry is cursor-paginated
+const REGISTRY_PATH =
+  "/api/registry/?fields=id,content,variable_hash,effective_variable_name,project_id,project_name,created_at,updated_at";
+
 export default function RegistryPage() {
   const { isLoggedIn, loading: authLoading } = useAuth();
   const router = useRouter();
   const { setPageInfo } = useHeader();
   const [registryStrings, setRegistryStrings] = useState<RegistryString[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [isStyleGuideOpen, setIsStyleGuideOpen] = useState(false);
 
@@ -50,8 +56,9 @@ export default function RegistryPage() {
     setLoading(true);
     setError(null);
     try {
-      const data = await apiFetch("/api/registry/");
-      setRegistryStrings(data);
+      const page = await apiFetch(REGISTRY_PATH);
+      setRegistryStrings(page.results);
+      setNextPage(nextPagePath(page));
     } catch (err: any) {
       setError(err.message || "Failed to load registry");
     } finally {
@@ -59,6 +66,20 @@ export default function RegistryPage() {
     }
   }
 
+  async function fetchMoreRegistryStrings() {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const page = await apiFetch(nextPage);
+      setRegistryStrings((current) => [...current, ...page.results]);
+      setNextPage(nextPagePath(page));
+    } catch (err: any) {
+      toast.error(err.message || "Failed to load more strings");
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   if (authLoading || !isLoggedIn) {
     return (
       <div className="flex items-center justify-center min-h-[calc(100vh-64px)]">
@@ -97,7 +118,7 @@ export default function RegistryPage() {
           <div className="space-y-4">
             <div className="flex items-center justify-between mb-6">
               <p className="text-muted-foreground">
-                {registryStrings.length} published string{registryStrings.length !== 1 ? "s" : ""}
+                {registryStrings.length}{nextPage ? "+" : ""} published string{registryStrings.length !== 1 || nextPage ? "s" : ""}
               </p>
               <Button
                 variant="outline"
@@ -127,6 +148,14 @@ export default function RegistryPage() {
                 />
               ))}
             </div>
+
+            {nextPage && (
+              <div className="flex justify-center pt-4">
+                <Button variant="outline" onClick={fetchMoreRegistryStrings} disabled={loadingMore}>
+                  {loadingMore ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            )}
           </div>
         )}
       </div>
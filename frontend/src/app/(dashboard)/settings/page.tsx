@@ -5,6 +5,7 @@ import { useRouter, useSearchParams } from "next/navigation";
 import { useAuth } from "@/lib/useAuth";
 import { useHeader } from "@/lib/HeaderContext";
 import { apiFetch } from "@/lib/api";
+import { runJob } from "@/lib/jobs";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
@@ -94,9 +95,7 @@ export default function SettingsPage() {
     setTestResult(null);
 
     try {
-      const data = await apiFetch("/api/settings/openai/test/", {
-        method: "POST",
-      });
+      const data = await runJob("/api/settings/openai/test/");
       
       setTestResult({
         success: true,
@@ -4,7 +4,7 @@ import { useRouter } from "next/navigation";
 import { Button } from "@/components/ui/button";
 import { useAuth } from "@/lib/useAuth";
 import { useEffect, useState } from "react";
-import { apiFetch } from "@/lib/api";
+import { apiFetch, apiFetchAllPages } from "@/lib/api";
 import { Card } from "@/components/ui/card";
 import { OverflowMenu } from "@/components/ui/menu";
 import { Dialog, DialogContent, DialogTitle } from "@/components/ui/dialog";
@@ -32,7 +32,7 @@ export default function Home() {
   useEffect(() => {
     if (authLoading || !isLoggedIn) return;
     setLoading(true);
-    apiFetch("/api/projects/")
+    apiFetchAllPages("/api/projects/")
       .then(setProjects)
       .catch((err) => setError(err.message || "Failed to load projects"))
       .finally(() => setLoading(false));
@@ -77,7 +77,7 @@ export default function Home() {
         method: "PATCH",
         body: JSON.stringify({ name: editName, description: editDescription }),
       });
-      setProjects((prev) => prev.map((p) => (p.id === updated.id ? updated : p)));
+      setProjects((prev) => prev.map((p) => (p.id === updated.id ? { ...p, name: updated.name, description: updated.description } : p)));
       setEditProject(null);
     } catch (err: any) {
       alert(err.message || "Failed to update project");
@@ -162,7 +162,7 @@ export default function Home() {
                           <div className="text-muted-foreground text-sm min-h-[32px]">{project.description || <span>&nbsp;</span>}</div>
                         </div>
                         <div className="flex items-center gap-4 mt-4 text-sm text-muted-foreground">
-                          <span>Strings: <span className="font-semibold">{project.strings?.length ?? 0}</span></span>
+                          <span>Strings: <span className="font-semibold">{project.string_count ?? project.strings?.length ?? 0}</span></span>
                           <span>Variables: <span className="font-semibold">{project.variables?.length ?? 0}</span></span>
                         </div>
                       </Card>
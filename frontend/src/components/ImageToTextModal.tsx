@@ -2,6 +2,7 @@
 
 import { useState, useRef, useCallback, useEffect } from "react";
 import { apiFetch } from "@/lib/api";
+import { runJob } from "@/lib/jobs";
 import {
   Dialog,
   DialogContent,
@@ -98,8 +99,7 @@ export function ImageToTextModal({ isOpen, onClose, onAccept }: ImageToTextModal
     setError(null);
 
     try {
-      const data = await apiFetch("/api/ai/extract-text/", {
-        method: "POST",
+      const data = await runJob("/api/ai/extract-text/", {
         body: JSON.stringify({ image: selectedImage }),
       });
 
@@ -2,6 +2,7 @@
 
 import { useState, useEffect } from "react";
 import { apiFetch } from "@/lib/api";
+import { runJob } from "@/lib/jobs";
 import {
   Dialog,
   DialogContent,
@@ -22,6 +23,7 @@ export function StyleGuideModal({ isOpen, onClose }: StyleGuideModalProps) {
   const [styleGuide, setStyleGuide] = useState<string | null>(null);
   const [generatedDate, setGeneratedDate] = useState<string | null>(null);
   const [stringsAnalyzed, setStringsAnalyzed] = useState<number>(0);
+  const [isIncremental, setIsIncremental] = useState(false);
   const [isOpenAIConfigured, setIsOpenAIConfigured] = useState<boolean | null>(null);
 
   // Check if OpenAI is configured when modal opens
@@ -40,19 +42,21 @@ export function StyleGuideModal({ isOpen, onClose }: StyleGuideModalProps) {
     }
   };
 
-  const handleGenerateStyleGuide = async () => {
+  // Incremental requests revise the last guide with only the strings changed since it was generated
+  const handleGenerateStyleGuide = async (incremental = false) => {
     setIsLoading(true);
     setError(null);
 
     try {
-      const data = await apiFetch("/api/ai/style-guide/", {
-        method: "POST",
+      const data = await runJob("/api/ai/style-guide/", {
+        body: JSON.stringify({ incremental }),
       });
 
       if (data.success) {
         setStyleGuide(data.style_guide);
         setGeneratedDate(data.generated_date);
         setStringsAnalyzed(data.strings_analyzed);
+        setIsIncremental(Boolean(data.incremental));
       } else {
         setError(data.error || "Failed to generate style guide");
       }
@@ -103,7 +107,7 @@ export function StyleGuideModal({ isOpen, onClose }: StyleGuideModalProps) {
                 Analyze your published registry strings to create a comprehensive
                 style guide covering tone, vocabulary, brevity, and language patterns.
               </p>
-              <Button onClick={handleGenerateStyleGuide} disabled={isLoading}>
+              <Button onClick={() => handleGenerateStyleGuide()} disabled={isLoading}>
                 {isLoading ? (
                   <>
                     <Loader2 className="h-4 w-4 mr-2 animate-spin" />
@@ -134,7 +138,7 @@ export function StyleGuideModal({ isOpen, onClose }: StyleGuideModalProps) {
                 Generation Failed
               </h3>
               <p className="text-muted-foreground mb-6 max-w-md">{error}</p>
-              <Button onClick={handleGenerateStyleGuide} variant="outline">
+              <Button onClick={() => handleGenerateStyleGuide()} variant="outline">
                 Try Again
               </Button>
             </div>
@@ -146,17 +150,32 @@ export function StyleGuideModal({ isOpen, onClose }: StyleGuideModalProps) {
               {/* Header with date and regenerate */}
               <div className="flex items-center justify-between pb-4 border-b">
                 <div className="text-sm text-muted-foreground">
-                  Generated on {generatedDate} • Based on {stringsAnalyzed} strings
+                  {isIncremental
+                    ? `Updated on ${generatedDate} • Based on ${stringsAnalyzed} changed strings`
+                    : `Generated on ${generatedDate} • Based on ${stringsAnalyzed} strings`}
+                </div>
+                <div className="flex gap-2">
+                  <Button
+                    variant="outline"
+                    size="sm"
+                    onClick={() => handleGenerateStyleGuide(true)}
+                    disabled={isLoading}
+                    title="Revise this guide with the strings changed since it was generated"
+                  >
+                    <RefreshCw className={`h-4 w-4 mr-2 ${isLoading ? "animate-spin" : ""}`} />
+                    Update
+                  </Button>
+                  <Button
+                    variant="outline"
+                    size="sm"
+                    onClick={() => handleGenerateStyleGuide()}
+                    disabled={isLoading}
+                    title="Generate a new guide from all published strings"
+                  >
+                    <BookOpen className="h-4 w-4 mr-2" />
+                    Regenerate
+                  </Button>
                 </div>
-                <Button
-                  variant="outline"
-                  size="sm"
-                  onClick={handleGenerateStyleGuide}
-                  disabled={isLoading}
-                >
-                  <RefreshCw className={`h-4 w-4 mr-2 ${isLoading ? "animate-spin" : ""}`} />
-                  Regenerate
-                </Button>
               </div>
 
               {/* Style guide content - render markdown-like content */}
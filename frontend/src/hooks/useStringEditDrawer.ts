@@ -1,6 +1,7 @@
 import { useState, useCallback } from 'react';
 import { saveString, SaveStringOptions, detectCircularReferences } from '@/lib/stringOperations';
 import { apiFetch } from '@/lib/api';
+import { fetchProject } from '@/lib/projectPayload';
 
 export interface DrawerState {
   // Core drawer state
@@ -412,7 +413,7 @@ export function useStringEditDrawer(options: UseStringEditDrawerOptions = {}) {
       // 4. Refresh project data
       if (onProjectUpdate && project?.id) {
         try {
-          const updatedProject = await apiFetch(`/api/projects/${project.id}/`);
+          const updatedProject = await fetchProject(project.id);
           onProjectUpdate(updatedProject);
         } catch (refreshError) {
           console.error('Failed to refresh project data after save:', refreshError);
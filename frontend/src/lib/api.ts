@@ -28,7 +28,7 @@ export async function apiFetch(path: string, options: RequestInit = {}) {
   
   // Handle empty responses (like DELETE operations)
   const contentType = res.headers.get('content-type');
-  if (res.status === 204 || !contentType?.includes('application/json')) {
+  if (res.status === 204 || !contentType?.includes('json')) {
     return null;
   }
   
@@ -39,4 +39,23 @@ export async function apiFetch(path: string, options: RequestInit = {}) {
   }
   
   return JSON.parse(text);
-} 
\ No newline at end of file
+} 
+
+// A paginated response's `next` is an absolute URL; keep only the path so apiFetch can prefix API_URL
+export function nextPagePath(page: any): string | null {
+  if (!page?.next) return null;
+  const url = new URL(page.next);
+  return `${url.pathname}${url.search}`;
+}
+
+// Follow a cursor-paginated list endpoint and return the results of every page
+export async function apiFetchAllPages(path: string, options: RequestInit = {}) {
+  const results: any[] = [];
+  let next: string | null = path;
+  while (next) {
+    const page: any = await apiFetch(next, options);
+    results.push(...(page?.results ?? []));
+    next = nextPagePath(page);
+  }
+  return results;
+}
@@ -0,0 +1,29 @@
+import { apiFetch } from "@/lib/api";
+
+// How often to ask the backend whether a queued AI job has finished
+const POLL_INTERVAL_MS = 1000;
+// Give up on a job after this long: the backend fails running jobs after
+// AI_JOB_TIMEOUT (5 minutes), plus time spent waiting in the queue
+const DEFAULT_TIMEOUT_MS = 6 * 60 * 1000;
+
+const FINISHED = ["succeeded", "failed", "cancelled"];
+
+// Start an AI job (the endpoint answers 202 with the job) and wait for it to finish.
+// Resolves with the job's result; rejects with the job's error if it failed or was cancelled,
+// or if it didn't finish within timeoutMs (the job is then cancelled).
+export async function runJob(path: string, options: RequestInit = {}, timeoutMs = DEFAULT_TIMEOUT_MS) {
+  const deadline = Date.now() + timeoutMs;
+  let job = await apiFetch(path, { method: "POST", ...options });
+  while (!FINISHED.includes(job.status)) {
+    if (Date.now() >= deadline) {
+      await apiFetch(`/api/jobs/${job.id}/cancel/`, { method: "POST" }).catch(() => null);
+      throw new Error("The request took too long. Please try again.");
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    job = await apiFetch(`/api/jobs/${job.id}/`);
+  }
+  if (job.status !== "succeeded") {
+    throw new Error(job.error || `Request ${job.status}`);
+  }
+  return job.result;
+}
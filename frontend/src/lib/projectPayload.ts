@@ -0,0 +1,65 @@
+import { apiFetch } from "@/lib/api";
+
+// GET /api/projects/<id>/?format=columnar serves the project as parallel
+// column arrays (see backend/strings_api/columnar.py): a fraction of the
+// nested payload's size, and much quicker for the browser to parse. The rest
+// of the editor works with the nested shape, so it is rebuilt here once.
+
+type Columns = Record<string, any[]>;
+
+export interface ColumnarProject {
+  schema: string;
+  project: { id: number; name: string; description: string; created_at: string; updated_at: string };
+  strings: Columns;
+  dimensions: Columns;
+  dimension_values: Columns;
+  assignments: { pairs: [number, number][]; id: number[]; created_at: string[] };
+}
+
+function rows(table: Columns): any[] {
+  const names = Object.keys(table);
+  const count = names.length ? table[names[0]].length : 0;
+  const result = new Array(count);
+  for (let row = 0; row < count; row++) {
+    const item: any = {};
+    for (const name of names) item[name] = table[name][row];
+    result[row] = item;
+  }
+  return result;
+}
+
+// The nested project representation (as served with ?format=json) from the columnar one
+export function inflateProject(payload: ColumnarProject): any {
+  const dimensions = rows(payload.dimensions).map((dimension) => ({ ...dimension, values: [] as any[] }));
+  const values = rows(payload.dimension_values);
+  for (const value of values) {
+    const dimension = dimensions[value.dimension];
+    value.dimension = dimension.id;
+    dimension.values.push(value);
+  }
+
+  const strings = rows(payload.strings);
+  for (const string of strings) {
+    string.project = payload.project.id;
+    string.effective_variable_name = string.variable_name || string.variable_hash;
+    string.dimension_values = [];
+  }
+  const { pairs, id, created_at } = payload.assignments;
+  pairs.forEach(([stringRow, valueRow], index) => {
+    const string = strings[stringRow];
+    const value = values[valueRow];
+    string.dimension_values.push({
+      id: id[index],
+      string: string.id,
+      dimension_value: value.id,
+      created_at: created_at[index],
+      dimension_value_detail: { id: value.id, value: value.value, dimension: value.dimension },
+    });
+  });
+
+  return { ...payload.project, strings, dimensions };
+}
+
+export async function fetchProject(projectId: string | number): Promise<any> {
+  return inflateProject(await apiFetch(`/api/projects/${projectId}/?format=columnar`));
+}
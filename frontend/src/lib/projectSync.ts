@@ -0,0 +1,83 @@
+import { apiFetch } from "@/lib/api";
+
+// Delta sync against GET /api/projects/<id>/changes/?since=<token>.
+// Instead of re-downloading the whole project after an edit, fetch only the
+// rows created, updated or deleted since the last sync and merge them into the
+// project object already in state.
+
+export interface ProjectChanges {
+  token: string;
+  // The whole project (the token predates the server's delete records): replace, don't merge
+  full: boolean;
+  project: any | null;
+  strings: any[];
+  dimensions: any[];
+  dimension_values: any[];
+  string_dimension_values: any[];
+  deleted: {
+    strings: number[];
+    dimensions: number[];
+    dimension_values: number[];
+    string_dimension_values: number[];
+  };
+}
+
+// The newest timestamp in a full project payload. Anything changed after the
+// payload was served is newer than this, so it is a safe first sync token.
+export function latestProjectTimestamp(project: any): string | null {
+  const stamps: string[] = [project?.updated_at];
+  for (const string of project?.strings ?? []) {
+    stamps.push(string.updated_at);
+    for (const assignment of string.dimension_values ?? []) stamps.push(assignment.created_at);
+  }
+  for (const dimension of project?.dimensions ?? []) {
+    stamps.push(dimension.updated_at);
+    for (const value of dimension.values ?? []) stamps.push(value.updated_at);
+  }
+  const times = stamps.filter(Boolean).map((stamp) => new Date(stamp).getTime());
+  return times.length ? new Date(Math.max(...times)).toISOString() : null;
+}
+
+export async function fetchProjectChanges(projectId: string | number, since: string): Promise<ProjectChanges> {
+  return apiFetch(`/api/projects/${projectId}/changes/?since=${encodeURIComponent(since)}`);
+}
+
+function upsertById(items: any[], updates: any[], removedIds: Set<number>): any[] {
+  const byId = new Map<number, any>();
+  for (const item of items) {
+    if (!removedIds.has(item.id)) byId.set(item.id, item);
+  }
+  for (const update of updates) {
+    if (!removedIds.has(update.id)) byId.set(update.id, { ...byId.get(update.id), ...update });
+  }
+  return Array.from(byId.values());
+}
+
+// Apply a changes payload to a full project object and return the new project
+export function mergeProjectChanges(project: any, changes: ProjectChanges): any {
+  if (changes.full) {
+    project = { ...project, strings: [], dimensions: [] };
+  }
+  const deletedStrings = new Set(changes.deleted.strings);
+  const deletedDimensions = new Set(changes.deleted.dimensions);
+  const deletedValues = new Set(changes.deleted.dimension_values);
+  const deletedAssignments = new Set(changes.deleted.string_dimension_values);
+
+  // Dimensions carry their values; changed values are folded into their dimension
+  const dimensions = upsertById(project.dimensions ?? [], changes.dimensions, deletedDimensions).map((dimension) => {
+    const changedValues = changes.dimension_values.filter((value) => value.dimension === dimension.id);
+    return { ...dimension, values: upsertById(dimension.values ?? [], changedValues, deletedValues) };
+  });
+  // Values removed with their dimension take their assignments with them
+  const liveValueIds = new Set(dimensions.flatMap((dimension) => dimension.values.map((value: any) => value.id)));
+
+  const strings = upsertById(project.strings ?? [], changes.strings, deletedStrings).map((string) => {
+    const newAssignments = changes.string_dimension_values.filter((assignment) => assignment.string === string.id);
+    const assignments = upsertById(string.dimension_values ?? [], newAssignments, deletedAssignments)
+      .filter((assignment) => liveValueIds.has(assignment.dimension_value));
+    const controller = deletedStrings.has(string.controlled_by_spawn_id) ? null : string.controlled_by_spawn_id;
+    return { ...string, dimension_values: assignments, controlled_by_spawn_id: controller };
+  });
+
+  return { ...project, ...(changes.project ?? {}), strings, dimensions };
+}
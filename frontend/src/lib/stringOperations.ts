@@ -1,4 +1,5 @@
 import { apiFetch } from "@/lib/api";
+import { fetchProject } from "@/lib/projectPayload";
 import { toast } from "sonner";
 
 export interface StringData {
@@ -174,7 +175,7 @@ async function saveStringVariable({
 
 /**
  * Save a conditional variable with spawns
- * Creates/updates the dimension and dimension values to link spawns to the conditional
+ * Saves the container, spawns and their dimension assignments in one batch request
  */
 async function saveConditionalVariable({
   stringData,
@@ -184,7 +185,6 @@ async function saveConditionalVariable({
   conditionalSpawns,
   includeHiddenOption,
   isNewString,
-  project,
 }: {
   stringData?: StringData | null;
   content: string;
@@ -203,12 +203,14 @@ async function saveConditionalVariable({
     throw new Error(`All spawns must have content. ${emptySpawns.length} spawn(s) are empty.`);
   }
   
-  // 2. Create/update the conditional container
+  // 2. Save the container, its spawns, the conditional's dimension and the
+  // spawn assignments in one transactional batch request. Spawns are assigned
+  // to the dimension named after the container; missing dimension values are
+  // created server-side from each spawn's name.
   const containerPayload: any = {
     content: content.trim(),
     is_conditional: true,
     is_conditional_container: true,
-    project: projectId,
   };
   
   // Only include variable_hash if explicitly provided (for editing)
@@ -216,161 +218,67 @@ async function saveConditionalVariable({
     containerPayload.variable_hash = variableHash.trim();
   }
   
-  let conditionalContainer;
+  // A string "ref" names an item created in this batch; existing strings are referenced by numeric id
+  const containerRef = isNewString ? 'container' : Number(stringData!.id);
+  const spawnAssignment = [{ conditional: containerRef }];
+  const creates: any[] = [];
+  const updates: any[] = [];
   
   if (isNewString) {
-    conditionalContainer = await apiFetch('/api/strings/', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(containerPayload),
-    });
+    creates.push({ ...containerPayload, ref: 'container' });
   } else {
-    conditionalContainer = await apiFetch(`/api/strings/${stringData!.id}/`, {
-      method: 'PATCH',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(containerPayload),
-    });
+    updates.push({ ...containerPayload, id: stringData!.id });
   }
   
-  // 3. Get the effective variable name for the conditional (needed for dimension name)
-  const conditionalName = conditionalContainer.effective_variable_name || conditionalContainer.variable_hash;
-  
-  // 4. Create or find the dimension for this conditional
-  let dimension = project?.dimensions?.find((d: any) => d.name === conditionalName);
-  
-  if (!dimension) {
-    try {
-      // Create a new dimension
-      dimension = await apiFetch('/api/dimensions/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          name: conditionalName,
-          project: projectId,
-        }),
-      });
-    } catch (dimError: any) {
-      // If dimension already exists (unique constraint), fetch it from the server
-      const errorStr = dimError.message || String(dimError);
-      if (errorStr.includes('unique') || errorStr.includes('already exists') || errorStr.includes('must make a unique set')) {
-        console.log(`Dimension "${conditionalName}" already exists, fetching from server...`);
-        // Fetch the project to get the existing dimension
-        const updatedProject = await apiFetch(`/api/projects/${projectId}/`);
-        dimension = updatedProject?.dimensions?.find((d: any) => d.name === conditionalName);
-        if (!dimension) {
-          throw new Error(`Could not find or create dimension "${conditionalName}"`);
-        }
-      } else {
-        throw dimError;
+  const seenSpawnIds = new Set<string | number>();
+  conditionalSpawns.forEach((spawn, index) => {
+    // An existing variable added as a spawn is only assigned, not edited
+    if (spawn._isExisting) {
+      if (!seenSpawnIds.has(spawn.id)) {
+        seenSpawnIds.add(spawn.id);
+        updates.push({ id: spawn.id, dimension_values: spawnAssignment });
       }
+      return;
     }
-  }
-  
-  // 5. Save all spawns sequentially to avoid race conditions with unique slug generation
-  // (Using Promise.all would cause multiple spawns to check for the same slug simultaneously)
-  const savedSpawns: any[] = [];
-  for (const spawn of conditionalSpawns) {
-    try {
-      let savedSpawn;
-      
-      // If this is an existing variable being added as a spawn, just use it
-      if (spawn._isExisting) {
-        console.log(`Using existing variable as spawn: ${spawn.effective_variable_name || spawn.variable_hash}`);
-        savedSpawn = spawn;
-      } else {
-        const spawnPayload: any = {
-          content: spawn.content?.trim() || 'Default spawn content',
-          is_conditional: false,
-          is_conditional_container: false,
-          project: projectId,
-        };
-        
-        // Include variable_hash if spawn has one (for editing existing spawns)
-        if (spawn.variable_hash?.trim()) {
-          spawnPayload.variable_hash = spawn.variable_hash.trim();
-        }
-        
-        const isNewSpawn = spawn._isTemporary || 
-                          String(spawn.id).startsWith('temp-') || 
-                          (typeof spawn.id === 'number' && spawn.id > 1000000000000);
-        
-        if (isNewSpawn) {
-          savedSpawn = await apiFetch('/api/strings/', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(spawnPayload),
-          });
-        } else {
-          savedSpawn = await apiFetch(`/api/strings/${spawn.id}/`, {
-            method: 'PATCH',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(spawnPayload),
-          });
-        }
-      }
-      
-      savedSpawns.push(savedSpawn);
-    } catch (spawnError: any) {
-      const errorStr = spawnError.message || JSON.stringify(spawnError) || String(spawnError);
-      if (errorStr.includes('unique set') || errorStr.includes('must make a unique set')) {
-        console.log(`Spawn with variable name "${spawn.variable_name}" may already exist, continuing...`);
-        savedSpawns.push(spawn);
-      } else {
-        throw spawnError;
-      }
-    }
-  }
-  
-  // 6. Create dimension values and link spawns to them
-  for (const savedSpawn of savedSpawns) {
-    const spawnName = savedSpawn.effective_variable_name || savedSpawn.variable_name || savedSpawn.variable_hash;
     
-    // Check if dimension value already exists
-    let dimensionValue = dimension.values?.find((dv: any) => dv.value === spawnName);
+    const spawnPayload: any = {
+      content: spawn.content?.trim() || 'Default spawn content',
+      is_conditional: false,
+      is_conditional_container: false,
+      dimension_values: spawnAssignment,
+    };
     
-    if (!dimensionValue) {
-      // Create a new dimension value
-      dimensionValue = await apiFetch('/api/dimension-values/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          dimension: dimension.id,
-          value: spawnName,
-        }),
-      });
+    // Include variable_hash if spawn has one (for editing existing spawns)
+    if (spawn.variable_hash?.trim()) {
+      spawnPayload.variable_hash = spawn.variable_hash.trim();
     }
     
-    // Link the spawn to the dimension value via StringDimensionValue
-    // First check if the link already exists
-    const existingLinks = savedSpawn.dimension_values || [];
-    const linkExists = existingLinks.some((dv: any) => 
-      dv.dimension_value === dimensionValue.id || 
-      dv.dimension_value_detail?.id === dimensionValue.id
-    );
+    const isNewSpawn = spawn._isTemporary || 
+                      String(spawn.id).startsWith('temp-') || 
+                      (typeof spawn.id === 'number' && spawn.id > 1000000000000);
     
-    if (!linkExists) {
-      try {
-        await apiFetch('/api/string-dimension-values/', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            string: savedSpawn.id,
-            dimension_value: dimensionValue.id,
-          }),
-        });
-      } catch (linkError: any) {
-        // Ignore duplicate link errors
-        const errorStr = linkError.message || String(linkError);
-        if (!errorStr.includes('unique') && !errorStr.includes('already exists')) {
-          console.error('Failed to create string-dimension-value link:', linkError);
-        }
-      }
+    if (isNewSpawn) {
+      creates.push({ ...spawnPayload, ref: `spawn-${index}` });
+    } else if (!seenSpawnIds.has(spawn.id)) {
+      seenSpawnIds.add(spawn.id);
+      updates.push({ ...spawnPayload, id: spawn.id });
     }
-  }
+  });
+  
+  const batchResult = await apiFetch('/api/strings/batch/', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ project: projectId, create: creates, update: updates }),
+  });
+  
+  const conditionalContainer = isNewString
+    ? batchResult.created.find((item: any) => item.ref === 'container')
+    : batchResult.updated.find((item: any) => item.id === Number(stringData!.id));
+  const conditionalName = conditionalContainer.effective_variable_name || conditionalContainer.variable_hash;
   
   // 7. Handle the "Hidden" option
   // Refetch the dimension to get the latest values (including any just created)
-  const updatedProject = await apiFetch(`/api/projects/${projectId}/`);
+  const updatedProject = await fetchProject(projectId);
   const updatedDimension = updatedProject?.dimensions?.find((d: any) => d.name === conditionalName);
   const hiddenDimensionValue = updatedDimension?.values?.find((dv: any) => dv.value === "Hidden");
   
@@ -382,7 +290,7 @@ async function saveConditionalVariable({
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
-            dimension: updatedDimension?.id || dimension.id,
+            dimension: updatedDimension?.id,
             value: "Hidden",
           }),
         });